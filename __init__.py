@@ -1,6 +1,6 @@
 # handlers/__init__.py
 from .common_handlers import router as common_router
-from .guide_handlers import router as guide_router
+from .guide_hundlers import router as guide_router
 from .traveler_handlers import router as traveler_router
 from .admin_handlers import router as admin_router
 
@@ -1,21 +1,57 @@
 # handlers/admin_handlers.py
+import asyncio
+import html
 import logging
-from aiogram import types, Dispatcher
-from aiogram.dispatcher.filters import Text
-from keyboards import get_admin_keyboard, get_role_keyboard
-from constants import ADMIN_ONLY, ERROR_MESSAGE, ADMIN_IDS
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("logs/bot.log"),
-        logging.StreamHandler()
-    ]
+import os
+import tempfile
+from datetime import datetime
+from math import ceil
+from typing import List, Set
+from aiogram import Bot, Router, types
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from keyboards import get_admin_keyboard
+from constants import (
+    ADMIN_ONLY, ERROR_MESSAGE, ADMIN_IDS, MODERATION_BUTTON, MODERATION_EMPTY,
+    MODERATION_HEADER, MODERATION_ITEM, MODERATION_DONE, STATS_MESSAGE, SNAPSHOT_AGE,
+    SNAPSHOT_REFRESH_BUTTON, GUIDES_LIST_EMPTY, GUIDES_LIST_HEADER, GUIDES_LIST_ITEM, GUIDES_APPROVE_PAGE_BUTTON,
+    GUIDES_APPROVED, EXPORT_USAGE, EXPORT_CAPTION, API_USAGE_HEADER, API_USAGE_EMPTY, API_USAGE_ITEM, API_USAGE_BUDGET,
+    ARCHIVE_USAGE, ARCHIVE_EMPTY, ARCHIVE_CAPTION, DB_STATS_HEADER, DB_STATS_EMPTY, DB_STATS_ITEM
 )
+from database import (
+    get_pending_excursions_page, approve_excursions, reject_excursions,
+    get_stats, get_guides_page, approve_guides, get_snapshot_time, refresh_snapshot, export_table, EXPORT_TABLES,
+    export_archived_rows, get_query_stats
+)
+from utils import notify_new_excursions
+from api_usage import get_daily_budget, get_usage_report
+from ranking import score_excursions
+from dispatch import (
+    ReplyButtons, CallbackButtons, ModerationCallback, ModerationAction, StatsRefreshCallback,
+    GuideListCallback, GuideListAction
+)
+
 logger = logging.getLogger(__name__)
 
+router = Router()
+buttons = ReplyButtons(router)
+callbacks = CallbackButtons(router)
+
+# Количество маршрутов на странице очереди модерации
+MODERATION_PAGE_SIZE = 10
+# Количество гидов на странице списка: страница укладывается в лимит сообщения 4096 символов
+GUIDES_PAGE_SIZE = 20
+# Сколько последних архивных пачек выгружает /archive
+ARCHIVE_EXPORT_BATCHES = 10
+# Сколько самых затратных запросов показывает /db_stats и до скольки символов обрезается их текст
+DB_STATS_LIMIT = 10
+DB_STATS_SQL_LENGTH = 200
+
+# Ссылки на фоновые рассылки, чтобы задачи не были собраны сборщиком мусора
+_background_tasks: Set[asyncio.Task] = set()
+
+@buttons("🔧 Админ-панель")
 async def handle_admin_role(message: types.Message):
     """Обрабатывает выбор роли админа."""
     user_id = message.from_user.id
@@ -26,8 +62,335 @@ async def handle_admin_role(message: types.Message):
         await message.answer("Добро пожаловать в админ-панель! 🔧", reply_markup=get_admin_keyboard())
     except Exception as e:
         await message.answer(ERROR_MESSAGE)
-        logger.error(f"Ошибка в handle_admin_role: {e}")
+        logger.error("Ошибка в handle_admin_role: %s", e)
+
+async def render_moderation_page(state: FSMContext, page: int):
+    """Собирает текст и клавиатуру страницы очереди модерации."""
+    excursions, total = await get_pending_excursions_page(page, MODERATION_PAGE_SIZE)
+    if not excursions and page > 0:
+        page = 0
+        excursions, total = await get_pending_excursions_page(page, MODERATION_PAGE_SIZE)
+    if not excursions:
+        return MODERATION_EMPTY, None
+    data = await state.get_data()
+    selected = set(data.get("moderation_selected", []))
+    await state.update_data(moderation_page=page)
+    lines = [MODERATION_HEADER.format(
+        total=total, page=page + 1, pages=ceil(total / MODERATION_PAGE_SIZE), selected=len(selected)
+    )]
+    rows = []
+    for excursion in excursions:
+        lines.append(MODERATION_ITEM.format(**excursion))
+        mark = "☑️" if excursion["id"] in selected else "⬜"
+        rows.append([
+            InlineKeyboardButton(text=f"{mark} #{excursion['id']}", callback_data=ModerationCallback(action=ModerationAction.SELECT, value=excursion["id"]).pack()),
+            InlineKeyboardButton(text="✅", callback_data=ModerationCallback(action=ModerationAction.APPROVE, value=excursion["id"]).pack()),
+            InlineKeyboardButton(text="❌", callback_data=ModerationCallback(action=ModerationAction.REJECT, value=excursion["id"]).pack()),
+        ])
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=ModerationCallback(action=ModerationAction.PAGE, value=page - 1).pack()))
+    navigation.append(InlineKeyboardButton(text="☑️ Вся страница", callback_data=ModerationCallback(action=ModerationAction.SELECT_PAGE).pack()))
+    if (page + 1) * MODERATION_PAGE_SIZE < total:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=ModerationCallback(action=ModerationAction.PAGE, value=page + 1).pack()))
+    rows.append(navigation)
+    if selected:
+        rows.append([
+            InlineKeyboardButton(text=f"✅ Одобрить выбранные ({len(selected)})", callback_data=ModerationCallback(action=ModerationAction.APPROVE_SELECTED).pack()),
+            InlineKeyboardButton(text="❌ Отклонить выбранные", callback_data=ModerationCallback(action=ModerationAction.REJECT_SELECTED).pack()),
+        ])
+    return "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def apply_moderation(bot: Bot, approve_ids: List[int], reject_ids: List[int]) -> str:
+    """Применяет решения модератора и запускает рассылку о новых маршрутах в фоне."""
+    approved = await approve_excursions(approve_ids)
+    rejected = await reject_excursions(reject_ids)
+    if approved:
+        # Новые маршруты сразу получают оценку, а не ждут фонового пересчёта в конце выдачи
+        await score_excursions(approved)
+        task = asyncio.create_task(notify_new_excursions(bot, approved))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return MODERATION_DONE.format(approved=len(approved), rejected=len(rejected))
+
+@buttons(MODERATION_BUTTON)
+async def handle_moderation_queue(message: types.Message, state: FSMContext):
+    """Показывает первую страницу очереди модерации."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    try:
+        await state.update_data(moderation_selected=[])
+        text, keyboard = await render_moderation_page(state, 0)
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Ошибка в handle_moderation_queue: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@callbacks(ModerationCallback)
+async def process_moderation(callback: types.CallbackQuery, callback_data: ModerationCallback, state: FSMContext, bot: Bot):
+    """Обрабатывает кнопки очереди модерации: выбор, одобрение, отклонение и страницы."""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer(ADMIN_ONLY, show_alert=True)
+        return
+    try:
+        data = await state.get_data()
+        page = data.get("moderation_page", 0)
+        selected = set(data.get("moderation_selected", []))
+        action, value = callback_data.action, callback_data.value
+        notice = None
+        if action == ModerationAction.PAGE:
+            page = value
+        elif action == ModerationAction.SELECT:
+            selected ^= {value}
+        elif action == ModerationAction.SELECT_PAGE:
+            excursions, _ = await get_pending_excursions_page(page, MODERATION_PAGE_SIZE)
+            selected |= {excursion["id"] for excursion in excursions}
+        elif action == ModerationAction.APPROVE:
+            notice = await apply_moderation(bot, [value], [])
+            selected.discard(value)
+        elif action == ModerationAction.REJECT:
+            notice = await apply_moderation(bot, [], [value])
+            selected.discard(value)
+        elif action == ModerationAction.APPROVE_SELECTED:
+            notice = await apply_moderation(bot, sorted(selected), [])
+            selected = set()
+        elif action == ModerationAction.REJECT_SELECTED:
+            notice = await apply_moderation(bot, [], sorted(selected))
+            selected = set()
+        await state.update_data(moderation_selected=sorted(selected))
+        text, keyboard = await render_moderation_page(state, page)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer(notice)
+    except Exception as e:
+        logger.error("Ошибка в process_moderation: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
+def format_snapshot_age() -> str:
+    """Подпись к отчёту: на какое время актуальны данные снимка."""
+    taken_at = get_snapshot_time()
+    if taken_at is None:
+        return ""
+    seconds = int((datetime.now() - taken_at).total_seconds())
+    age = f"{seconds} с" if seconds < 60 else f"{seconds // 60} мин"
+    return SNAPSHOT_AGE.format(taken_at=taken_at, age=age)
+
+async def render_stats() -> str:
+    """Собирает текст статистики из снимка базы."""
+    stats = await get_stats()
+    return STATS_MESSAGE.format(**stats) + format_snapshot_age()
+
+STATS_REFRESH_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text=SNAPSHOT_REFRESH_BUTTON, callback_data=StatsRefreshCallback().pack())]
+])
+
+@buttons("📊 Статистика")
+async def handle_stats(message: types.Message):
+    """Показывает статистику бота по снимку базы."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    try:
+        await message.answer(await render_stats(), reply_markup=STATS_REFRESH_KEYBOARD)
+    except Exception as e:
+        logger.error("Ошибка в handle_stats: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@callbacks(StatsRefreshCallback)
+async def process_stats_refresh(callback: types.CallbackQuery):
+    """Обновляет снимок базы по запросу админа и перерисовывает статистику."""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer(ADMIN_ONLY, show_alert=True)
+        return
+    try:
+        await refresh_snapshot()
+        await callback.message.edit_text(await render_stats(), reply_markup=STATS_REFRESH_KEYBOARD)
+        await callback.answer()
+    except Exception as e:
+        logger.error("Ошибка в process_stats_refresh: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
+async def render_guides_page(page: int):
+    """Собирает текст и клавиатуру страницы списка гидов из снимка базы."""
+    guides, total = await get_guides_page(page, GUIDES_PAGE_SIZE)
+    if not guides and page > 0:
+        page = 0
+        guides, total = await get_guides_page(page, GUIDES_PAGE_SIZE)
+    if not guides:
+        return GUIDES_LIST_EMPTY + format_snapshot_age(), None
+    lines = [GUIDES_LIST_HEADER.format(total=total, page=page + 1, pages=ceil(total / GUIDES_PAGE_SIZE))]
+    rows = []
+    for guide in guides:
+        lines.append(GUIDES_LIST_ITEM.format(status="✅" if guide["is_approved"] else "⏳", **guide))
+        if not guide["is_approved"]:
+            rows.append([InlineKeyboardButton(
+                text=f"✅ {guide['first_name']} {guide['last_name']}",
+                callback_data=GuideListCallback(action=GuideListAction.APPROVE, value=guide["user_id"]).pack()
+            )])
+    if len(rows) > 1:
+        rows.append([InlineKeyboardButton(
+            text=GUIDES_APPROVE_PAGE_BUTTON,
+            callback_data=GuideListCallback(action=GuideListAction.APPROVE_PAGE, value=page).pack()
+        )])
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=GuideListCallback(action=GuideListAction.PAGE, value=page - 1).pack()))
+    if (page + 1) * GUIDES_PAGE_SIZE < total:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=GuideListCallback(action=GuideListAction.PAGE, value=page + 1).pack()))
+    if navigation:
+        rows.append(navigation)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+    return "\n".join(lines) + format_snapshot_age(), keyboard
+
+@buttons("📋 Список гидов")
+async def handle_guides_list(message: types.Message):
+    """Показывает первую страницу списка гидов по снимку базы."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    try:
+        text, keyboard = await render_guides_page(0)
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Ошибка в handle_guides_list: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@callbacks(GuideListCallback)
+async def process_guides_list(callback: types.CallbackQuery, callback_data: GuideListCallback):
+    """Обрабатывает кнопки списка гидов: страницы и одобрение гидов."""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer(ADMIN_ONLY, show_alert=True)
+        return
+    try:
+        action, value = callback_data.action, callback_data.value
+        page, notice = value, None
+        if action == GuideListAction.APPROVE:
+            approved = await approve_guides([value])
+            notice = GUIDES_APPROVED.format(count=len(approved))
+            page = 0
+        elif action == GuideListAction.APPROVE_PAGE:
+            guides, _ = await get_guides_page(page, GUIDES_PAGE_SIZE)
+            approved = await approve_guides([guide["user_id"] for guide in guides if not guide["is_approved"]])
+            notice = GUIDES_APPROVED.format(count=len(approved))
+        if notice is not None:
+            # Список читается из снимка, поэтому обновляем его, чтобы одобренные гиды сразу отображались
+            await refresh_snapshot()
+        text, keyboard = await render_guides_page(page)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer(notice)
+    except Exception as e:
+        logger.error("Ошибка в process_guides_list: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
+@router.message(Command("export"))
+async def handle_export(message: types.Message, command: CommandObject):
+    """Выгружает таблицу из снимка базы в CSV: /export таблица."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    table = (command.args or "").strip().lower()
+    if table not in EXPORT_TABLES:
+        await message.answer(EXPORT_USAGE.format(tables=", ".join(EXPORT_TABLES)))
+        return
+    path = None
+    try:
+        # Файл пишется построчно в отдельном потоке, поэтому большая таблица не занимает память целиком
+        with tempfile.NamedTemporaryFile(prefix=f"{table}-", suffix=".csv", delete=False) as file:
+            path = file.name
+        count = await export_table(table, path)
+        await message.answer_document(
+            FSInputFile(path, filename=f"{table}-{datetime.now():%Y%m%d-%H%M}.csv"),
+            caption=EXPORT_CAPTION.format(table=table, count=count) + format_snapshot_age()
+        )
+    except Exception as e:
+        logger.error("Ошибка в handle_export: %s", e)
+        await message.answer(ERROR_MESSAGE)
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+@router.message(Command("archive"))
+async def handle_archive(message: types.Message, command: CommandObject):
+    """Выгружает последние архивные пачки таблицы в CSV: /archive таблица."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    # Модуль фоновой архивации не нужен при запуске, только для списка таблиц
+    from retention import get_policies
+    tables = [policy.table for policy in get_policies()]
+    table = (command.args or "").strip().lower()
+    if table not in tables:
+        await message.answer(ARCHIVE_USAGE.format(tables=", ".join(tables)))
+        return
+    path = None
+    try:
+        with tempfile.NamedTemporaryFile(prefix=f"{table}-archive-", suffix=".csv", delete=False) as file:
+            path = file.name
+        count = await export_archived_rows(table, path, ARCHIVE_EXPORT_BATCHES)
+        if not count:
+            await message.answer(ARCHIVE_EMPTY.format(table=table))
+            return
+        await message.answer_document(
+            FSInputFile(path, filename=f"{table}-archive-{datetime.now():%Y%m%d-%H%M}.csv"),
+            caption=ARCHIVE_CAPTION.format(table=table, count=count, batches=ARCHIVE_EXPORT_BATCHES)
+        )
+    except Exception as e:
+        logger.error("Ошибка в handle_archive: %s", e)
+        await message.answer(ERROR_MESSAGE)
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def render_db_stats() -> str:
+    """Собирает отчёт о запросах к базе, отнявших больше всего времени с запуска бота."""
+    stats = sorted(get_query_stats().items(), key=lambda item: item[1]["total_ms"], reverse=True)[:DB_STATS_LIMIT]
+    if not stats:
+        return DB_STATS_EMPTY
+    lines = [DB_STATS_HEADER]
+    for sql, row in stats:
+        # Текст запроса показывается в HTML-разметке, поэтому экранируется
+        sql = html.escape(" ".join(sql.split())[:DB_STATS_SQL_LENGTH])
+        lines.append(DB_STATS_ITEM.format(sql=sql, avg_ms=row["total_ms"] / row["count"], **row))
+    return "\n".join(lines)
+
+@router.message(Command("db_stats"))
+async def handle_db_stats(message: types.Message):
+    """Показывает самые затратные запросы к базе: /db_stats."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    try:
+        await message.answer(render_db_stats())
+    except Exception as e:
+        logger.error("Ошибка в handle_db_stats: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+async def render_api_usage(days: int) -> str:
+    """Собирает отчёт о расходе внешних API за последние days суток."""
+    period = "за сегодня" if days == 1 else f"за {days} дн."
+    report = await get_usage_report(days)
+    if not report:
+        return API_USAGE_EMPTY.format(period=period)
+    lines = [API_USAGE_HEADER.format(period=period)]
+    for row in report:
+        # Дневной бюджет имеет смысл сравнивать только с расходом за сегодня
+        budget = get_daily_budget(row["endpoint"]) if days == 1 else 0
+        lines.append(API_USAGE_ITEM.format(budget=API_USAGE_BUDGET.format(budget=budget) if budget else "", **row))
+    return "\n".join(lines)
+
+@router.message(Command("api_usage"))
+async def handle_api_usage(message: types.Message, command: CommandObject):
+    """Показывает расход платных API: /api_usage [число дней]."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer(ADMIN_ONLY)
+        return
+    try:
+        days = int(command.args) if command.args and command.args.strip().isdigit() else 1
+        await message.answer(await render_api_usage(max(days, 1)))
+    except Exception as e:
+        logger.error("Ошибка в handle_api_usage: %s", e)
+        await message.answer(ERROR_MESSAGE)
 
-def register_admin_handlers(dp: Dispatcher):
+def register_admin_handlers() -> Router:
     """Регистрирует обработчики для админа."""
-    dp.register_message_handler(handle_admin_role, Text("🔧 Админ-панель"))
+    return router
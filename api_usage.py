@@ -0,0 +1,160 @@
+# api_usage.py
+"""Учёт расхода платных API Яндекса и дневные бюджеты.
+
+Счётчики копятся в памяти по часовым корзинам и периодически прибавляются
+к таблице api_usage. Дневной бюджет эндпоинта проверяется до запроса: когда
+остаётся меньше API_BUDGET_RESERVE бюджета, запросы отправляются только если
+заменить ответ нечем, а после исчерпания бюджета — не отправляются вовсе.
+"""
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import get_config
+from database import add_api_usage, get_api_usage
+
+logger = logging.getLogger(__name__)
+
+BUCKET_FORMAT = "%Y-%m-%dT%H:00"
+
+@dataclass
+class UsageCounters:
+    calls: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    fallbacks: int = 0
+    throttled: int = 0
+    latency_ms: float = 0.0
+    cost: float = 0.0
+
+# Ещё не сохранённые счётчики: (эндпоинт, часовая корзина) -> счётчики
+_pending: Dict[Tuple[str, str], UsageCounters] = {}
+# Запросы за текущие сутки по эндпоинтам, включая уже сохранённые в базе
+_daily_calls: Dict[str, int] = {}
+_daily_date: Optional[str] = None
+
+def _counters(endpoint: str) -> UsageCounters:
+    key = (endpoint, datetime.now().strftime(BUCKET_FORMAT))
+    counters = _pending.get(key)
+    if counters is None:
+        counters = _pending[key] = UsageCounters()
+    return counters
+
+def _today_calls() -> Dict[str, int]:
+    """Возвращает счётчики запросов за сутки, обнуляя их после полуночи."""
+    global _daily_date
+    today = datetime.now().date().isoformat()
+    if _daily_date != today:
+        _daily_date = today
+        _daily_calls.clear()
+    return _daily_calls
+
+def get_daily_budget(endpoint: str) -> int:
+    """Дневной бюджет запросов эндпоинта; 0 — без ограничения."""
+    return get_config().api_daily_budgets.get(endpoint, 0)
+
+def allow_call(endpoint: str, has_substitute: bool) -> bool:
+    """Решает, можно ли потратить запрос к эндпоинту, и сразу резервирует его в бюджете.
+
+    Резерв ставится до первого await, поэтому одновременные вызовы не могут
+    вместе превысить бюджет. Если запрос в итоге не отправлен, резерв
+    возвращается через release_call.
+
+    has_substitute — есть ли у вызывающего приемлемая замена ответа (кэш или
+    оценка без API); такие запросы отсекаются раньше, чтобы сберечь остаток
+    бюджета для запросов, которым заменить ответ нечем.
+    """
+    daily = _today_calls()
+    used = daily.get(endpoint, 0)
+    budget = get_daily_budget(endpoint)
+    if budget > 0:
+        limit = budget * (1 - get_config().api_budget_reserve) if has_substitute else budget
+        if used >= limit:
+            _counters(endpoint).throttled += 1
+            return False
+    daily[endpoint] = used + 1
+    return True
+
+def release_call(endpoint: str) -> None:
+    """Возвращает в бюджет запрос, зарезервированный allow_call, но так и не отправленный."""
+    daily = _today_calls()
+    if daily.get(endpoint, 0) > 0:
+        daily[endpoint] -= 1
+
+def record_call(endpoint: str, latency_ms: float, ok: bool) -> None:
+    """Учитывает отправленный запрос: он стоит денег даже при ошибке (бюджет списан в allow_call)."""
+    counters = _counters(endpoint)
+    counters.calls += 1
+    counters.errors += 0 if ok else 1
+    counters.latency_ms += latency_ms
+    counters.cost += get_config().api_call_costs.get(endpoint, 0.0)
+
+def record_cache_hit(endpoint: str) -> None:
+    """Учитывает ответ из свежего кэша без запроса к API."""
+    _counters(endpoint).cache_hits += 1
+
+def record_fallback(endpoint: str) -> None:
+    """Учитывает ответ-замену: устаревший кэш, оценку или заглушку."""
+    _counters(endpoint).fallbacks += 1
+
+async def load_daily_usage() -> None:
+    """Восстанавливает расход за текущие сутки из базы после перезапуска."""
+    daily = _today_calls()
+    for row in await get_api_usage(datetime.now().strftime("%Y-%m-%dT00:00")):
+        daily[row["endpoint"]] = daily.get(row["endpoint"], 0) + (row["calls"] or 0)
+
+async def flush_usage() -> None:
+    """Прибавляет накопленные счётчики к таблице api_usage."""
+    if not _pending:
+        return
+    batch = dict(_pending)
+    _pending.clear()
+    rows = [
+        {"endpoint": endpoint, "bucket": bucket, **asdict(counters)}
+        for (endpoint, bucket), counters in batch.items()
+    ]
+    try:
+        await add_api_usage(rows)
+    except Exception:
+        # Возвращаем счётчики, чтобы сохранить их при следующей попытке
+        for key, counters in batch.items():
+            merged = _pending.setdefault(key, UsageCounters())
+            for name, value in asdict(counters).items():
+                setattr(merged, name, getattr(merged, name) + value)
+        raise
+
+async def get_usage_report(days: int = 1) -> List[Dict[str, float]]:
+    """Возвращает расход по эндпоинтам за последние days суток (сегодня — days=1)."""
+    await flush_usage()
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%dT00:00")
+    report = []
+    for row in await get_api_usage(since):
+        calls = row["calls"] or 0
+        answers = calls + (row["cache_hits"] or 0) + (row["fallbacks"] or 0)
+        report.append({
+            "endpoint": row["endpoint"],
+            "calls": calls,
+            "errors": row["errors"] or 0,
+            "error_rate": (row["errors"] or 0) / calls * 100 if calls else 0.0,
+            "cache_hit_rate": (row["cache_hits"] or 0) / answers * 100 if answers else 0.0,
+            "fallbacks": row["fallbacks"] or 0,
+            "throttled": row["throttled"] or 0,
+            "avg_latency_ms": (row["latency_ms"] or 0) / calls if calls else 0.0,
+            "cost": row["cost"] or 0.0,
+        })
+    return report
+
+async def usage_loop() -> None:
+    """Периодически сохраняет счётчики расхода API; задача создаётся при старте бота."""
+    try:
+        await load_daily_usage()
+    except Exception as e:
+        logger.error("Ошибка загрузки расхода API за сутки: %s", e)
+    interval = get_config().api_usage_flush_seconds
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_usage()
+        except Exception as e:
+            logger.error("Ошибка сохранения расхода API: %s", e)
@@ -0,0 +1,282 @@
+# backup.py
+"""Резервные копии базы без остановки бота.
+
+Копия снимается через online backup API SQLite в отдельном потоке, по
+BACKUP_STEP_PAGES страниц за шаг с паузой между шагами, поэтому цикл событий
+не блокируется, а очередь записи успевает фиксировать пачки. Если запись
+в базу перезапускает копирование чаще BACKUP_MAX_RESTARTS раз (часы пик),
+копия снимается одним шагом: в режиме WAL он держит только транзакцию чтения
+и не мешает бронированиям. Готовая копия сжимается gzip, рядом кладётся
+контрольная сумма SHA-256, старые копии сверх BACKUP_KEEP удаляются; копии,
+снятые перед восстановлением, ротируются отдельно (BACKUP_PRE_RESTORE_KEEP).
+
+Запуск вручную:
+    python backup.py create
+    python backup.py list
+    python backup.py verify backups/bot_database-20240101-120000-000000.db.gz
+    python backup.py restore backups/bot_database-20240101-120000-000000.db.gz
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+BACKUP_SUFFIX = ".db.gz"
+CHECKSUM_SUFFIX = ".sha256"
+PRE_RESTORE_LABEL = "-pre-restore"
+# Размер блока при сжатии и подсчёте контрольной суммы
+CHUNK_SIZE = 1024 * 1024
+
+class BackupError(Exception):
+    """Копия повреждена или не прошла проверку."""
+
+class _BackupRestarted(Exception):
+    """Запись в базу слишком часто перезапускала пошаговое копирование."""
+
+@dataclass(frozen=True)
+class BackupInfo:
+    path: str
+    size: int
+    sha256: str
+    taken_at: datetime
+    restarts: int = 0
+
+_backup_lock: Optional[asyncio.Lock] = None
+
+def _backup_prefix(db_name: str) -> str:
+    """Префикс имён копий: имя файла базы без расширения."""
+    return os.path.splitext(os.path.basename(db_name))[0] + "-"
+
+def _copy_database(source_name: str, target_name: str) -> int:
+    """Копирует базу пошагово через backup API и возвращает число перезапусков копирования."""
+    config = get_config()
+    pause = config.backup_step_pause_ms / 1000
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        # После записи в базу другим соединением SQLite начинает копирование заново
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > config.backup_max_restarts:
+                raise _BackupRestarted()
+        state["remaining"] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = sqlite3.connect(source_name)
+    target = sqlite3.connect(target_name)
+    try:
+        try:
+            source.backup(target, pages=config.backup_step_pages, progress=progress)
+        except _BackupRestarted:
+            logger.warning(
+                "Пошаговое копирование перезапущено %s раз, копируем базу одним шагом", state["restarts"]
+            )
+            source.backup(target)
+        # Копия должна быть самодостаточной: без файлов -wal и -shm
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    return state["restarts"]
+
+def file_sha256(path: str) -> str:
+    """Считает SHA-256 файла блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_checksum(path: str, checksum: str) -> None:
+    """Сохраняет контрольную сумму в формате sha256sum, чтобы её можно было проверить и без бота."""
+    with open(path + CHECKSUM_SUFFIX, "w", encoding="utf-8") as file:
+        file.write(f"{checksum}  {os.path.basename(path)}\n")
+
+def _read_checksum(path: str) -> str:
+    try:
+        with open(path + CHECKSUM_SUFFIX, encoding="utf-8") as file:
+            return file.read().split()[0]
+    except (OSError, IndexError) as e:
+        raise BackupError(f"Нет контрольной суммы для {path}") from e
+
+def create_backup_sync(db_name: Optional[str] = None, backup_dir: Optional[str] = None, label: str = "") -> BackupInfo:
+    """Снимает сжатую копию базы с контрольной суммой и удаляет устаревшие копии."""
+    config = get_config()
+    db_name = db_name or config.db_name
+    backup_dir = backup_dir or config.backup_dir
+    os.makedirs(backup_dir, exist_ok=True)
+    taken_at = datetime.now()
+    # Микросекунды в имени не дают двум копиям одной секунды перезаписать друг друга,
+    # а счётчик — копиям с совпавшим временем; "_" старше "." и "-", порядок имён не ломается
+    base = f"{_backup_prefix(db_name)}{taken_at:%Y%m%d-%H%M%S-%f}"
+    name, attempt = base + label, 0
+    while os.path.exists(os.path.join(backup_dir, name + BACKUP_SUFFIX)):
+        attempt += 1
+        name = f"{base}_{attempt:02d}{label}"
+    path = os.path.join(backup_dir, name + BACKUP_SUFFIX)
+    temp_db = os.path.join(backup_dir, name + ".tmp")
+    temp_gz = path + ".tmp"
+    try:
+        restarts = _copy_database(db_name, temp_db)
+        with open(temp_db, "rb") as source, gzip.open(temp_gz, "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        checksum = file_sha256(temp_gz)
+        # Копия появляется под своим именем только целиком, вместе с контрольной суммой
+        _write_checksum(path, checksum)
+        os.replace(temp_gz, path)
+    finally:
+        for leftover in (temp_db, temp_gz):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    rotate_backups(backup_dir, config.backup_keep, db_name, config.backup_pre_restore_keep)
+    return BackupInfo(path, os.path.getsize(path), checksum, taken_at, restarts)
+
+def list_backups(backup_dir: Optional[str] = None, db_name: Optional[str] = None) -> List[str]:
+    """Возвращает пути копий базы, начиная с самой новой."""
+    config = get_config()
+    backup_dir = backup_dir or config.backup_dir
+    prefix = _backup_prefix(db_name or config.db_name)
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [name for name in os.listdir(backup_dir) if name.startswith(prefix) and name.endswith(BACKUP_SUFFIX)]
+    # Время съёмки входит в имя, поэтому сортировка по имени совпадает с сортировкой по времени
+    return [os.path.join(backup_dir, name) for name in sorted(names, reverse=True)]
+
+def rotate_backups(backup_dir: str, keep: int, db_name: Optional[str] = None, pre_restore_keep: Optional[int] = None) -> List[str]:
+    """Удаляет копии сверх keep самых новых, а копии перед восстановлением — сверх pre_restore_keep.
+
+    Без pre_restore_keep копии перед восстановлением не трогаются.
+    """
+    backups = list_backups(backup_dir, db_name)
+    regular = [path for path in backups if not path.endswith(PRE_RESTORE_LABEL + BACKUP_SUFFIX)]
+    expired = regular[max(keep, 1):]
+    if pre_restore_keep is not None:
+        pre_restore = [path for path in backups if path.endswith(PRE_RESTORE_LABEL + BACKUP_SUFFIX)]
+        expired += pre_restore[max(pre_restore_keep, 1):]
+    for path in expired:
+        for name in (path, path + CHECKSUM_SUFFIX):
+            if os.path.exists(name):
+                os.remove(name)
+    return expired
+
+def _unpack_verified(path: str) -> str:
+    """Проверяет контрольную сумму и целостность копии и возвращает путь к распакованной базе."""
+    if file_sha256(path) != _read_checksum(path):
+        raise BackupError(f"Контрольная сумма {path} не совпадает")
+    unpacked = path[: -len(BACKUP_SUFFIX)] + ".verify.db"
+    try:
+        with gzip.open(path, "rb") as source, open(unpacked, "wb") as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        db = sqlite3.connect(unpacked)
+        try:
+            result = db.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            db.close()
+    except (OSError, EOFError, sqlite3.DatabaseError) as e:
+        os.remove(unpacked)
+        raise BackupError(f"Копия {path} не читается: {e}") from e
+    if result != "ok":
+        os.remove(unpacked)
+        raise BackupError(f"Копия {path} повреждена: {result}")
+    return unpacked
+
+def verify_backup(path: str) -> None:
+    """Проверяет копию: контрольная сумма, распаковка и PRAGMA integrity_check."""
+    os.remove(_unpack_verified(path))
+
+def restore_backup(path: str, db_name: Optional[str] = None) -> Optional[BackupInfo]:
+    """Восстанавливает базу из проверенной копии, предварительно сохранив текущую базу.
+
+    Бот должен быть остановлен. Данные переносятся через backup API в
+    существующий файл, поэтому его журнал WAL остаётся согласованным.
+    """
+    db_name = db_name or get_config().db_name
+    unpacked = _unpack_verified(path)
+    try:
+        safety_copy = None
+        if os.path.exists(db_name):
+            safety_copy = create_backup_sync(db_name, os.path.dirname(path) or ".", PRE_RESTORE_LABEL)
+        source = sqlite3.connect(unpacked)
+        target = sqlite3.connect(db_name)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        os.remove(unpacked)
+    return safety_copy
+
+async def create_backup() -> BackupInfo:
+    """Снимает копию базы в отдельном потоке; одновременно снимается не больше одной копии."""
+    global _backup_lock
+    if _backup_lock is None:
+        _backup_lock = asyncio.Lock()
+    async with _backup_lock:
+        started = time.perf_counter()
+        info = await asyncio.to_thread(create_backup_sync)
+        logger.info(
+            "Резервная копия %s (%.0f КБ) снята за %.1f с, перезапусков копирования: %s",
+            info.path, info.size / 1024, time.perf_counter() - started, info.restarts
+        )
+        return info
+
+async def backup_loop() -> None:
+    """Периодически снимает резервную копию базы; задача создаётся при старте бота."""
+    interval = get_config().backup_interval_minutes * 60
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await create_backup()
+        except Exception as e:
+            logger.error("Ошибка резервного копирования базы: %s", e)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Резервные копии базы бота")
+    parser.add_argument("--db", help="файл базы (по умолчанию DB_NAME)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="снять копию")
+    commands.add_parser("list", help="показать копии")
+    verify = commands.add_parser("verify", help="проверить копию")
+    verify.add_argument("path")
+    restore = commands.add_parser("restore", help="восстановить базу из копии (бот должен быть остановлен)")
+    restore.add_argument("path")
+    args = parser.parse_args()
+    try:
+        if args.command == "create":
+            info = create_backup_sync(args.db)
+            print(f"{info.path}  {info.size} байт  sha256 {info.sha256}")
+        elif args.command == "list":
+            for path in list_backups(db_name=args.db):
+                print(f"{path}  {os.path.getsize(path)} байт")
+        elif args.command == "verify":
+            verify_backup(args.path)
+            print(f"{args.path}: копия исправна")
+        elif args.command == "restore":
+            safety_copy = restore_backup(args.path, args.db)
+            if safety_copy:
+                print(f"Прежняя база сохранена в {safety_copy.path}")
+            print(f"База восстановлена из {args.path}")
+    except BackupError as e:
+        print(e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# cards.py
+from typing import Any, Callable, Dict, Set, Tuple
+
+# Кэш карточек: (вид, ID маршрута) -> (ID гида, текст); при переполнении вытесняется
+# карточка, которую дольше всех не запрашивали
+CARD_CACHE_SIZE = 5000
+_cards: Dict[Tuple[str, int], Tuple[int, str]] = {}
+# Ключи закэшированных карточек по гиду: изменение гида сбрасывает все его карточки.
+# Хранятся только гиды, чьи карточки есть в кэше, поэтому словарь ограничен вместе с ним
+_guide_cards: Dict[int, Set[Tuple[str, int]]] = {}
+
+def _evict(key: Tuple[str, int]) -> None:
+    """Удаляет карточку из кэша и из списка карточек её гида."""
+    cached = _cards.pop(key, None)
+    if cached is None:
+        return
+    keys = _guide_cards.get(cached[0])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _guide_cards[cached[0]]
+
+def invalidate_excursion(excursion_id: int) -> None:
+    """Отмечает, что данные маршрута изменились."""
+    for kind in _RENDERERS:
+        _evict((kind, excursion_id))
+
+def invalidate_guide(guide_id: int) -> None:
+    """Отмечает, что данные или рейтинг гида изменились (влияет на все его маршруты)."""
+    for key in list(_guide_cards.get(guide_id, ())):
+        _evict(key)
+
+def _render_listing(excursion: Dict[str, Any]) -> str:
+    """Полная карточка маршрута для выдачи поиска."""
+    return (
+        f"Маршрут: {excursion['title']}\n"
+        f"Гид: {excursion['guide_first_name']} {excursion['guide_last_name']}\n"
+        f"Город: {excursion['city']}\n"
+        f"Тематика: {excursion['theme']}\n"
+        f"Описание: {excursion['description']}\n"
+        f"Стоимость: {excursion['price']} руб./чел.\n"
+        f"Даты: {excursion['dates'].replace(',', ', ')}\n"
+        f"Рейтинг маршрута: {excursion['rating'] or 0:.1f} ({excursion['review_count'] or 0} отзывов)\n"
+        f"Рейтинг гида: {excursion['guide_rating'] or 0:.1f} ({excursion['guide_review_count'] or 0} отзывов)"
+    )
+
+def _render_announcement(excursion: Dict[str, Any]) -> str:
+    """Карточка для уведомления подписчиков о новом маршруте."""
+    return (
+        f"Новый маршрут: {excursion['title']}\n"
+        f"Город: {excursion['city']}\n"
+        f"Тематика: {excursion['theme']}\n"
+        f"Чтобы забронировать, напиши: /book_{excursion['id']}"
+    )
+
+def _render_booking(excursion: Dict[str, Any]) -> str:
+    """Общая часть карточки бронирования: маршрут, гид и город."""
+    return (
+        f"Маршрут: {excursion['title']}\n"
+        f"Гид: {excursion['guide_first_name']} {excursion['guide_last_name']}\n"
+        f"Город: {excursion['city']}"
+    )
+
+_RENDERERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "listing": _render_listing,
+    "announcement": _render_announcement,
+    "booking": _render_booking,
+}
+
+def render_card(excursion: Dict[str, Any], kind: str = "listing") -> str:
+    """Возвращает текст карточки маршрута из кэша, отрисовывая его только после изменений.
+
+    Строка маршрута должна содержать поля гида (guide_first_name, guide_rating
+    и т.д.), как в выборках search_excursions.
+    """
+    key = (kind, excursion["id"])
+    guide_id = excursion["guide_id"]
+    cached = _cards.get(key)
+    if cached is not None and cached[0] == guide_id:
+        # Извлекаем и кладём обратно, чтобы запись переехала в конец порядка вытеснения
+        _cards[key] = _cards.pop(key)
+        return cached[1]
+    _evict(key)
+    text = _RENDERERS[kind](excursion)
+    if len(_cards) >= CARD_CACHE_SIZE:
+        _evict(next(iter(_cards)))
+    _cards[key] = (guide_id, text)
+    _guide_cards.setdefault(guide_id, set()).add(key)
+    return text
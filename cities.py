@@ -0,0 +1,80 @@
+# cities.py
+"""Справочник городов: нормализация названий и поиск ID города в памяти.
+
+Название приводится к нижнему регистру, «ё» заменяется на «е», дефисы и
+лишние пробелы схлопываются, префикс «г.» отбрасывается; результат ищется в
+таблице псевдонимов. Таблицы cities и city_aliases хранятся в базе (см.
+database.init_db и database.resolve_city), а здесь держится их копия, поэтому
+перевод названия в ID не обращается к базе.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+@dataclass(frozen=True)
+class City:
+    id: int
+    name: str
+    # Центр города; для городов, добавленных пользователями, берётся из первой точки встречи
+    lat: Optional[float]
+    lon: Optional[float]
+
+# Встроенный справочник: каноническое название, центр города и псевдонимы
+KNOWN_CITIES: Tuple[Tuple[str, float, float, Tuple[str, ...]], ...] = (
+    ("Москва", 55.7558, 37.6173, ("Moscow", "Moskva", "мск")),
+    ("Санкт-Петербург", 59.9386, 30.3141, ("Петербург", "Питер", "СПб", "Saint Petersburg", "St Petersburg", "St. Petersburg")),
+    ("Казань", 55.7961, 49.1064, ("Kazan",)),
+    ("Нижний Новгород", 56.3269, 44.0059, ("Нижний", "Nizhny Novgorod", "Н. Новгород")),
+    ("Екатеринбург", 56.8389, 60.6057, ("Ekaterinburg", "Yekaterinburg", "Екб")),
+    ("Новосибирск", 55.0084, 82.9357, ("Novosibirsk",)),
+    ("Сочи", 43.5855, 39.7231, ("Sochi",)),
+    ("Калининград", 54.7104, 20.4522, ("Kaliningrad",)),
+    ("Ярославль", 57.6261, 39.8845, ("Yaroslavl",)),
+    ("Владимир", 56.1291, 40.4066, ("Vladimir",)),
+    ("Суздаль", 56.4197, 40.4497, ("Suzdal",)),
+    ("Кострома", 57.7679, 40.9269, ("Kostroma",)),
+    ("Псков", 57.8194, 28.3318, ("Pskov",)),
+    ("Великий Новгород", 58.5213, 31.2710, ("Veliky Novgorod",)),
+    ("Тула", 54.1931, 37.6173, ("Tula",)),
+    ("Самара", 53.1959, 50.1002, ("Samara",)),
+    ("Ростов-на-Дону", 47.2357, 39.7015, ("Rostov-on-Don",)),
+    ("Мурманск", 68.9585, 33.0827, ("Murmansk",)),
+    ("Иркутск", 52.2870, 104.3050, ("Irkutsk",)),
+    ("Владивосток", 43.1155, 131.8855, ("Vladivostok",)),
+)
+
+_PREFIX = re.compile(r"^(г\.|г |город )")
+
+_cities: Dict[int, City] = {}
+_aliases: Dict[str, int] = {}
+
+def normalize_city_name(name: str) -> str:
+    """Приводит название города к ключу таблицы псевдонимов."""
+    key = " ".join(str(name).lower().replace("ё", "е").replace("-", " ").split())
+    return _PREFIX.sub("", key).strip()
+
+def display_city_name(name: str) -> str:
+    """Название нового города для показа: без лишних пробелов и с заглавной буквы."""
+    name = " ".join(str(name).split())
+    return name[:1].upper() + name[1:]
+
+def register_city(city: City, aliases: Iterable[str] = ()) -> None:
+    """Добавляет город и его псевдонимы (уже нормализованные) в справочник в памяти."""
+    _cities[city.id] = city
+    for alias in aliases:
+        _aliases[alias] = city.id
+
+def get_city_id(name: Optional[str]) -> Optional[int]:
+    """Возвращает ID города по названию или псевдониму; None, если город неизвестен."""
+    if not name:
+        return None
+    return _aliases.get(normalize_city_name(name))
+
+def get_city(city_id: Optional[int]) -> Optional[City]:
+    """Возвращает город по ID."""
+    return _cities.get(city_id) if city_id is not None else None
+
+def clear_cities() -> None:
+    """Очищает справочник в памяти перед повторной загрузкой из базы."""
+    _cities.clear()
+    _aliases.clear()
@@ -5,10 +5,17 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from keyboards import get_main_keyboard  # Импорт клавиатуры
 from utils import get_time_greeting  # Импорт утилиты
-from constants import WELCOME_MESSAGE, HELP_MESSAGE, CONTACT_ADMIN_MESSAGE, ERROR_MESSAGE
-from database import get_admin_ids, add_notification  # Импорт функций БД
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from constants import (
+    WELCOME_MESSAGE, HELP_MESSAGE, CONTACT_ADMIN_MESSAGE, ERROR_MESSAGE,
+    NOTIFICATION_KIND_CONTACT, DIGEST_MODES, DIGEST_PROMPT, DIGEST_SAVED
+)
+from database import get_admin_ids, add_notification, get_notification_mode, set_notification_mode  # Импорт функций БД
+from dispatch import ReplyButtons, CallbackButtons, DigestCallback
 
 router = Router()
+buttons = ReplyButtons(router)
+callbacks = CallbackButtons(router)
 logger = logging.getLogger(__name__)
 
 # Определение состояния для обратной связи
@@ -26,10 +33,10 @@ async def cmd_start(message: types.Message, state: FSMContext):
             reply_markup=get_main_keyboard(message.from_user.id)
         )
     except Exception as e:
-        logger.error(f"Ошибка в cmd_start для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в cmd_start для user_id=%s: %s", message.from_user.id, e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "⬅️ Назад")
+@buttons("⬅️ Назад")
 async def handle_back(message: types.Message, state: FSMContext):
     """Обрабатывает кнопку 'Назад'."""
     try:
@@ -39,26 +46,26 @@ async def handle_back(message: types.Message, state: FSMContext):
             reply_markup=get_main_keyboard(message.from_user.id)
         )
     except Exception as e:
-        logger.error(f"Ошибка в handle_back для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в handle_back для user_id=%s: %s", message.from_user.id, e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "📚 Помощь")
+@buttons("📚 Помощь")
 async def handle_help(message: types.Message):
     """Обрабатывает кнопку 'Помощь'."""
     try:
         await message.answer(HELP_MESSAGE, reply_markup=get_main_keyboard(message.from_user.id))
     except Exception as e:
-        logger.error(f"Ошибка в handle_help для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в handle_help для user_id=%s: %s", message.from_user.id, e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "📞 Связаться с администратором")
+@buttons("📞 Связаться с администратором")
 async def handle_contact_admin(message: types.Message, state: FSMContext):
     """Обрабатывает кнопку 'Связаться с администратором'."""
     try:
         await message.answer(CONTACT_ADMIN_MESSAGE)
         await state.set_state(ContactAdmin.contact_admin)
     except Exception as e:
-        logger.error(f"Ошибка в handle_contact_admin для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в handle_contact_admin для user_id=%s: %s", message.from_user.id, e)
         await message.answer(ERROR_MESSAGE)
 
 @router.message(ContactAdmin.contact_admin)
@@ -75,15 +82,42 @@ async def process_contact_admin(message: types.Message, state: FSMContext, bot:
             f"Текст: {text}"
         )
         for admin_id in get_admin_ids():
-            await add_notification(admin_id, admin_message)
+            await add_notification(admin_id, admin_message, NOTIFICATION_KIND_CONTACT)
         await message.answer(
             "Сообщение отправлено администратору. Мы свяжемся с тобой скоро!",
             reply_markup=get_main_keyboard(user_id)
         )
         await state.clear()
     except ValueError as e:
-        logger.error(f"Ошибка значения в process_contact_admin для user_id={user_id}: {e}")
+        logger.error("Ошибка значения в process_contact_admin для user_id=%s: %s", user_id, e)
         await message.answer("Пожалуйста, введи корректное сообщение.")
     except Exception as e:
-        logger.error(f"Ошибка в process_contact_admin для user_id={user_id}: {e}")
+        logger.error("Ошибка в process_contact_admin для user_id=%s: %s", user_id, e)
         await message.answer(ERROR_MESSAGE)
+
+@router.message(Command("digest"))
+async def cmd_digest(message: types.Message):
+    """Показывает выбор режима доставки уведомлений."""
+    try:
+        mode = await get_notification_mode(message.from_user.id)
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=title, callback_data=DigestCallback(mode=key).pack())]
+            for key, title in DIGEST_MODES.items()
+        ])
+        await message.answer(DIGEST_PROMPT.format(mode=DIGEST_MODES[mode]), reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Ошибка в cmd_digest для user_id=%s: %s", message.from_user.id, e)
+        await message.answer(ERROR_MESSAGE)
+
+@callbacks(DigestCallback)
+async def process_digest_mode(callback: types.CallbackQuery, callback_data: DigestCallback):
+    """Сохраняет выбранный режим доставки уведомлений."""
+    try:
+        mode = callback_data.mode
+        await set_notification_mode(callback.from_user.id, mode)
+        await callback.message.answer(DIGEST_SAVED.format(mode=DIGEST_MODES[mode]))
+        await callback.answer()
+    except Exception as e:
+        logger.error("Ошибка в process_digest_mode для user_id=%s: %s", callback.from_user.id, e)
+        await callback.message.answer(ERROR_MESSAGE)
+        await callback.answer()
@@ -0,0 +1,148 @@
+# config.py
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+@dataclass(frozen=True)
+class Config:
+    """Настройки бота, прочитанные из переменных окружения."""
+    bot_token: str
+    telegram_api_url: str
+    admin_ids: Tuple[int, ...]
+    db_name: str
+    slow_query_threshold_ms: float
+    import_budget_ms: float
+    write_batch_ms: float
+    write_batch_max: int
+    write_durability: str
+    retention_notifications_days: int
+    retention_requests_days: int
+    retention_bookings_days: int
+    retention_batch_size: int
+    retention_interval_minutes: float
+    retention_vacuum_pages: int
+    snapshot_db_name: str
+    snapshot_refresh_minutes: float
+    backup_dir: str
+    backup_interval_minutes: float
+    backup_keep: int
+    backup_pre_restore_keep: int
+    backup_step_pages: int
+    backup_step_pause_ms: float
+    backup_max_restarts: int
+    ranking_interval_seconds: float
+    ranking_full_refresh_minutes: float
+    digest_instant_window_seconds: float
+    digest_poll_seconds: float
+    digest_max_attempts: int
+    reminder_lead_hours: float
+    reminder_interval_minutes: float
+    reminder_concurrency: int
+    throttle_rate: float
+    throttle_burst: int
+    throttle_search_rate: float
+    throttle_search_burst: int
+    yandex_weather_api_key: str
+    yandex_maps_api_key: str
+    yandex_taxi_api_key: str
+    yandex_weather_url: str
+    yandex_routing_url: str
+    yandex_taxi_url: str
+    yandex_timeout_seconds: float
+    breaker_failure_threshold: int
+    breaker_reset_seconds: float
+    log_file: str
+    log_level: str
+    log_sample_rate: float
+    log_sampled_loggers: Tuple[str, ...]
+    log_slow_update_ms: float
+    api_daily_budgets: Dict[str, int]
+    api_call_costs: Dict[str, float]
+    api_budget_reserve: float
+    api_cache_seconds: float
+    api_usage_flush_seconds: float
+
+_config: Optional[Config] = None
+
+def _parse_ids(value: str) -> Tuple[int, ...]:
+    """Разбирает список ID, перечисленных через запятую."""
+    return tuple(int(item) for item in value.split(",") if item.strip())
+
+def _parse_limits(value: str) -> Dict[str, float]:
+    """Разбирает значения по эндпоинтам вида "weather=1000,taxi=200"."""
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, number = item.partition("=")
+            limits[name.strip()] = float(number)
+    return limits
+
+def get_config() -> Config:
+    """Возвращает настройки, загружая .env только при первом обращении."""
+    global _config
+    if _config is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _config = Config(
+            bot_token=os.getenv("BOT_TOKEN", ""),
+            telegram_api_url=os.getenv("TELEGRAM_API_URL", ""),
+            admin_ids=_parse_ids(os.getenv("ADMIN_IDS", "")),
+            db_name=os.getenv("DB_NAME", "bot_database.db"),
+            slow_query_threshold_ms=float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100")),
+            import_budget_ms=float(os.getenv("IMPORT_BUDGET_MS", "1500")),
+            write_batch_ms=float(os.getenv("WRITE_BATCH_MS", "5")),
+            write_batch_max=int(os.getenv("WRITE_BATCH_MAX", "1000")),
+            write_durability=os.getenv("WRITE_DURABILITY", "normal").lower(),
+            retention_notifications_days=int(os.getenv("RETENTION_NOTIFICATIONS_DAYS", "7")),
+            retention_requests_days=int(os.getenv("RETENTION_REQUESTS_DAYS", "180")),
+            retention_bookings_days=int(os.getenv("RETENTION_BOOKINGS_DAYS", "365")),
+            retention_batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "500")),
+            retention_interval_minutes=float(os.getenv("RETENTION_INTERVAL_MINUTES", "60")),
+            retention_vacuum_pages=int(os.getenv("RETENTION_VACUUM_PAGES", "1000")),
+            snapshot_db_name=os.getenv("SNAPSHOT_DB_NAME", ""),
+            snapshot_refresh_minutes=float(os.getenv("SNAPSHOT_REFRESH_MINUTES", "5")),
+            backup_dir=os.getenv("BACKUP_DIR", "backups"),
+            backup_interval_minutes=float(os.getenv("BACKUP_INTERVAL_MINUTES", "60")),
+            backup_keep=int(os.getenv("BACKUP_KEEP", "24")),
+            backup_pre_restore_keep=int(os.getenv("BACKUP_PRE_RESTORE_KEEP", "3")),
+            backup_step_pages=int(os.getenv("BACKUP_STEP_PAGES", "256")),
+            backup_step_pause_ms=float(os.getenv("BACKUP_STEP_PAUSE_MS", "5")),
+            backup_max_restarts=int(os.getenv("BACKUP_MAX_RESTARTS", "3")),
+            ranking_interval_seconds=float(os.getenv("RANKING_INTERVAL_SECONDS", "60")),
+            ranking_full_refresh_minutes=float(os.getenv("RANKING_FULL_REFRESH_MINUTES", "60")),
+            digest_instant_window_seconds=float(os.getenv("DIGEST_INSTANT_WINDOW_SECONDS", "60")),
+            digest_poll_seconds=float(os.getenv("DIGEST_POLL_SECONDS", "15")),
+            digest_max_attempts=int(os.getenv("DIGEST_MAX_ATTEMPTS", "5")),
+            reminder_lead_hours=float(os.getenv("REMINDER_LEAD_HOURS", "24")),
+            reminder_interval_minutes=float(os.getenv("REMINDER_INTERVAL_MINUTES", "15")),
+            reminder_concurrency=int(os.getenv("REMINDER_CONCURRENCY", "10")),
+            throttle_rate=float(os.getenv("THROTTLE_RATE", "1")),
+            throttle_burst=int(os.getenv("THROTTLE_BURST", "5")),
+            throttle_search_rate=float(os.getenv("THROTTLE_SEARCH_RATE", "0.2")),
+            throttle_search_burst=int(os.getenv("THROTTLE_SEARCH_BURST", "2")),
+            yandex_weather_api_key=os.getenv("YANDEX_WEATHER_API_KEY", "your_yandex_weather_api_key"),
+            yandex_maps_api_key=os.getenv("YANDEX_MAPS_API_KEY", "your_yandex_maps_api_key"),
+            yandex_taxi_api_key=os.getenv("YANDEX_TAXI_API_KEY", "your_yandex_taxi_api_key"),
+            yandex_weather_url=os.getenv("YANDEX_WEATHER_URL", "https://api.weather.yandex.ru/v2/forecast"),
+            yandex_routing_url=os.getenv("YANDEX_ROUTING_URL", "https://api.routing.yandex.net/v2/route"),
+            yandex_taxi_url=os.getenv("YANDEX_TAXI_URL", "https://taxi-routeinfo.taxi.yandex.net/route_info"),
+            yandex_timeout_seconds=float(os.getenv("YANDEX_TIMEOUT_SECONDS", "3")),
+            breaker_failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+            breaker_reset_seconds=float(os.getenv("BREAKER_RESET_SECONDS", "30")),
+            log_file=os.getenv("LOG_FILE", "logs/bot.log"),
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            log_sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.1")),
+            log_sampled_loggers=tuple(
+                name.strip() for name in os.getenv("LOG_SAMPLED_LOGGERS", "aiogram.event,bot.access").split(",")
+                if name.strip()
+            ),
+            log_slow_update_ms=float(os.getenv("LOG_SLOW_UPDATE_MS", "1000")),
+            api_daily_budgets={
+                name: int(limit) for name, limit in _parse_limits(os.getenv("API_DAILY_BUDGETS", "")).items()
+            },
+            api_call_costs=_parse_limits(os.getenv("API_CALL_COSTS", "")),
+            api_budget_reserve=float(os.getenv("API_BUDGET_RESERVE", "0.2")),
+            api_cache_seconds=float(os.getenv("API_CACHE_SECONDS", "1800")),
+            api_usage_flush_seconds=float(os.getenv("API_USAGE_FLUSH_SECONDS", "60")),
+        )
+    return _config
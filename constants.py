@@ -1,12 +1,8 @@
 # constants.py
-import os
-from dotenv import load_dotenv
-
-# Загрузка переменных окружения
-load_dotenv()
+from config import get_config
 
 # Список ID администраторов
-ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("ADMIN_IDS").split(",")]
+ADMIN_IDS = list(get_config().admin_ids)
 
 # Текстовые константы
 WELCOME_TEXT = "👋 Приветствую, {name}! 👋\nЯ бот-помощник, я помогу тебе с Тропами и маршрутами. Выбери свою роль и начни путешествие! 🚀"
@@ -34,6 +30,7 @@ GUIDE_NOT_FOUND = "❌ Гида не удалось найти! Возможно
 NO_EXCURSIONS = "❌ Экскурсий не найдено! 😔"
 
 # Сообщения администратора
+INVALID_CALLBACK = "⚠️ Кнопка устарела или повреждена. Открой меню заново."
 ADMIN_ONLY = "🔒 Доступ только для администратора! 🔒"
 
 REQUEST_NEW_CITY = "➕ Заказать маршрут в новом городе"
@@ -73,6 +70,27 @@ REVIEW_SUCCESS = "🎉 Отзыв успешно оставлен!"
 REQUEST_SUCCESS = "🎉 Заявка успешно отправлена! Мы найдём подходящий маршрут."
 NO_BOOKINGS = "У тебя пока нет бронирований."
 NO_REVIEWS = "У тебя пока нет отзывов."
+GUIDE_DASHBOARD_HEADER = "📋 Твои маршруты: {count}\nРейтинг гида: {rating:.1f} ({review_count} отзывов)"
+GUIDE_DASHBOARD_EMPTY = "У тебя пока нет маршрутов. Добавь первый через «➕ Добавить маршрут»."
+GUIDE_DASHBOARD_EXCURSION = "\n#{id} {title} {status}\nБронирований: {total_bookings} · рейтинг {rating:.1f} ({review_count} отзывов)"
+GUIDE_DASHBOARD_SESSION = "  📅 {date}: {booked}/{capacity} мест ({fill_rate:.0%})"
+GUIDE_DASHBOARD_SESSION_UNLIMITED = "  📅 {date}: {booked} бронирований"
+GUIDE_DASHBOARD_NO_SESSIONS = "  Ближайших дат нет"
+GUIDE_DASHBOARD_REVIEWS = "\n💬 Последние отзывы:"
+GUIDE_DASHBOARD_REVIEW = "⭐ {rating} — {title}: {comment}"
+SUBSCRIPTIONS_BUTTON = "🔔 Мои подписки"
+SUBSCRIPTION_LABELS = {
+    "guide": "👤 Гид",
+    "city": "🏙️ Город",
+    "topic": "🏷️ Тема",
+}
+SUBSCRIPTIONS_HEADER = "🔔 Твои подписки. Нажми, чтобы отписаться:"
+SUBSCRIPTIONS_EMPTY = "У тебя пока нет подписок. Подписаться можно из карточки маршрута."
+FOLLOW_DONE = "🔔 Подписка оформлена: {label} {name}"
+UNFOLLOW_DONE = "🔕 Подписка отменена"
+NO_REVIEWABLE_BOOKINGS = "Пока нет прошедших экскурсий без отзыва."
+REVIEW_CHOOSE_BOOKING = "О какой экскурсии оставить отзыв?"
+REVIEW_ALREADY_EXISTS = "На это бронирование отзыв уже оставлен."
 EXCURSION_SUCCESS = "🎉 Маршрут успешно добавлен! Он будет доступен после одобрения администратора."
 ADMIN_WELCOME = "Добро пожаловать в админ-панель! Выбери действие:"
 ACCESS_DENIED = "⛔ Доступ запрещён! Ты не администратор."
@@ -89,6 +107,29 @@ STATS_MESSAGE = (
  "Путешественники: {travelers_total}\n"
  "Заявки: {requests_total}"
 )
+SNAPSHOT_AGE = "\n\n🕒 Данные на {taken_at:%H:%M:%S} (обновлены {age} назад)"
+SNAPSHOT_REFRESH_BUTTON = "🔄 Обновить данные"
+GUIDES_LIST_EMPTY = "Гидов пока нет."
+GUIDES_LIST_HEADER = "📋 Гиды: {total} (страница {page} из {pages})"
+GUIDES_LIST_ITEM = "{status} {first_name} {last_name} ({city}), ID {user_id}"
+GUIDES_APPROVE_PAGE_BUTTON = "✅ Одобрить всех на странице"
+GUIDES_APPROVED = "✅ Одобрено гидов: {count}"
+EXPORT_USAGE = "Выгрузка в CSV: /export таблица\nТаблицы: {tables}"
+EXPORT_CAPTION = "📤 {table}: {count} строк"
+ARCHIVE_USAGE = "Выгрузка архива в CSV: /archive таблица\nТаблицы: {tables}"
+ARCHIVE_EMPTY = "В архиве таблицы {table} пока нет строк."
+ARCHIVE_CAPTION = "🗄️ Архив {table}: {count} строк из последних {batches} пачек"
+DB_STATS_HEADER = "🐢 Самые затратные запросы с запуска бота:"
+DB_STATS_EMPTY = "Запросов с запуска бота ещё не было."
+DB_STATS_ITEM = "\n{total_ms:.0f} мс всего, {count} раз, в среднем {avg_ms:.1f} мс, медленных {slow}\n<code>{sql}</code>"
+API_USAGE_HEADER = "💸 Расход API {period}:"
+API_USAGE_EMPTY = "Обращений к внешним API {period} не было."
+API_USAGE_ITEM = (
+    "\n{endpoint}: запросов {calls}{budget}, стоимость ≈ {cost:.2f} руб.\n"
+    "- Ошибки: {errors} ({error_rate:.1f}%), средняя задержка {avg_latency_ms:.0f} мс\n"
+    "- Попадания в кэш: {cache_hit_rate:.1f}%, ответов-замен: {fallbacks} (из-за бюджета: {throttled})"
+)
+API_USAGE_BUDGET = " из {budget} в сутки"
 SUCCESS_APPROVAL = "✅ Действие успешно выполнено!"
 CONFIRM_ACTION = "Подтверди действие:"
 CONTACT_ADMIN_MESSAGE = "📞 Связаться с администратором: @AdminUsername"
@@ -111,3 +152,39 @@ NOTIFICATION_NEW_COMPLAINT = "Новая жалоба!\nЭкскурсия ID: {
 WEATHER_RECOMMENDATION_RAIN = "Не забудь взять зонт! ☔"
 WEATHER_RECOMMENDATION_SUN = "Солнечно! Возьми солнцезащитный крем и очки. 🕶️"
 WEATHER_RECOMMENDATION_COLD = "Холодно! Одевайся теплее. 🧥"
+
+# Типы уведомлений для группировки в дайджесты
+NOTIFICATION_KIND_GENERAL = "general"
+NOTIFICATION_KIND_BOOKING = "booking"
+NOTIFICATION_KIND_REQUEST = "request"
+NOTIFICATION_KIND_COMPLAINT = "complaint"
+NOTIFICATION_KIND_CONTACT = "contact"
+NOTIFICATION_KIND_EXCURSION = "excursion"
+NOTIFICATION_KIND_REMINDER = "reminder"
+
+# Заголовки дайджестов по типам уведомлений
+DIGEST_TITLES = {
+    NOTIFICATION_KIND_GENERAL: "📬 Новые уведомления",
+    NOTIFICATION_KIND_BOOKING: "📖 Новые бронирования",
+    NOTIFICATION_KIND_REQUEST: "📩 Новые заявки",
+    NOTIFICATION_KIND_COMPLAINT: "⚠️ Новые жалобы",
+    NOTIFICATION_KIND_CONTACT: "📞 Сообщения пользователей",
+    NOTIFICATION_KIND_EXCURSION: "🗺️ Новые маршруты",
+}
+
+# Режимы доставки уведомлений
+DIGEST_MODES = {
+    "instant": "⚡ Сразу",
+    "hourly": "🕐 Раз в час",
+    "daily": "📅 Раз в день",
+}
+DIGEST_PROMPT = "Как присылать уведомления? Сейчас: {mode}"
+DIGEST_SAVED = "✅ Режим уведомлений: {mode}"
+
+# Сообщения очереди модерации
+MODERATION_BUTTON = "🛡️ Модерация"
+MODERATION_EMPTY = "✅ Очередь модерации пуста!"
+MODERATION_HEADER = "🛡️ Очередь модерации: {total} маршрутов (страница {page} из {pages})\nВыбрано: {selected}"
+MODERATION_ITEM = "#{id} {title} — {city}, {price} руб. (гид {guide_id})"
+MODERATION_DONE = "✅ Одобрено: {approved}, ❌ отклонено: {rejected}"
+
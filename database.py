@@ -1,13 +1,334 @@
 # database.py
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
 import aiosqlite
-from typing import List, Dict, Any
+from dataclasses import dataclass, asdict, fields
+from typing import List, Dict, Any, AsyncIterator, Optional, Sequence, Tuple
 from datetime import datetime
+from config import get_config
+from cards import invalidate_excursion, invalidate_guide
+from cities import (
+    City, KNOWN_CITIES, clear_cities, display_city_name, get_city, get_city_id, normalize_city_name, register_city
+)
 
-DB_NAME = "bot_database.db"
+DB_NAME = get_config().db_name
+
+logger = logging.getLogger(__name__)
+
+# Порог медленного запроса в миллисекундах
+SLOW_QUERY_THRESHOLD_MS = get_config().slow_query_threshold_ms
+
+# Счётчики по тексту запроса: количество вызовов, суммарное время и число медленных
+_query_stats: Dict[str, Dict[str, float]] = {}
+# EXPLAIN QUERY PLAN, снятый один раз для каждого текста запроса
+_query_plans: Dict[str, str] = {}
+
+# Кэш «роль и счётчики» по пользователю для построения клавиатур
+USER_SNAPSHOT_CACHE_SIZE = 10000
+_user_snapshots: Dict[int, Dict[str, Any]] = {}
+
+# Кэш кабинета гида: гид -> (момент сборки, кабинет) и обратная карта «маршрут -> гид» для сброса
+# по ID маршрута. Кэш ограничен по размеру (вытесняется давно не открывавшийся кабинет) и по времени
+# жизни: записи в базу мимо бота (например, восстановление из копии) устаревают сами
+GUIDE_DASHBOARD_CACHE_SIZE = 1000
+GUIDE_DASHBOARD_TTL_SECONDS = 600
+_guide_dashboards: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+_dashboard_excursions: Dict[int, int] = {}
+
+async def _explain(db: aiosqlite.Connection, sql: str, params: Sequence[Any]) -> str:
+    """Возвращает EXPLAIN QUERY PLAN запроса, вычисляя его один раз на текст запроса."""
+    plan = _query_plans.get(sql)
+    if plan is None:
+        try:
+            cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = "; ".join(row[3] for row in await cursor.fetchall())
+        except Exception as e:
+            plan = f"недоступен ({e})"
+        _query_plans[sql] = plan
+    return plan
+
+async def _record_query(db: aiosqlite.Connection, sql: str, params: Sequence[Any], started: float) -> None:
+    """Обновляет счётчики запроса и пишет в лог медленные запросы вместе с планом."""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    stats = _query_stats.setdefault(sql, {"count": 0, "total_ms": 0.0, "slow": 0})
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    if elapsed_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+    stats["slow"] += 1
+    plan = await _explain(db, sql, params)
+    logger.warning(
+        "Медленный запрос (%.1f мс): %s; параметры=%r; план: %s",
+        elapsed_ms, " ".join(sql.split()), tuple(params), plan
+    )
+
+async def _execute(db: aiosqlite.Connection, sql: str, params: Sequence[Any] = ()) -> aiosqlite.Cursor:
+    """Выполняет запрос на изменение данных с учётом времени выполнения."""
+    started = time.perf_counter()
+    cursor = await db.execute(sql, params)
+    await _record_query(db, sql, params, started)
+    return cursor
+
+async def _fetch_all(db: aiosqlite.Connection, sql: str, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    """Выполняет запрос и возвращает все строки в виде словарей."""
+    started = time.perf_counter()
+    cursor = await db.execute(sql, params)
+    rows = await cursor.fetchall()
+    await _record_query(db, sql, params, started)
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+async def _fetch_one(db: aiosqlite.Connection, sql: str, params: Sequence[Any] = ()) -> Dict[str, Any]:
+    """Выполняет запрос и возвращает первую строку в виде словаря или пустой словарь."""
+    started = time.perf_counter()
+    cursor = await db.execute(sql, params)
+    row = await cursor.fetchone()
+    await _record_query(db, sql, params, started)
+    if row:
+        columns = [description[0] for description in cursor.description]
+        return dict(zip(columns, row))
+    return {}
+
+async def _fetch_value(db: aiosqlite.Connection, sql: str, params: Sequence[Any] = ()) -> Any:
+    """Выполняет запрос и возвращает значение первого столбца первой строки."""
+    started = time.perf_counter()
+    cursor = await db.execute(sql, params)
+    row = await cursor.fetchone()
+    await _record_query(db, sql, params, started)
+    return row[0] if row else None
+
+def get_query_stats() -> Dict[str, Dict[str, float]]:
+    """Возвращает счётчики выполненных запросов по тексту запроса."""
+    return {sql: dict(stats) for sql, stats in _query_stats.items()}
+
+# Режимы долговечности очереди записи: значение PRAGMA synchronous
+WRITE_DURABILITY_MODES = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+Statement = Tuple[str, Sequence[Any]]
+
+class WriteQueue:
+    """Очередь записи, объединяющая вставки за несколько миллисекунд в одну транзакцию.
+
+    Каждая заявка — список выражений, выполняемых атомарно в своей точке
+    сохранения: ошибка одной заявки не откатывает остальные заявки пачки.
+    Вызывающий получает lastrowid первого выражения после фиксации транзакции.
+    """
+
+    def __init__(self, db_name: str, batch_ms: float, batch_max: int, durability: str):
+        if durability not in WRITE_DURABILITY_MODES:
+            raise ValueError(f"Неизвестный режим долговечности записи: {durability}")
+        self.db_name = db_name
+        self.batch_seconds = batch_ms / 1000
+        self.batch_max = batch_max
+        self.durability = durability
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открывает соединение, используемое только потоком записи."""
+        connection = sqlite3.connect(self.db_name, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute(f"PRAGMA synchronous = {WRITE_DURABILITY_MODES[self.durability]}")
+        connection.execute("PRAGMA busy_timeout = 5000")
+        return connection
+
+    def _start(self) -> None:
+        """Запускает фоновую задачу записи в текущем цикле событий."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, statements: Sequence[Statement]) -> int:
+        """Ставит в очередь атомарную группу выражений и ждёт её фиксации."""
+        if self._task is None or self._task.done():
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((list(statements), future))
+        return await future
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """Ставит в очередь одно выражение и возвращает его lastrowid."""
+        return await self.submit([(sql, params)])
+
+    async def _run(self) -> None:
+        """Собирает заявки в пачки и записывает их одной транзакцией."""
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                return
+            # Даём остальным вызывающим несколько миллисекунд, чтобы попасть в ту же пачку
+            if self._queue.qsize() < self.batch_max:
+                await asyncio.sleep(self.batch_seconds)
+            batch = [job]
+            stop = False
+            while len(batch) < self.batch_max and not self._queue.empty():
+                job = self._queue.get_nowait()
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            await self._flush(batch)
+            if stop:
+                return
+
+    def _write_batch(self, jobs: List[List[Statement]]) -> List[Any]:
+        """Записывает пачку заявок в одной транзакции (выполняется в отдельном потоке)."""
+        if self._connection is None:
+            self._connection = self._connect()
+        connection = self._connection
+        results: List[Any] = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for statements in jobs:
+                connection.execute("SAVEPOINT job")
+                try:
+                    lastrowid = None
+                    for sql, params in statements:
+                        cursor = connection.execute(sql, params)
+                        if lastrowid is None:
+                            lastrowid = cursor.lastrowid
+                    connection.execute("RELEASE job")
+                    results.append(lastrowid)
+                except sqlite3.Error as e:
+                    connection.execute("ROLLBACK TO job")
+                    connection.execute("RELEASE job")
+                    results.append(e)
+            connection.execute("COMMIT")
+        except Exception:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _flush(self, batch: List[Tuple[List[Statement], asyncio.Future]]) -> None:
+        """Записывает пачку и передаёт результаты ожидающим вызывающим."""
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self._write_batch, [statements for statements, _ in batch])
+        except Exception as e:
+            logger.error("Ошибка записи пачки из %d заявок: %s", len(batch), e)
+            results = [e] * len(batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms >= SLOW_QUERY_THRESHOLD_MS:
+            logger.warning("Медленная запись пачки из %d заявок: %.1f мс", len(batch), elapsed_ms)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """Дописывает все ожидающие заявки и закрывает соединение."""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+_write_queue = WriteQueue(
+    DB_NAME,
+    batch_ms=get_config().write_batch_ms,
+    batch_max=get_config().write_batch_max,
+    durability=get_config().write_durability
+)
+
+async def close_write_queue() -> None:
+    """Сбрасывает отложенные записи на диск; вызывается при остановке бота."""
+    await _write_queue.close()
+
+# Копия базы для тяжёлых чтений админки: отчёты не конкурируют с записью путешественников
+SNAPSHOT_DB_NAME = get_config().snapshot_db_name or f"{DB_NAME}.snapshot"
+_snapshot_taken_at: Optional[datetime] = None
+_snapshot_lock: Optional[asyncio.Lock] = None
+
+def _copy_snapshot() -> None:
+    """Копирует базу через online backup API во временный файл и подменяет снимок (в отдельном потоке)."""
+    temp_name = f"{SNAPSHOT_DB_NAME}.tmp"
+    source = sqlite3.connect(DB_NAME)
+    target = sqlite3.connect(temp_name)
+    try:
+        # В режиме WAL копирование одним шагом держит только транзакцию чтения и не мешает записи,
+        # а пошаговое копирование начиналось бы заново после каждой записи очереди
+        source.backup(target)
+        # Снимок открывается только для чтения, поэтому ему не нужны файлы -wal и -shm
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(temp_name, SNAPSHOT_DB_NAME)
+
+async def refresh_snapshot() -> datetime:
+    """Обновляет снимок базы и возвращает время, на которое он актуален."""
+    global _snapshot_taken_at, _snapshot_lock
+    if _snapshot_lock is None:
+        _snapshot_lock = asyncio.Lock()
+    async with _snapshot_lock:
+        taken_at = datetime.now()
+        started = time.perf_counter()
+        await asyncio.to_thread(_copy_snapshot)
+        _snapshot_taken_at = taken_at
+        logger.info("Снимок базы обновлён за %.1f мс", (time.perf_counter() - started) * 1000)
+    return taken_at
+
+# Таблицы, которые админ может выгрузить в CSV (см. export_table)
+EXPORT_TABLES = ("guides", "excursions", "bookings", "requests", "reviews")
+
+def _export_snapshot_csv(table: str, path: str) -> int:
+    """Построчно выгружает таблицу снимка в CSV и возвращает число строк (в отдельном потоке)."""
+    db = sqlite3.connect(f"file:{SNAPSHOT_DB_NAME}?mode=ro", uri=True)
+    try:
+        cursor = db.execute(f"SELECT * FROM {table}")
+        # BOM нужен, чтобы Excel распознал кириллицу
+        with open(path, "w", newline="", encoding="utf-8-sig") as file:
+            writer = csv.writer(file)
+            writer.writerow([column[0] for column in cursor.description])
+            count = 0
+            for row in cursor:
+                writer.writerow(row)
+                count += 1
+    finally:
+        db.close()
+    return count
+
+async def export_table(table: str, path: str) -> int:
+    """Выгружает таблицу из снимка базы в CSV-файл path, не блокируя запись и цикл событий."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Таблицу {table} выгружать нельзя")
+    if _snapshot_taken_at is None:
+        await refresh_snapshot()
+    return await asyncio.to_thread(_export_snapshot_csv, table, path)
+
+def get_snapshot_time() -> Optional[datetime]:
+    """Возвращает время последнего снимка базы или None, если снимка ещё нет."""
+    return _snapshot_taken_at
+
+async def _connect_snapshot() -> aiosqlite.Connection:
+    """Открывает снимок базы только для чтения, создавая его при первом обращении."""
+    if _snapshot_taken_at is None:
+        await refresh_snapshot()
+    return aiosqlite.connect(f"file:{SNAPSHOT_DB_NAME}?mode=ro", uri=True)
 
 async def init_db():
     """Инициализирует базу данных."""
     async with aiosqlite.connect(DB_NAME) as db:
+        # Инкрементальная очистка применяется к новой базе; существующую переводим разовым VACUUM
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if await _fetch_value(db, "PRAGMA auto_vacuum") == 0:
+            logger.info("Перевод базы на инкрементальную очистку (разовый VACUUM)")
+            await db.execute("VACUUM")
+        # WAL позволяет читателям не ждать пакетную запись очереди
+        await db.execute("PRAGMA journal_mode = WAL")
         # Уровень отступа: 4 пробела
         await db.execute("""
             CREATE TABLE IF NOT EXISTS guides (
@@ -36,6 +357,10 @@ async def init_db():
                 start_location_lat REAL,
                 start_location_lon REAL,
                 is_approved BOOLEAN DEFAULT 0,
+                rating REAL DEFAULT 0.0,
+                review_count INTEGER DEFAULT 0,
+                created_at TEXT,
+                capacity INTEGER DEFAULT 0,
                 FOREIGN KEY (guide_id) REFERENCES guides(user_id)
             )
         """)
@@ -46,6 +371,7 @@ async def init_db():
                 excursion_id INTEGER,
                 created_at TEXT,
                 status TEXT,
+                session_date TEXT,
                 FOREIGN KEY (excursion_id) REFERENCES excursions(id)
             )
         """)
@@ -54,12 +380,23 @@ async def init_db():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 guide_id INTEGER,
+                excursion_id INTEGER,
+                booking_id INTEGER,
                 rating INTEGER,
                 comment TEXT,
                 created_at TEXT,
-                FOREIGN KEY (guide_id) REFERENCES guides(user_id)
+                FOREIGN KEY (guide_id) REFERENCES guides(user_id),
+                FOREIGN KEY (booking_id) REFERENCES bookings(id)
             )
         """)
+        await _add_column_if_missing(db, "reviews", "excursion_id", "INTEGER")
+        await _add_column_if_missing(db, "reviews", "booking_id", "INTEGER")
+        # Один отзыв на бронирование; старые отзывы без бронирования индекс не ограничивает
+        await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_booking ON reviews (booking_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_reviews_guide ON reviews (guide_id, id)")
+        if await _add_column_if_missing(db, "excursions", "review_count", "INTEGER DEFAULT 0"):
+            await _add_column_if_missing(db, "excursions", "rating", "REAL DEFAULT 0.0")
+            await _backfill_rating_aggregates(db)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS requests (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,242 +414,1150 @@ async def init_db():
                 keywords TEXT
             )
         """)
+        await _init_subscriptions(db)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS notifications (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 message TEXT,
                 is_sent BOOLEAN DEFAULT 0,
-                created_at TEXT
+                created_at TEXT,
+                kind TEXT DEFAULT 'general'
+            )
+        """)
+        await _add_column_if_missing(db, "notifications", "kind", "TEXT DEFAULT 'general'")
+        # Число неудачных попыток доставки; после DIGEST_MAX_ATTEMPTS уведомление помечается недоставленным
+        await _add_column_if_missing(db, "notifications", "attempts", "INTEGER DEFAULT 0")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS notification_preferences (
+                user_id INTEGER PRIMARY KEY,
+                mode TEXT
+            )
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_id ON bookings (user_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_excursion_id ON bookings (excursion_id)")
+        # Группы дайджестов (получатель, тип) и их старейшее уведомление читаются из индекса
+        await db.execute("DROP INDEX IF EXISTS idx_notifications_pending")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_notifications_pending_groups "
+            "ON notifications (user_id, kind, created_at) WHERE is_sent = 0"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS excursion_dates (
+                date TEXT,
+                excursion_id INTEGER,
+                PRIMARY KEY (date, excursion_id),
+                FOREIGN KEY (excursion_id) REFERENCES excursions(id)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursion_dates_excursion ON excursion_dates (excursion_id, date)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_theme ON excursions (is_approved, theme, price)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_price ON excursions (is_approved, price)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_guide ON excursions (guide_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_pending ON excursions (id) WHERE is_approved = 0")
+        await _add_column_if_missing(db, "excursions", "created_at", "TEXT")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_requests_user ON requests (user_id)")
+        # Предрассчитанная оценка маршрута (см. ranking.py) хранится в самой строке: выдача и поиск
+        # с фильтром читают индекс по оценке по порядку и останавливаются на LIMIT
+        if await _add_column_if_missing(db, "excursions", "score", "REAL DEFAULT 0"):
+            if await _fetch_value(db, "SELECT 1 FROM sqlite_master WHERE name = 'excursion_scores'"):
+                await db.execute(
+                    "UPDATE excursions SET score = s.score FROM excursion_scores s WHERE s.excursion_id = excursions.id"
+                )
+                await db.execute("DROP TABLE excursion_scores")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_score ON excursions (is_approved, score DESC, id)")
+        await _init_excursion_search(db)
+        # Вместимость 0 означает, что гид не ограничил число мест
+        await _add_column_if_missing(db, "excursions", "capacity", "INTEGER DEFAULT 0")
+        if await _add_column_if_missing(db, "bookings", "session_date", "TEXT"):
+            # Старым бронированиям назначаем первую дату маршрута после оформления
+            await db.execute("""
+                UPDATE bookings SET session_date = (
+                    SELECT MIN(d.date) FROM excursion_dates d
+                    WHERE d.excursion_id = bookings.excursion_id AND d.date >= substr(bookings.created_at, 1, 10)
+                )
+            """)
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_bookings_session ON bookings (excursion_id, session_date)")
+        # Дата, о которой уже отправлено напоминание: перезапуск бота не должен повторять рассылку
+        if await _add_column_if_missing(db, "bookings", "reminded_for", "TEXT"):
+            # Даты сравниваются как строки ISO, поэтому записанные через пробел приводим к виду с «T»
+            await db.execute(
+                "INSERT OR IGNORE INTO excursion_dates (date, excursion_id) "
+                "SELECT replace(date, ' ', 'T'), excursion_id FROM excursion_dates WHERE date LIKE '% %'"
+            )
+            await db.execute("DELETE FROM excursion_dates WHERE date LIKE '% %'")
+            await db.execute("UPDATE bookings SET session_date = replace(session_date, ' ', 'T') WHERE session_date LIKE '% %'")
+        # Расход платных внешних API по часовым корзинам (см. api_usage.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS api_usage (
+                endpoint TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                calls INTEGER DEFAULT 0,
+                errors INTEGER DEFAULT 0,
+                cache_hits INTEGER DEFAULT 0,
+                fallbacks INTEGER DEFAULT 0,
+                throttled INTEGER DEFAULT 0,
+                latency_ms REAL DEFAULT 0,
+                cost REAL DEFAULT 0,
+                PRIMARY KEY (endpoint, bucket)
+            ) WITHOUT ROWID
+        """)
+        await _init_cities(db)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS archive_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_table TEXT,
+                first_id INTEGER,
+                last_id INTEGER,
+                row_count INTEGER,
+                archived_at TEXT,
+                payload BLOB
             )
         """)
         await db.commit()
 
-def get_admin_ids() -> List[int]:
-    """Возвращает список ID администраторов."""
-    return [123456789]  # Пример ID администратора
+def normalize_date(value: str) -> str:
+    """Приводит дату маршрута к виду ISO с «T» между датой и временем, чтобы строки сравнивались как даты."""
+    return value.strip().replace(" ", "T", 1)
+
+async def _add_column_if_missing(db: aiosqlite.Connection, table: str, column: str, declaration: str) -> bool:
+    """Добавляет столбец в существующую таблицу, если его ещё нет; возвращает True, если столбец добавлен."""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    if column in [row[1] for row in await cursor.fetchall()]:
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+async def _backfill_rating_aggregates(db: aiosqlite.Connection) -> None:
+    """Разово пересчитывает рейтинги гидов и маршрутов по уже оставленным отзывам."""
+    for table, key, column in (("guides", "user_id", "guide_id"), ("excursions", "id", "excursion_id")):
+        await db.execute(f"""
+            UPDATE {table} SET
+                rating = COALESCE((SELECT AVG(rating) FROM reviews WHERE {column} = {table}.{key}), 0.0),
+                review_count = (SELECT COUNT(*) FROM reviews WHERE {column} = {table}.{key})
+        """)
+
+async def _init_subscriptions(db: aiosqlite.Connection) -> None:
+    """Создаёт таблицу подписок и переносит в неё записи старой таблицы subscribers."""
+    exists = await _fetch_value(db, "SELECT 1 FROM sqlite_master WHERE name = 'subscriptions'")
+    # Ключ (вид, цель, пользователь): подписчики одной цели лежат подряд и читаются диапазоном индекса
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            kind TEXT NOT NULL,
+            target TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at TEXT,
+            PRIMARY KEY (kind, target, user_id)
+        ) WITHOUT ROWID
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions (user_id)")
+    if exists:
+        return
+    created_at = datetime.now().isoformat()
+    rows = []
+    for subscriber in await _fetch_all(db, "SELECT * FROM subscribers"):
+        user_id = subscriber["user_id"]
+        if subscriber["guide_id"]:
+            rows.append((SUBSCRIPTION_GUIDE, str(subscriber["guide_id"]), user_id, created_at))
+        if subscriber["city"]:
+            rows.append((SUBSCRIPTION_CITY, normalize_target(subscriber["city"]), user_id, created_at))
+        for keyword in (subscriber["keywords"] or "").replace(",", " ").split():
+            rows.append((SUBSCRIPTION_TOPIC, normalize_target(keyword), user_id, created_at))
+    await db.executemany(
+        "INSERT OR IGNORE INTO subscriptions (kind, target, user_id, created_at) VALUES (?, ?, ?, ?)", rows
+    )
+
+def _city_insert_statements(name: str, lat: Optional[float], lon: Optional[float], aliases: Sequence[str]) -> List[Tuple[str, Sequence[Any]]]:
+    """Выражения добавления города с псевдонимами; lastrowid первого из них — ID города."""
+    # Вставка в city_aliases (WITHOUT ROWID) не меняет last_insert_rowid(), поэтому все псевдонимы получают ID города
+    return [("INSERT INTO cities (name, lat, lon) VALUES (?, ?, ?)", (name, lat, lon))] + [
+        ("INSERT OR IGNORE INTO city_aliases (alias, city_id) VALUES (?, last_insert_rowid())", (alias,))
+        for alias in aliases
+    ]
+
+async def _insert_city(db: aiosqlite.Connection, name: str, lat: Optional[float], lon: Optional[float], aliases: Sequence[str]) -> City:
+    """Добавляет город напрямую через соединение (при инициализации базы) и регистрирует его в памяти."""
+    statements = _city_insert_statements(name, lat, lon, aliases)
+    cursor = await db.execute(*statements[0])
+    for statement in statements[1:]:
+        await db.execute(*statement)
+    city = City(cursor.lastrowid, name, lat, lon)
+    register_city(city, aliases)
+    return city
+
+async def _init_cities(db: aiosqlite.Connection) -> None:
+    """Создаёт справочник городов, загружает его в память и переводит города маршрутов, заявок и подписок на ID."""
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS cities (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            lat REAL,
+            lon REAL
+        )
+    """)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS city_aliases (
+            alias TEXT PRIMARY KEY,
+            city_id INTEGER NOT NULL,
+            FOREIGN KEY (city_id) REFERENCES cities(id)
+        ) WITHOUT ROWID
+    """)
+    clear_cities()
+    aliases: Dict[int, List[str]] = {}
+    for row in await _fetch_all(db, "SELECT alias, city_id FROM city_aliases"):
+        aliases.setdefault(row["city_id"], []).append(row["alias"])
+    for row in await _fetch_all(db, "SELECT * FROM cities"):
+        register_city(City(row["id"], row["name"], row["lat"], row["lon"]), aliases.get(row["id"], ()))
+    # Встроенный справочник дополняется при каждом запуске: новые города и псевдонимы появляются без миграций
+    for name, lat, lon, known_aliases in KNOWN_CITIES:
+        keys = list(dict.fromkeys(normalize_city_name(alias) for alias in (name, *known_aliases)))
+        city = get_city(get_city_id(name))
+        if city is None:
+            await _insert_city(db, name, lat, lon, keys)
+            continue
+        missing = [key for key in keys if get_city_id(key) is None]
+        await db.executemany(
+            "INSERT OR IGNORE INTO city_aliases (alias, city_id) VALUES (?, ?)", [(key, city.id) for key in missing]
+        )
+        register_city(city, missing)
+
+    for table in ("excursions", "requests"):
+        if not await _add_column_if_missing(db, table, "city_id", "INTEGER"):
+            continue
+        # Разовый перевод введённых названий в ID с каноническим названием города
+        for row in await _fetch_all(db, f"SELECT DISTINCT city FROM {table} WHERE city IS NOT NULL AND city != ''"):
+            city = get_city(get_city_id(row["city"]))
+            if city is None:
+                key = normalize_city_name(row["city"])
+                if not key:
+                    continue
+                # Центр нового города — первая известная точка встречи маршрута в нём
+                location = await _fetch_one(
+                    db,
+                    "SELECT start_location_lat AS lat, start_location_lon AS lon FROM excursions "
+                    "WHERE city = ? AND start_location_lat != 0 ORDER BY id LIMIT 1",
+                    (row["city"],)
+                ) if table == "excursions" else {}
+                city = await _insert_city(db, display_city_name(row["city"]), location.get("lat"), location.get("lon"), [key])
+            await db.execute(f"UPDATE {table} SET city_id = ?, city = ? WHERE city = ?", (city.id, city.name, row["city"]))
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_excursions_city_id ON excursions (is_approved, city_id, price)")
+    await db.execute("DROP INDEX IF EXISTS idx_excursions_city")
+
+    # Подписки на город хранят ID города; старые текстовые цели переводятся на ID
+    for row in await _fetch_all(
+        db, "SELECT DISTINCT target FROM subscriptions WHERE kind = 'city' AND target GLOB '*[^0-9]*'"
+    ):
+        city = get_city(get_city_id(row["target"]))
+        if city is None:
+            city = await _insert_city(db, display_city_name(row["target"]), None, None, [normalize_city_name(row["target"])])
+        await db.execute(
+            "INSERT OR IGNORE INTO subscriptions (kind, target, user_id, created_at) "
+            "SELECT kind, ?, user_id, created_at FROM subscriptions WHERE kind = 'city' AND target = ?",
+            (str(city.id), row["target"])
+        )
+        await db.execute("DELETE FROM subscriptions WHERE kind = 'city' AND target = ?", (row["target"],))
+
+_city_lock = asyncio.Lock()
+
+async def resolve_city(name: str, lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[City]:
+    """Возвращает город по введённому названию, добавляя неизвестный город в справочник.
 
-async def get_all_guides() -> List[Dict[str, Any]]:
-    """Возвращает список всех гидов."""
+    Известные города находятся в памяти без обращения к базе; координаты
+    используются как центр только для нового города. Пустое название — None.
+    """
+    key = normalize_city_name(name or "")
+    if not key:
+        return None
+    city = get_city(get_city_id(key))
+    if city is not None:
+        return city
+    async with _city_lock:
+        # Пока ждали блокировку, тот же город мог добавить другой обработчик
+        city = get_city(get_city_id(key))
+        if city is None:
+            display_name = display_city_name(name)
+            city_id = await _write_queue.submit(_city_insert_statements(display_name, lat, lon, [key]))
+            city = City(city_id, display_name, lat, lon)
+            register_city(city, [key])
+    return city
+
+async def _init_excursion_search(db: aiosqlite.Connection) -> None:
+    """Создаёт полнотекстовый индекс и таблицу дат маршрутов, заполняя их для существующих данных."""
+    fts_exists = await _fetch_value(db, "SELECT 1 FROM sqlite_master WHERE name = 'excursions_fts'")
+    await db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS excursions_fts
+        USING fts5(title, description, keywords, content='excursions', content_rowid='id')
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS excursions_fts_insert AFTER INSERT ON excursions BEGIN
+            INSERT INTO excursions_fts (rowid, title, description, keywords)
+            VALUES (new.id, new.title, new.description, new.keywords);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS excursions_fts_delete AFTER DELETE ON excursions BEGIN
+            INSERT INTO excursions_fts (excursions_fts, rowid, title, description, keywords)
+            VALUES ('delete', old.id, old.title, old.description, old.keywords);
+        END
+    """)
+    await db.execute("""
+        CREATE TRIGGER IF NOT EXISTS excursions_fts_update AFTER UPDATE OF title, description, keywords ON excursions BEGIN
+            INSERT INTO excursions_fts (excursions_fts, rowid, title, description, keywords)
+            VALUES ('delete', old.id, old.title, old.description, old.keywords);
+            INSERT INTO excursions_fts (rowid, title, description, keywords)
+            VALUES (new.id, new.title, new.description, new.keywords);
+        END
+    """)
+    if not fts_exists:
+        await db.execute("INSERT INTO excursions_fts (excursions_fts) VALUES ('rebuild')")
+    if not await _fetch_value(db, "SELECT 1 FROM excursion_dates LIMIT 1"):
+        for excursion in await _fetch_all(db, "SELECT id, dates FROM excursions WHERE dates != ''"):
+            await db.executemany(
+                "INSERT OR IGNORE INTO excursion_dates (date, excursion_id) VALUES (?, ?)",
+                [(normalize_date(date), excursion["id"]) for date in excursion["dates"].split(",") if date.strip()]
+            )
+
+def invalidate_user_snapshot(user_id: int) -> None:
+    """Сбрасывает кэшированный снимок роли и счётчиков пользователя."""
+    _user_snapshots.pop(user_id, None)
+
+async def get_user_snapshot(user_id: int) -> Dict[str, Any]:
+    """Возвращает роль и счётчики пользователя одним запросом с кэшированием."""
+    snapshot = _user_snapshots.get(user_id)
+    if snapshot is not None:
+        return snapshot
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM guides")
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        row = await _fetch_one(
+            db,
+            "SELECT (SELECT is_approved FROM guides WHERE user_id = ?) AS guide_approved, "
+            "(SELECT COUNT(*) FROM bookings WHERE user_id = ?) AS bookings_count",
+            (user_id, user_id)
+        )
+    snapshot = {
+        "is_guide": row["guide_approved"] is not None,
+        "is_approved_guide": bool(row["guide_approved"]),
+        "bookings_count": row["bookings_count"],
+    }
+    if len(_user_snapshots) >= USER_SNAPSHOT_CACHE_SIZE:
+        # Вытесняем самую старую запись
+        _user_snapshots.pop(next(iter(_user_snapshots)))
+    _user_snapshots[user_id] = snapshot
+    return snapshot
+
+def get_admin_ids() -> List[int]:
+    """Возвращает список ID администраторов из настройки ADMIN_IDS."""
+    return list(get_config().admin_ids)
+
+async def get_guides_page(page: int = 0, page_size: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+    """Возвращает страницу гидов (сначала ожидающие одобрения) и общее число гидов из снимка базы."""
+    async with await _connect_snapshot() as db:
+        total = await _fetch_value(db, "SELECT COUNT(*) FROM guides")
+        rows = await _fetch_all(
+            db,
+            "SELECT * FROM guides ORDER BY is_approved, user_id LIMIT ? OFFSET ?",
+            (page_size, page * page_size)
+        )
+        return rows, total
 
 async def get_guide(user_id: int) -> Dict[str, Any]:
     """Возвращает информацию о гиде по его ID."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM guides WHERE user_id = ?", (user_id,))
-        row = await cursor.fetchone()
-        if row:
-            columns = [description[0] for description in cursor.description]
-            return dict(zip(columns, row))
-        return {}
+        return await _fetch_one(db, "SELECT * FROM guides WHERE user_id = ?", (user_id,))
 
 async def register_guide(user_id: int, first_name: str = "", last_name: str = "", city: str = "", description: str = "", experience: int = 0) -> None:
     """Регистрирует нового гида."""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute(
+        await _execute(
+            db,
             "INSERT INTO guides (user_id, first_name, last_name, city, description, experience) VALUES (?, ?, ?, ?, ?, ?)",
             (user_id, first_name, last_name, city, description, experience)
         )
         await db.commit()
+    invalidate_user_snapshot(user_id)
+    invalidate_guide(user_id)
 
-async def approve_guide(user_id: int) -> None:
-    """Одобряет гида."""
+async def approve_guides(user_ids: Sequence[int]) -> List[int]:
+    """Одобряет группу гидов одним выражением и возвращает ID тех, что ещё ожидали одобрения."""
+    if not user_ids:
+        return []
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("UPDATE guides SET is_approved = 1 WHERE user_id = ?", (user_id,))
+        rows = await _fetch_all(
+            db,
+            f"UPDATE guides SET is_approved = 1 WHERE is_approved = 0 "
+            f"AND user_id IN ({', '.join('?' * len(user_ids))}) RETURNING user_id",
+            list(user_ids)
+        )
         await db.commit()
-
-async def get_excursions() -> List[Dict[str, Any]]:
-    """Возвращает список всех маршрутов."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM excursions WHERE is_approved = 1")
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+    approved = sorted(row["user_id"] for row in rows)
+    for user_id in approved:
+        invalidate_user_snapshot(user_id)
+        invalidate_guide(user_id)
+    return approved
 
 async def get_pending_excursions() -> List[Dict[str, Any]]:
     """Возвращает список маршрутов, ожидающих модерации."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM excursions WHERE is_approved = 0")
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
-
-async def get_excursions_by_guide(guide_id: int) -> List[Dict[str, Any]]:
-    """Возвращает маршруты конкретного гида."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM excursions WHERE guide_id = ? AND is_approved = 1", (guide_id,))
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        return await _fetch_all(db, "SELECT * FROM excursions WHERE is_approved = 0")
 
 async def get_excursion(excursion_id: int) -> Dict[str, Any]:
     """Возвращает информацию о маршруте по его ID."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM excursions WHERE id = ?", (excursion_id,))
-        row = await cursor.fetchone()
-        if row:
-            columns = [description[0] for description in cursor.description]
-            return dict(zip(columns, row))
-        return {}
-
-async def get_excursion_locations(excursion_id: int) -> Dict[str, float]:
-    """Возвращает координаты начальной точки маршрута."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT start_location_lat, start_location_lon FROM excursions WHERE id = ?", (excursion_id,))
-        row = await cursor.fetchone()
-        if row:
-            return {"lat": row[0], "lon": row[1]}
-        return {}
-
-async def add_excursion(guide_id: int, title: str, city: str, theme: str, description: str, price: int, dates: List[str], keywords: str = "", start_location_lat: float = 0.0, start_location_lon: float = 0.0) -> int:
-    """Добавляет новый маршрут."""
+        return await _fetch_one(db, "SELECT * FROM excursions WHERE id = ?", (excursion_id,))
+
+async def add_excursion(guide_id: int, title: str, city: str, theme: str, description: str, price: int, dates: List[str], keywords: str = "", start_location_lat: float = 0.0, start_location_lon: float = 0.0, capacity: int = 0) -> int:
+    """Добавляет новый маршрут; город приводится к записи справочника."""
+    city_row = await resolve_city(city, start_location_lat or None, start_location_lon or None)
+    if city_row is not None:
+        city = city_row.name
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "INSERT INTO excursions (guide_id, title, city, theme, description, price, dates, keywords, start_location_lat, start_location_lon) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (guide_id, title, city, theme, description, price, ",".join(dates), keywords, start_location_lat, start_location_lon)
+        cursor = await _execute(
+            db,
+            "INSERT INTO excursions (guide_id, title, city, city_id, theme, description, price, dates, keywords, start_location_lat, start_location_lon, created_at, capacity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (guide_id, title, city, city_row.id if city_row else None, theme, description, price, ",".join(dates), keywords, start_location_lat, start_location_lon, datetime.now().isoformat(), capacity)
+        )
+        excursion_id = cursor.lastrowid
+        await db.executemany(
+            "INSERT OR IGNORE INTO excursion_dates (date, excursion_id) VALUES (?, ?)",
+            [(normalize_date(date), excursion_id) for date in dates if date.strip()]
         )
         await db.commit()
-        return cursor.lastrowid
+    invalidate_guide_dashboard(guide_id)
+    return excursion_id
 
-async def approve_excursion(excursion_id: int) -> None:
-    """Одобряет маршрут."""
+# Значение is_approved для отклонённых модератором маршрутов
+EXCURSION_REJECTED = -1
+
+async def get_pending_excursions_page(page: int = 0, page_size: int = 10) -> Tuple[List[Dict[str, Any]], int]:
+    """Возвращает страницу очереди модерации и общее число маршрутов в очереди."""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("UPDATE excursions SET is_approved = 1 WHERE id = ?", (excursion_id,))
+        total = await _fetch_value(db, "SELECT COUNT(*) FROM excursions WHERE is_approved = 0")
+        rows = await _fetch_all(
+            db,
+            "SELECT * FROM excursions WHERE is_approved = 0 ORDER BY id LIMIT ? OFFSET ?",
+            (page_size, page * page_size)
+        )
+        return rows, total
+
+async def _moderate_excursions(excursion_ids: Sequence[int], status: int) -> List[int]:
+    """Меняет статус группы маршрутов из очереди модерации одним выражением.
+
+    Условие is_approved = 0 проверяется в самом UPDATE, а RETURNING отдаёт
+    ровно те маршруты, которые оно изменило: если два модератора одобряют
+    один маршрут одновременно, он засчитывается только одному из них.
+    """
+    if not excursion_ids:
+        return []
+    async with aiosqlite.connect(DB_NAME) as db:
+        rows = await _fetch_all(
+            db,
+            f"UPDATE excursions SET is_approved = ? WHERE is_approved = 0 "
+            f"AND id IN ({', '.join('?' * len(excursion_ids))}) RETURNING id",
+            [status, *excursion_ids]
+        )
         await db.commit()
+    moderated = sorted(row["id"] for row in rows)
+    for excursion_id in moderated:
+        invalidate_excursion(excursion_id)
+        _invalidate_excursion_dashboard(excursion_id)
+    return moderated
 
-async def get_stats() -> Dict[str, int]:
-    """Возвращает статистику."""
+async def approve_excursions(excursion_ids: Sequence[int]) -> List[int]:
+    """Одобряет группу маршрутов и возвращает ID тех, что ещё ожидали модерации."""
+    return await _moderate_excursions(excursion_ids, 1)
+
+async def reject_excursions(excursion_ids: Sequence[int]) -> List[int]:
+    """Отклоняет группу маршрутов и возвращает ID тех, что ещё ожидали модерации."""
+    return await _moderate_excursions(excursion_ids, EXCURSION_REJECTED)
+
+# Выборка маршрута вместе с полями гида, нужными для карточки (см. cards.render_card)
+_EXCURSION_CARD_COLUMNS = (
+    "e.*, g.first_name AS guide_first_name, g.last_name AS guide_last_name, "
+    "g.rating AS guide_rating, g.review_count AS guide_review_count"
+)
+EXCURSION_CARD_SELECT = (
+    f"SELECT {_EXCURSION_CARD_COLUMNS} "
+    "FROM excursions e LEFT JOIN guides g ON g.user_id = e.guide_id"
+)
+
+async def get_excursion_card(excursion_id: int) -> Dict[str, Any]:
+    """Возвращает маршрут вместе с полями гида для отрисовки карточки."""
+    async with aiosqlite.connect(DB_NAME) as db:
+        return await _fetch_one(db, f"{EXCURSION_CARD_SELECT} WHERE e.id = ?", (excursion_id,))
+
+@dataclass
+class ExcursionFilter:
+    """Набор условий поиска маршрутов; пустые поля не участвуют в запросе.
+
+    Даты задаются в формате ГГГГ-ММ-ДД, граница date_to включается целиком.
+    """
+    city: Optional[str] = None
+    theme: Optional[str] = None
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    min_rating: Optional[float] = None
+    text: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ExcursionFilter":
+        """Восстанавливает фильтр из словаря, сохранённого в FSM."""
+        names = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in (data or {}).items() if key in names})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Возвращает фильтр в виде словаря для хранения в FSM."""
+        return asdict(self)
+
+    def is_empty(self) -> bool:
+        """Проверяет, что не задано ни одного условия."""
+        return all(value in (None, "") for value in asdict(self).values())
+
+    def compile(self, limit: int, offset: int = 0) -> Tuple[str, List[Any]]:
+        """Собирает один параметризованный запрос для выборки страницы маршрутов."""
+        conditions = ["e.is_approved = 1"]
+        params: List[Any] = []
+        if self.city:
+            # Город ищется в справочнике в памяти; для неизвестного города city_id = NULL не совпадёт ни с чем
+            conditions.append("e.city_id = ?")
+            params.append(get_city_id(self.city))
+        if self.theme:
+            conditions.append("e.theme = ?")
+            params.append(self.theme)
+        if self.price_min is not None:
+            conditions.append("e.price >= ?")
+            params.append(self.price_min)
+        if self.price_max is not None:
+            conditions.append("e.price <= ?")
+            params.append(self.price_max)
+        if self.date_from or self.date_to:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM excursion_dates d WHERE d.excursion_id = e.id AND d.date >= ? AND d.date <= ?)"
+            )
+            params.append(self.date_from or "")
+            params.append(f"{self.date_to}T23:59:59" if self.date_to else "9999")
+        if self.min_rating is not None:
+            conditions.append("g.rating >= ?")
+            params.append(self.min_rating)
+        if self.text:
+            terms = " ".join(f'"{term}"*' for term in self.text.replace('"', " ").split())
+            if terms:
+                conditions.append("e.id IN (SELECT rowid FROM excursions_fts WHERE excursions_fts MATCH ?)")
+                params.append(terms)
+        sql = f"{EXCURSION_CARD_SELECT} WHERE {' AND '.join(conditions)} ORDER BY e.score DESC, e.id LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        return sql, params
+
+async def search_excursions(excursion_filter: ExcursionFilter, page: int = 0, page_size: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+    """Возвращает страницу маршрутов по фильтру и признак наличия следующей страницы."""
+    sql, params = excursion_filter.compile(page_size + 1, page * page_size)
+    async with aiosqlite.connect(DB_NAME) as db:
+        rows = await _fetch_all(db, sql, params)
+    return rows[:page_size], len(rows) > page_size
+
+async def get_top_excursions(limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+    """Возвращает одобренные маршруты с наибольшей оценкой, читая индекс оценок по порядку.
+
+    Ещё не оценённые маршруты имеют оценку 0 и попадают в конец выдачи.
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        return await _fetch_all(
+            db,
+            f"{EXCURSION_CARD_SELECT} WHERE e.is_approved = 1 ORDER BY e.score DESC, e.id LIMIT ? OFFSET ?",
+            (limit, offset)
+        )
+
+async def get_score_inputs(since: str, excursion_ids: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """Возвращает данные для оценки одобренных маршрутов: рейтинги и число бронирований с момента since."""
+    sql = (
+        "SELECT e.id, e.created_at, e.rating, e.review_count, "
+        "g.rating AS guide_rating, g.review_count AS guide_review_count, "
+        "(SELECT COUNT(*) FROM bookings b WHERE b.excursion_id = e.id AND b.created_at >= ?) AS recent_bookings "
+        "FROM excursions e LEFT JOIN guides g ON g.user_id = e.guide_id WHERE e.is_approved = 1"
+    )
+    params: List[Any] = [since]
+    if excursion_ids is not None:
+        if not excursion_ids:
+            return []
+        sql += f" AND e.id IN ({', '.join('?' * len(excursion_ids))})"
+        params.extend(excursion_ids)
+    async with aiosqlite.connect(DB_NAME) as db:
+        return await _fetch_all(db, sql, params)
+
+async def get_changed_excursion_ids(after_booking_id: int, after_review_id: int) -> Tuple[List[int], int, int]:
+    """Возвращает маршруты, оценка которых могла измениться после указанных бронирования и отзыва.
+
+    Вместе с ними возвращаются текущие максимальные ID бронирований и отзывов
+    для следующего инкрементального обновления.
+    """
     async with aiosqlite.connect(DB_NAME) as db:
-        guides_total = await (await db.execute("SELECT COUNT(*) FROM guides")).fetchone()
-        guides_approved = await (await db.execute("SELECT COUNT(*) FROM guides WHERE is_approved = 1")).fetchone()
-        guides_pending = await (await db.execute("SELECT COUNT(*) FROM guides WHERE is_approved = 0")).fetchone()
-        excursions_total = await (await db.execute("SELECT COUNT(*) FROM excursions")).fetchone()
-        excursions_approved = await (await db.execute("SELECT COUNT(*) FROM excursions WHERE is_approved = 1")).fetchone()
-        excursions_pending = await (await db.execute("SELECT COUNT(*) FROM excursions WHERE is_approved = 0")).fetchone()
-        travelers_total = await (await db.execute("SELECT COUNT(DISTINCT user_id) FROM bookings")).fetchone()
-        requests_total = await (await db.execute("SELECT COUNT(*) FROM requests")).fetchone()
+        max_booking_id = await _fetch_value(db, "SELECT COALESCE(MAX(id), 0) FROM bookings")
+        max_review_id = await _fetch_value(db, "SELECT COALESCE(MAX(id), 0) FROM reviews")
+        rows = await _fetch_all(
+            db,
+            "SELECT excursion_id AS id FROM bookings WHERE id > ? AND id <= ? "
+            "UNION SELECT e.id FROM reviews r JOIN excursions e ON e.guide_id = r.guide_id WHERE r.id > ? AND r.id <= ?",
+            (after_booking_id, max_booking_id, after_review_id, max_review_id)
+        )
+    return [row["id"] for row in rows], max_booking_id, max_review_id
+
+async def save_excursion_scores(scores: Sequence[Tuple[int, float]]) -> None:
+    """Сохраняет оценки маршрутов одной транзакцией очереди записи."""
+    if not scores:
+        return
+    await _write_queue.submit([
+        ("UPDATE excursions SET score = ? WHERE id = ?", (score, excursion_id))
+        for excursion_id, score in scores
+    ])
+
+async def get_user_affinity_sources(user_id: int, requests_limit: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+    """Возвращает маршруты прошлых бронирований и последние заявки пользователя для оценки его интересов."""
+    async with aiosqlite.connect(DB_NAME) as db:
+        bookings = await _fetch_all(
+            db,
+            "SELECT e.city_id, e.theme, e.guide_id FROM bookings b JOIN excursions e ON e.id = b.excursion_id "
+            "WHERE b.user_id = ?",
+            (user_id,)
+        )
+        requests = await _fetch_all(
+            db,
+            "SELECT city_id, keywords FROM requests WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, requests_limit)
+        )
+    return {"bookings": bookings, "requests": requests}
+
+async def get_stats() -> Dict[str, int]:
+    """Возвращает статистику (из снимка базы)."""
+    async with await _connect_snapshot() as db:
+        guides_total = await _fetch_value(db, "SELECT COUNT(*) FROM guides")
+        guides_approved = await _fetch_value(db, "SELECT COUNT(*) FROM guides WHERE is_approved = 1")
+        guides_pending = await _fetch_value(db, "SELECT COUNT(*) FROM guides WHERE is_approved = 0")
+        excursions_total = await _fetch_value(db, "SELECT COUNT(*) FROM excursions")
+        excursions_approved = await _fetch_value(db, "SELECT COUNT(*) FROM excursions WHERE is_approved = 1")
+        excursions_pending = await _fetch_value(db, "SELECT COUNT(*) FROM excursions WHERE is_approved = 0")
+        travelers_total = await _fetch_value(db, "SELECT COUNT(DISTINCT user_id) FROM bookings")
+        requests_total = await _fetch_value(db, "SELECT COUNT(*) FROM requests")
         return {
-            "guides_total": guides_total[0],
-            "guides_approved": guides_approved[0],
-            "guides_pending": guides_pending[0],
-            "excursions_total": excursions_total[0],
-            "excursions_approved": excursions_approved[0],
-            "excursions_pending": excursions_pending[0],
-            "travelers_total": travelers_total[0],
-            "requests_total": requests_total[0]
+            "guides_total": guides_total,
+            "guides_approved": guides_approved,
+            "guides_pending": guides_pending,
+            "excursions_total": excursions_total,
+            "excursions_approved": excursions_approved,
+            "excursions_pending": excursions_pending,
+            "travelers_total": travelers_total,
+            "requests_total": requests_total
         }
 
-async def get_bookings_by_excursion(excursion_id: int) -> List[Dict[str, Any]]:
-    """Возвращает бронирования для маршрута."""
+API_USAGE_COUNTERS = ("calls", "errors", "cache_hits", "fallbacks", "throttled", "latency_ms", "cost")
+
+async def add_api_usage(rows: Sequence[Dict[str, Any]]) -> None:
+    """Прибавляет накопленные счётчики к корзинам api_usage одной транзакцией очереди записи."""
+    if not rows:
+        return
+    columns = ", ".join(API_USAGE_COUNTERS)
+    placeholders = ", ".join("?" for _ in API_USAGE_COUNTERS)
+    updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in API_USAGE_COUNTERS)
+    sql = (
+        f"INSERT INTO api_usage (endpoint, bucket, {columns}) VALUES (?, ?, {placeholders}) "
+        f"ON CONFLICT (endpoint, bucket) DO UPDATE SET {updates}"
+    )
+    await _write_queue.submit([
+        (sql, (row["endpoint"], row["bucket"], *(row[name] for name in API_USAGE_COUNTERS)))
+        for row in rows
+    ])
+
+async def get_api_usage(since: str) -> List[Dict[str, Any]]:
+    """Возвращает суммы счётчиков api_usage по эндпоинтам начиная с корзины since."""
+    sums = ", ".join(f"SUM({name}) AS {name}" for name in API_USAGE_COUNTERS)
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM bookings WHERE excursion_id = ?", (excursion_id,))
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        return await _fetch_all(
+            db,
+            f"SELECT endpoint, {sums} FROM api_usage WHERE bucket >= ? GROUP BY endpoint ORDER BY endpoint",
+            (since,)
+        )
+
+# Сколько последних отзывов показывать в кабинете гида
+DASHBOARD_REVIEWS_LIMIT = 5
+
+def invalidate_guide_dashboard(guide_id: int) -> None:
+    """Сбрасывает кэшированный кабинет гида вместе с его записями в обратной карте."""
+    cached = _guide_dashboards.pop(guide_id, None)
+    if cached is None:
+        return
+    for excursion in cached[1]["excursions"]:
+        if _dashboard_excursions.get(excursion["id"]) == guide_id:
+            del _dashboard_excursions[excursion["id"]]
+
+def _invalidate_excursion_dashboard(excursion_id: int) -> None:
+    """Сбрасывает кабинет гида, которому принадлежит маршрут, если кабинет закэширован."""
+    guide_id = _dashboard_excursions.get(excursion_id)
+    if guide_id is not None:
+        invalidate_guide_dashboard(guide_id)
+
+async def get_guide_dashboard(guide_id: int) -> Dict[str, Any]:
+    """Возвращает кабинет гида: маршруты с бронированиями по датам, рейтинг и последние отзывы.
+
+    Бронирования по всем маршрутам и датам считаются одним сгруппированным запросом;
+    результат кэшируется до нового бронирования, отзыва или изменения маршрутов гида.
+    """
+    cached = _guide_dashboards.get(guide_id)
+    if cached is not None:
+        if time.monotonic() - cached[0] < GUIDE_DASHBOARD_TTL_SECONDS:
+            # Переносим кабинет в конец порядка вытеснения
+            _guide_dashboards[guide_id] = _guide_dashboards.pop(guide_id)
+            return cached[1]
+        invalidate_guide_dashboard(guide_id)
+    async with aiosqlite.connect(DB_NAME) as db:
+        guide = await _fetch_one(db, "SELECT rating, review_count FROM guides WHERE user_id = ?", (guide_id,))
+        rows = await _fetch_all(
+            db,
+            "SELECT e.id, e.title, e.is_approved, e.capacity, e.rating, e.review_count, "
+            "d.date AS session_date, COUNT(b.id) AS booked "
+            "FROM excursions e "
+            "LEFT JOIN excursion_dates d ON d.excursion_id = e.id "
+            "LEFT JOIN bookings b ON b.excursion_id = e.id AND b.session_date = d.date "
+            "WHERE e.guide_id = ? GROUP BY e.id, d.date ORDER BY e.id, d.date",
+            (guide_id,)
+        )
+        reviews = await _fetch_all(
+            db,
+            "SELECT r.rating, r.comment, r.created_at, e.title FROM reviews r "
+            "LEFT JOIN excursions e ON e.id = r.excursion_id "
+            "WHERE r.guide_id = ? ORDER BY r.id DESC LIMIT ?",
+            (guide_id, DASHBOARD_REVIEWS_LIMIT)
+        )
+    excursions: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        excursion = excursions.get(row["id"])
+        if excursion is None:
+            excursion = excursions[row["id"]] = {
+                "id": row["id"],
+                "title": row["title"],
+                "is_approved": row["is_approved"],
+                "capacity": row["capacity"] or 0,
+                "rating": row["rating"] or 0.0,
+                "review_count": row["review_count"] or 0,
+                "total_bookings": 0,
+                "sessions": [],
+            }
+        if row["session_date"] is not None:
+            excursion["sessions"].append({"date": row["session_date"], "booked": row["booked"]})
+            excursion["total_bookings"] += row["booked"]
+    dashboard = {
+        "rating": guide.get("rating") or 0.0,
+        "review_count": guide.get("review_count") or 0,
+        "excursions": list(excursions.values()),
+        "reviews": reviews,
+    }
+    # Кабинет мог быть сброшен и собран заново, пока шли запросы
+    invalidate_guide_dashboard(guide_id)
+    while len(_guide_dashboards) >= GUIDE_DASHBOARD_CACHE_SIZE:
+        invalidate_guide_dashboard(next(iter(_guide_dashboards)))
+    for excursion_id in excursions:
+        _dashboard_excursions[excursion_id] = guide_id
+    _guide_dashboards[guide_id] = (time.monotonic(), dashboard)
+    return dashboard
 
 async def get_bookings_by_user(user_id: int) -> List[Dict[str, Any]]:
     """Возвращает бронирования пользователя."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM bookings WHERE user_id = ?", (user_id,))
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        return await _fetch_all(db, "SELECT * FROM bookings WHERE user_id = ?", (user_id,))
+
+async def get_user_bookings_with_excursions(user_id: int) -> List[Dict[str, Any]]:
+    """Возвращает бронирования пользователя вместе с маршрутом и гидом одним запросом."""
+    async with aiosqlite.connect(DB_NAME) as db:
+        return await _fetch_all(
+            db,
+            "SELECT b.id AS booking_id, b.created_at AS booked_at, b.status, c.* "
+            f"FROM bookings b JOIN ({EXCURSION_CARD_SELECT}) c ON c.id = b.excursion_id "
+            "WHERE b.user_id = ? ORDER BY b.id",
+            (user_id,)
+        )
 
 async def get_booking(booking_id: int) -> Dict[str, Any]:
     """Возвращает информацию о бронировании по его ID."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM bookings WHERE id = ?", (booking_id,))
-        row = await cursor.fetchone()
-        if row:
-            columns = [description[0] for description in cursor.description]
-            return dict(zip(columns, row))
-        return {}
+        return await _fetch_one(db, "SELECT * FROM bookings WHERE id = ?", (booking_id,))
 
 async def book_excursion(user_id: int, excursion_id: int) -> int:
-    """Создаёт бронирование."""
+    """Создаёт бронирование на ближайшую дату маршрута."""
+    now = datetime.now()
+    booking_id = await _write_queue.execute(
+        "INSERT INTO bookings (user_id, excursion_id, created_at, status, session_date) VALUES (?, ?, ?, ?, "
+        "(SELECT MIN(date) FROM excursion_dates WHERE excursion_id = ? AND date >= ?))",
+        (user_id, excursion_id, now.isoformat(), "Подтверждено", excursion_id, now.date().isoformat())
+    )
+    invalidate_user_snapshot(user_id)
+    _invalidate_excursion_dashboard(excursion_id)
+    return booking_id
+
+# Дата сеанса бронирования; у старых бронирований без неё — первая дата маршрута после оформления
+_BOOKING_SESSION = (
+    "COALESCE(b.session_date, (SELECT MIN(first.date) FROM excursion_dates first "
+    "WHERE first.excursion_id = b.excursion_id AND first.date >= substr(b.created_at, 1, 10)))"
+)
+
+# Поля, которые нужны для сборки напоминания о бронировании
+_REMINDER_COLUMNS = (
+    "b.id AS booking_id, b.user_id, e.id AS excursion_id, e.title, "
+    "e.start_location_lat AS lat, e.start_location_lon AS lon, d.date AS start_time"
+)
+
+async def get_reminder_targets(window_start: datetime, window_end: datetime) -> List[Dict[str, Any]]:
+    """Возвращает бронирования на сеансы, начинающиеся в заданном окне, о которых ещё не напоминали.
+
+    Бронированию без даты сеанса напоминают о первой дате маршрута после оформления.
+    """
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "INSERT INTO bookings (user_id, excursion_id, created_at, status) VALUES (?, ?, ?, ?)",
-            (user_id, excursion_id, datetime.now().isoformat(), "Подтверждено")
+        return await _fetch_all(
+            db,
+            f"SELECT {_REMINDER_COLUMNS} FROM excursion_dates d "
+            "JOIN excursions e ON e.id = d.excursion_id "
+            f"JOIN bookings b ON b.excursion_id = d.excursion_id AND d.date = {_BOOKING_SESSION} "
+            "WHERE d.date >= ? AND d.date < ? AND (b.reminded_for IS NULL OR b.reminded_for != d.date) "
+            "ORDER BY d.date",
+            (window_start.isoformat(), window_end.isoformat())
         )
-        await db.commit()
-        return cursor.lastrowid
 
-async def get_reviews_by_guide(guide_id: int) -> List[Dict[str, Any]]:
-    """Возвращает отзывы о гиде."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM reviews WHERE guide_id = ?", (guide_id,))
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+async def add_reminders(notifications: Sequence[Tuple[int, str, str]], reminded: Sequence[Tuple[int, str]]) -> None:
+    """Добавляет напоминания и отмечает бронирования (booking_id, дата) одной транзакцией."""
+    if not notifications and not reminded:
+        return
+    created_at = datetime.now().isoformat()
+    await _write_queue.submit(
+        [("INSERT INTO notifications (user_id, message, created_at, kind) VALUES (?, ?, ?, ?)",
+          (user_id, message, created_at, kind)) for user_id, message, kind in notifications]
+        + [("UPDATE bookings SET reminded_for = ? WHERE id = ?", (date, booking_id)) for booking_id, date in reminded]
+    )
+
+async def get_reviewable_bookings(user_id: int, now: datetime) -> List[Dict[str, Any]]:
+    """Возвращает прошедшие бронирования пользователя без отзыва вместе с маршрутом и гидом одним запросом.
 
-async def add_review(user_id: int, guide_id: int, rating: int, comment: str) -> None:
-    """Добавляет отзыв о гиде."""
+    Бронирование считается прошедшим, если наступила дата его сеанса; у бронирований
+    без даты сеанса — первая дата маршрута после оформления.
+    """
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute(
-            "INSERT INTO reviews (user_id, guide_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)",
-            (user_id, guide_id, rating, comment, datetime.now().isoformat())
+        return await _fetch_all(
+            db,
+            "SELECT b.id AS booking_id, e.id AS excursion_id, e.title, e.guide_id, "
+            f"g.first_name AS guide_first_name, g.last_name AS guide_last_name, {_BOOKING_SESSION} AS session_date "
+            "FROM bookings b "
+            "JOIN excursions e ON e.id = b.excursion_id "
+            "LEFT JOIN guides g ON g.user_id = e.guide_id "
+            "LEFT JOIN reviews r ON r.booking_id = b.id "
+            f"WHERE b.user_id = ? AND {_BOOKING_SESSION} <= ? AND r.id IS NULL "
+            "ORDER BY b.id DESC",
+            (user_id, now.isoformat())
         )
-        await db.commit()
 
-async def get_requests() -> List[Dict[str, Any]]:
-    """Возвращает список заявок."""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM requests")
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+# Инкрементальное обновление среднего: новое = (старое * n + оценка) / (n + 1)
+_RATING_AGGREGATE_UPDATE = (
+    "UPDATE {table} SET rating = (rating * review_count + ?) / (review_count + 1), "
+    "review_count = review_count + 1 WHERE {key} = ?"
+)
+
+async def add_review(user_id: int, booking_id: int, excursion_id: int, guide_id: int, rating: int, comment: str) -> int:
+    """Добавляет отзыв по бронированию и в той же транзакции обновляет рейтинги маршрута и гида.
+
+    Повторный отзыв на то же бронирование отклоняется уникальным индексом (sqlite3.IntegrityError).
+    """
+    review_id = await _write_queue.submit([
+        (
+            "INSERT INTO reviews (user_id, guide_id, excursion_id, booking_id, rating, comment, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, guide_id, excursion_id, booking_id, rating, comment, datetime.now().isoformat())
+        ),
+        (_RATING_AGGREGATE_UPDATE.format(table="excursions", key="id"), (rating, excursion_id)),
+        (_RATING_AGGREGATE_UPDATE.format(table="guides", key="user_id"), (rating, guide_id)),
+    ])
+    invalidate_excursion(excursion_id)
+    invalidate_guide(guide_id)
+    invalidate_guide_dashboard(guide_id)
+    return review_id
 
-async def add_request(user_id: int, city: str, keywords: str) -> None:
-    """Добавляет новую заявку."""
+async def add_request(user_id: int, city: str, keywords: str) -> int:
+    """Добавляет новую заявку; город приводится к записи справочника."""
+    city_row = await resolve_city(city)
+    if city_row is not None:
+        city = city_row.name
+    return await _write_queue.execute(
+        "INSERT INTO requests (user_id, city, city_id, keywords, created_at) VALUES (?, ?, ?, ?, ?)",
+        (user_id, city, city_row.id if city_row else None, keywords, datetime.now().isoformat())
+    )
+
+# Виды подписок: на гида (target — ID гида), город (target — ID города) и тему (тематика или ключевое слово)
+SUBSCRIPTION_GUIDE = "guide"
+SUBSCRIPTION_CITY = "city"
+SUBSCRIPTION_TOPIC = "topic"
+SUBSCRIPTION_KINDS = (SUBSCRIPTION_GUIDE, SUBSCRIPTION_CITY, SUBSCRIPTION_TOPIC)
+
+def normalize_target(target: str) -> str:
+    """Приводит город или тему к виду, в котором они хранятся в подписках."""
+    return " ".join(str(target).lower().split())
+
+async def subscribe(user_id: int, kind: str, target: str) -> None:
+    """Подписывает пользователя на гида, город или тему; повторная подписка ничего не меняет."""
+    await _write_queue.execute(
+        "INSERT OR IGNORE INTO subscriptions (kind, target, user_id, created_at) VALUES (?, ?, ?, ?)",
+        (kind, normalize_target(target), user_id, datetime.now().isoformat())
+    )
+
+async def unsubscribe(user_id: int, kind: str, target: str) -> None:
+    """Отписывает пользователя от гида, города или темы."""
+    await _write_queue.execute(
+        "DELETE FROM subscriptions WHERE kind = ? AND target = ? AND user_id = ?",
+        (kind, normalize_target(target), user_id)
+    )
+
+async def get_user_subscriptions(user_id: int) -> List[Dict[str, Any]]:
+    """Возвращает подписки пользователя; для подписок на гида и город добавляется их название."""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute(
-            "INSERT INTO requests (user_id, city, keywords, created_at) VALUES (?, ?, ?, ?)",
-            (user_id, city, keywords, datetime.now().isoformat())
+        return await _fetch_all(
+            db,
+            "SELECT s.kind, s.target, g.first_name AS guide_first_name, g.last_name AS guide_last_name, "
+            "c.name AS city_name FROM subscriptions s "
+            "LEFT JOIN guides g ON s.kind = 'guide' AND g.user_id = CAST(s.target AS INTEGER) "
+            "LEFT JOIN cities c ON s.kind = 'city' AND c.id = CAST(s.target AS INTEGER) "
+            "WHERE s.user_id = ? ORDER BY s.kind, s.target",
+            (user_id,)
         )
-        await db.commit()
 
-async def get_subscribers() -> List[int]:
-    """Возвращает список подписчиков."""
+async def _iter_target_subscribers(kind: str, target: str, chunk_size: int) -> AsyncIterator[List[int]]:
+    """Отдаёт подписчиков одной цели по возрастанию ID пачками (пагинация по ключу, без OFFSET)."""
+    last_user_id = 0
+    while True:
+        async with aiosqlite.connect(DB_NAME) as db:
+            rows = await _fetch_all(
+                db,
+                "SELECT user_id FROM subscriptions WHERE kind = ? AND target = ? AND user_id > ? "
+                "ORDER BY user_id LIMIT ?",
+                (kind, target, last_user_id, chunk_size)
+            )
+        if not rows:
+            return
+        chunk = [row["user_id"] for row in rows]
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_user_id = chunk[-1]
+
+async def iter_subscribers(targets: Sequence[Tuple[str, str]], chunk_size: int = 1000) -> AsyncIterator[List[int]]:
+    """Отдаёт пачками подписчиков любой из целей без повторов.
+
+    Потоки подписчиков каждой цели упорядочены по ID, поэтому они сливаются
+    как отсортированные списки: в памяти одновременно не больше одной пачки
+    на цель, сколько бы подписчиков ни было.
+    """
+    streams = [
+        _iter_target_subscribers(kind, target, chunk_size)
+        for kind, target in dict.fromkeys((kind, normalize_target(target)) for kind, target in targets)
+    ]
+    buffers: List[List[int]] = [[] for _ in streams]
+    positions = [0] * len(streams)
+    heap: List[Tuple[int, int]] = []
+
+    async def advance(index: int) -> None:
+        """Кладёт в кучу следующий ID потока, при необходимости подгружая новую пачку."""
+        if positions[index] >= len(buffers[index]):
+            buffers[index] = await anext(streams[index], [])
+            positions[index] = 0
+            if not buffers[index]:
+                return
+        heapq.heappush(heap, (buffers[index][positions[index]], index))
+        positions[index] += 1
+
+    for index in range(len(streams)):
+        await advance(index)
+    chunk: List[int] = []
+    last_user_id = None
+    while heap:
+        user_id, index = heapq.heappop(heap)
+        if user_id != last_user_id:
+            chunk.append(user_id)
+            last_user_id = user_id
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        await advance(index)
+    if chunk:
+        yield chunk
+
+async def add_notification(user_id: int, message: str, kind: str = "general") -> int:
+    """Добавляет новое уведомление указанного типа."""
+    return await _write_queue.execute(
+        "INSERT INTO notifications (user_id, message, created_at, kind) VALUES (?, ?, ?, ?)",
+        (user_id, message, datetime.now().isoformat(), kind)
+    )
+
+async def add_notifications(notifications: Sequence[Tuple[int, str, str]]) -> None:
+    """Добавляет группу уведомлений (user_id, message, kind) одной транзакцией."""
+    if not notifications:
+        return
+    created_at = datetime.now().isoformat()
+    await _write_queue.submit([
+        ("INSERT INTO notifications (user_id, message, created_at, kind) VALUES (?, ?, ?, ?)",
+         (user_id, message, created_at, kind))
+        for user_id, message, kind in notifications
+    ])
+
+async def get_ready_notification_groups(
+    default_cutoff: str, mode_cutoffs: Dict[str, str], kind_cutoffs: Dict[str, str],
+    after: Tuple[int, str], limit: int
+) -> List[Dict[str, Any]]:
+    """Возвращает страницу групп (получатель, тип), чьё старейшее неотправленное уведомление не новее порога.
+
+    Порог выбирается по типу (kind_cutoffs), затем по режиму доставки получателя
+    (mode_cutoffs), иначе default_cutoff. Страницы идут по ключу (user_id, kind)
+    после after, поэтому накопленные группы не загружаются целиком.
+    """
+    cases = [("n.kind = ?", kind, cutoff) for kind, cutoff in kind_cutoffs.items()]
+    cases += [("COALESCE(p.mode, 'instant') = ?", mode, cutoff) for mode, cutoff in mode_cutoffs.items()]
+    cutoff_sql = "CASE " + " ".join(f"WHEN {condition} THEN ?" for condition, _, _ in cases) + " ELSE ? END"
+    cutoff_params = [value for _, key, cutoff in cases for value in (key, cutoff)] + [default_cutoff]
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT user_id FROM subscribers")
-        rows = await cursor.fetchall()
-        return [row[0] for row in rows]
+        return await _fetch_all(
+            db,
+            "SELECT n.user_id, n.kind FROM notifications n "
+            "LEFT JOIN notification_preferences p ON p.user_id = n.user_id "
+            "WHERE n.is_sent = 0 AND (n.user_id, n.kind) > (?, ?) "
+            f"GROUP BY n.user_id, n.kind HAVING MIN(n.created_at) <= {cutoff_sql} "
+            "ORDER BY n.user_id, n.kind LIMIT ?",
+            (*after, *cutoff_params, limit)
+        )
 
-async def get_subscribers_for_excursion(guide_id: int, city: str, keywords: str) -> List[Dict[str, Any]]:
-    """Возвращает подписчиков, которые могут быть заинтересованы в маршруте."""
+async def get_group_notifications(user_id: int, kind: str, limit: int) -> List[Dict[str, Any]]:
+    """Возвращает старейшие неотправленные уведомления получателя одного типа."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "SELECT * FROM subscribers WHERE guide_id = ? OR city = ? OR keywords LIKE ?",
-            (guide_id, city, f"%{keywords}%")
+        return await _fetch_all(
+            db,
+            "SELECT id, message FROM notifications WHERE user_id = ? AND kind = ? AND is_sent = 0 ORDER BY id LIMIT ?",
+            (user_id, kind, limit)
         )
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
 
-async def add_notification(user_id: int, message: str) -> None:
-    """Добавляет новое уведомление."""
+async def mark_notifications_as_sent(notification_ids: Sequence[int]) -> None:
+    """Помечает группу уведомлений как отправленные одним запросом."""
+    if not notification_ids:
+        return
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute(
-            "INSERT INTO notifications (user_id, message, created_at) VALUES (?, ?, ?)",
-            (user_id, message, datetime.now().isoformat())
+        await _execute(
+            db,
+            f"UPDATE notifications SET is_sent = 1 WHERE id IN ({', '.join('?' * len(notification_ids))})",
+            list(notification_ids)
         )
         await db.commit()
 
-async def get_pending_notifications() -> List[Dict[str, Any]]:
-    """Возвращает список неотправленных уведомлений."""
+# Значение is_sent для уведомлений, которые так и не удалось доставить
+NOTIFICATION_FAILED = 2
+
+async def record_notification_failure(notification_ids: Sequence[int], max_attempts: int, permanent: bool = False) -> None:
+    """Учитывает неудачную попытку доставки; исчерпавшие попытки уведомления помечаются недоставленными.
+
+    permanent — ошибка не пройдёт при повторе (бот заблокирован), попытки сразу считаются исчерпанными.
+    """
+    if not notification_ids:
+        return
+    placeholders = ", ".join("?" * len(notification_ids))
+    if permanent:
+        await _write_queue.execute(
+            f"UPDATE notifications SET attempts = ?, is_sent = {NOTIFICATION_FAILED} WHERE id IN ({placeholders})",
+            (max_attempts, *notification_ids)
+        )
+        return
+    # В выражениях UPDATE attempts — значение до обновления
+    await _write_queue.execute(
+        f"UPDATE notifications SET attempts = attempts + 1, "
+        f"is_sent = CASE WHEN attempts + 1 >= ? THEN {NOTIFICATION_FAILED} ELSE 0 END WHERE id IN ({placeholders})",
+        (max_attempts, *notification_ids)
+    )
+
+async def get_notification_mode(user_id: int) -> str:
+    """Возвращает режим доставки уведомлений пользователя."""
     async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT * FROM notifications WHERE is_sent = 0")
-        rows = await cursor.fetchall()
-        columns = [description[0] for description in cursor.description]
-        return [dict(zip(columns, row)) for row in rows]
+        mode = await _fetch_value(db, "SELECT mode FROM notification_preferences WHERE user_id = ?", (user_id,))
+        return mode or "instant"
 
-async def mark_notification_as_sent(notification_id: int) -> None:
-    """Помечает уведомление как отправленное."""
+async def set_notification_mode(user_id: int, mode: str) -> None:
+    """Сохраняет режим доставки уведомлений пользователя."""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("UPDATE notifications SET is_sent = 1 WHERE id = ?", (notification_id,))
+        await _execute(
+            db,
+            "INSERT INTO notification_preferences (user_id, mode) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET mode = excluded.mode",
+            (user_id, mode)
+        )
         await db.commit()
+
+async def archive_rows(table: str, condition: str, params: Sequence[Any], batch_size: int) -> int:
+    """Переносит одну пачку строк, подходящих под условие, в сжатый архив.
+
+    Пачка выбирается, архивируется и удаляется в одной короткой транзакции,
+    чтобы не задерживать остальные записи. Возвращает число перенесённых строк.
+    """
+    async with aiosqlite.connect(DB_NAME, isolation_level=None) as db:
+        await db.execute("PRAGMA busy_timeout = 5000")
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = await _fetch_all(
+                db,
+                f"SELECT * FROM {table} WHERE {condition} ORDER BY id LIMIT ?",
+                (*params, batch_size)
+            )
+            if not rows:
+                await db.execute("COMMIT")
+                return 0
+            payload = zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8"))
+            await _execute(
+                db,
+                "INSERT INTO archive_batches (source_table, first_id, last_id, row_count, archived_at, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (table, rows[0]["id"], rows[-1]["id"], len(rows), datetime.now().isoformat(), payload)
+            )
+            ids = [row["id"] for row in rows]
+            await _execute(db, f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+            await db.execute("COMMIT")
+        except Exception:
+            await db.execute("ROLLBACK")
+            raise
+    # Кэшированные счётчики пользователей и панели гидов учитывали перенесённые строки
+    for user_id in {row["user_id"] for row in rows if row.get("user_id") is not None}:
+        invalidate_user_snapshot(user_id)
+    for excursion_id in {row["excursion_id"] for row in rows if row.get("excursion_id") is not None}:
+        _invalidate_excursion_dashboard(excursion_id)
+    for guide_id in {row["guide_id"] for row in rows if row.get("guide_id") is not None}:
+        invalidate_guide_dashboard(guide_id)
+    return len(rows)
+
+async def get_archived_rows(source_table: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Возвращает строки из последних архивных пачек таблицы."""
+    async with aiosqlite.connect(DB_NAME) as db:
+        batches = await _fetch_all(
+            db,
+            "SELECT payload FROM archive_batches WHERE source_table = ? ORDER BY id DESC LIMIT ?",
+            (source_table, limit)
+        )
+    rows: List[Dict[str, Any]] = []
+    for batch in batches:
+        rows.extend(json.loads(zlib.decompress(batch["payload"]).decode("utf-8")))
+    return rows
+
+def _write_rows_csv(rows: List[Dict[str, Any]], path: str) -> None:
+    """Записывает строки в CSV; столбцы — объединение полей всех строк (схема могла меняться между пачками)."""
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(path, "w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+async def export_archived_rows(source_table: str, path: str, limit: int = 10) -> int:
+    """Выгружает строки последних limit архивных пачек таблицы в CSV-файл path и возвращает их число."""
+    rows = await get_archived_rows(source_table, limit)
+    if rows:
+        await asyncio.to_thread(_write_rows_csv, rows, path)
+    return len(rows)
+
+async def compact_database(vacuum_pages: int) -> None:
+    """Возвращает освободившиеся страницы файлу базы и обновляет статистику планировщика."""
+    async with aiosqlite.connect(DB_NAME) as db:
+        # Через execute() выполняется лишь первый шаг incremental_vacuum (одна страница);
+        # executescript() доводит прагму до конца
+        await db.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+        await db.execute("PRAGMA optimize")
@@ -0,0 +1,108 @@
+# digest.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from config import get_config
+from database import (
+    get_ready_notification_groups, get_group_notifications, mark_notifications_as_sent, record_notification_failure
+)
+from constants import DIGEST_TITLES, NOTIFICATION_KIND_REMINDER
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Окна накопления для режимов доставки, в секундах
+MODE_WINDOWS = {"hourly": 3600, "daily": 86400}
+
+# Типы, которые не копятся: напоминание бесполезно, если пришло позже начала экскурсии
+IMMEDIATE_KINDS = {NOTIFICATION_KIND_REMINDER}
+
+# Сколько групп (получатель, тип) читается за запрос и сколько уведомлений группы уходит за проход
+GROUPS_PAGE_SIZE = 500
+GROUP_NOTIFICATIONS_LIMIT = 200
+
+def get_cutoffs(now: datetime) -> Tuple[str, Dict[str, str], Dict[str, str]]:
+    """Возвращает пороги старейшего уведомления группы: по умолчанию, по режимам доставки и по типам."""
+    default_cutoff = now - timedelta(seconds=get_config().digest_instant_window_seconds)
+    mode_cutoffs = {mode: (now - timedelta(seconds=window)).isoformat() for mode, window in MODE_WINDOWS.items()}
+    kind_cutoffs = {kind: now.isoformat() for kind in IMMEDIATE_KINDS}
+    return default_cutoff.isoformat(), mode_cutoffs, kind_cutoffs
+
+def render_digest(kind: str, messages: List[str]) -> List[Tuple[str, int]]:
+    """Собирает уведомления одного типа в сообщения не длиннее MESSAGE_LIMIT.
+
+    Возвращает текст каждого сообщения и число уведомлений в нём (по порядку),
+    чтобы отмечать отправленными только уведомления действительно ушедших сообщений.
+    """
+    if len(messages) == 1:
+        return [(messages[0][:MESSAGE_LIMIT], 1)]
+    title = DIGEST_TITLES.get(kind, DIGEST_TITLES["general"])
+    # Заголовок части не длиннее заголовка со всем числом уведомлений
+    header_length = len(f"{title}: {len(messages)}")
+    chunks: List[List[str]] = [[]]
+    length = 0
+    for message in messages:
+        part = f"\n\n{message}"[:MESSAGE_LIMIT - header_length]
+        if chunks[-1] and header_length + length + len(part) > MESSAGE_LIMIT:
+            chunks.append([])
+            length = 0
+        chunks[-1].append(part)
+        length += len(part)
+    return [(f"{title}: {len(parts)}" + "".join(parts), len(parts)) for parts in chunks]
+
+async def send_group(bot: Bot, user_id: int, kind: str) -> Tuple[int, int]:
+    """Отправляет дайджест одной группы; возвращает число сообщений и доставленных уведомлений."""
+    items = await get_group_notifications(user_id, kind, GROUP_NOTIFICATIONS_LIMIT)
+    sent = delivered = 0
+    try:
+        for text, count in render_digest(kind, [item["message"] for item in items]):
+            await bot.send_message(chat_id=user_id, text=text)
+            # Отмечаем части по мере отправки: при ошибке неотправленные уведомления останутся в очереди
+            await mark_notifications_as_sent([item["id"] for item in items[delivered:delivered + count]])
+            sent += 1
+            delivered += count
+    except Exception as e:
+        logger.error("Ошибка при отправке дайджеста пользователю %s: %s", user_id, e)
+        # Заблокировавшему бота не повторяем, остальным — не больше DIGEST_MAX_ATTEMPTS раз
+        await record_notification_failure(
+            [item["id"] for item in items[delivered:]], get_config().digest_max_attempts,
+            permanent=isinstance(e, TelegramForbiddenError)
+        )
+    return sent, delivered
+
+async def send_digests(bot: Bot) -> int:
+    """Отправляет накопившиеся дайджесты и возвращает число отправленных сообщений.
+
+    Отбор групп с истёкшим окном накопления выполняется в базе постранично,
+    поэтому удерживаемые дайджесты и большие рассылки не читаются каждый проход.
+    """
+    cutoffs = get_cutoffs(datetime.now())
+    sent = delivered = 0
+    after: Tuple[int, str] = (0, "")
+    while True:
+        groups = await get_ready_notification_groups(*cutoffs, after, GROUPS_PAGE_SIZE)
+        for group in groups:
+            group_sent, group_delivered = await send_group(bot, group["user_id"], group["kind"])
+            sent += group_sent
+            delivered += group_delivered
+        if len(groups) < GROUPS_PAGE_SIZE:
+            break
+        after = (groups[-1]["user_id"], groups[-1]["kind"])
+    if sent:
+        logger.info("Отправлено дайджестов: %s (уведомлений: %s)", sent, delivered)
+    return sent
+
+async def digest_loop(bot: Bot) -> None:
+    """Периодически отправляет дайджесты; задача создаётся при старте бота."""
+    interval = get_config().digest_poll_seconds
+    while True:
+        try:
+            await send_digests(bot)
+        except Exception as e:
+            logger.error("Ошибка при отправке дайджестов: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,183 @@
+# dispatch.py
+"""Маршрутизация кнопок без перебора фильтров.
+
+Тексты reply-кнопок и префиксы callback_data ищутся в словаре за O(1):
+на роутер регистрируется один обработчик, а его фильтр подставляет в
+data["handler"] найденный обработчик. Поэтому middleware (например,
+троттлинг по имени обработчика) видят настоящий обработчик кнопки.
+Испорченный callback_data отклоняется до вызова обработчика.
+"""
+import hashlib
+import logging
+from enum import Enum
+from typing import Any, Callable, Dict, Tuple, Type, Union
+from aiogram import Router, types
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.filters.callback_data import CallbackData
+from pydantic import NonNegativeInt, PositiveInt, field_validator
+from constants import DIGEST_MODES, INVALID_CALLBACK, SUBSCRIPTION_LABELS
+
+logger = logging.getLogger(__name__)
+
+# Разделитель полей CallbackData по умолчанию; префикс — всё до первого разделителя
+SEPARATOR = ":"
+
+class BookCallback(CallbackData, prefix="book"):
+    excursion_id: PositiveInt
+
+class PageCallback(CallbackData, prefix="page"):
+    page: NonNegativeInt
+
+class FilterResetCallback(CallbackData, prefix="filter_reset"):
+    pass
+
+class ReviewCallback(CallbackData, prefix="review"):
+    booking_id: PositiveInt
+
+class ModerationAction(str, Enum):
+    SELECT = "sel"
+    APPROVE = "ok"
+    REJECT = "no"
+    PAGE = "page"
+    SELECT_PAGE = "all"
+    APPROVE_SELECTED = "batch_ok"
+    REJECT_SELECTED = "batch_no"
+
+class ModerationCallback(CallbackData, prefix="mod"):
+    action: ModerationAction
+    value: NonNegativeInt = 0
+
+class GuideListAction(str, Enum):
+    PAGE = "page"
+    APPROVE = "ok"
+    APPROVE_PAGE = "page_ok"
+
+class GuideListCallback(CallbackData, prefix="guides"):
+    action: GuideListAction
+    value: NonNegativeInt = 0
+
+class DigestCallback(CallbackData, prefix="digest"):
+    mode: str
+
+    @field_validator("mode")
+    @classmethod
+    def _known_mode(cls, mode: str) -> str:
+        if mode not in DIGEST_MODES:
+            raise ValueError(f"Неизвестный режим уведомлений: {mode}")
+        return mode
+
+class StatsRefreshCallback(CallbackData, prefix="stats_refresh"):
+    pass
+
+class FollowCallback(CallbackData, prefix="follow"):
+    kind: str
+    excursion_id: PositiveInt
+
+    @field_validator("kind")
+    @classmethod
+    def _known_kind(cls, kind: str) -> str:
+        if kind not in SUBSCRIPTION_LABELS:
+            raise ValueError(f"Неизвестный вид подписки: {kind}")
+        return kind
+
+# Цель подписки длиннее этого числа байт передаётся хэшем: весь callback_data ограничен 64 байтами
+UNFOLLOW_TARGET_BYTES = 40
+
+class UnfollowCallback(CallbackData, prefix="unfollow"):
+    # Вид и цель подписки; длинная цель или цель с разделителем передаётся хэшем с префиксом «#»
+    kind: str
+    target: str
+
+    @field_validator("kind")
+    @classmethod
+    def _known_kind(cls, kind: str) -> str:
+        if kind not in SUBSCRIPTION_LABELS:
+            raise ValueError(f"Неизвестный вид подписки: {kind}")
+        return kind
+
+    @staticmethod
+    def _digest(target: str) -> str:
+        return "#" + hashlib.sha1(target.encode()).hexdigest()[:16]
+
+    @classmethod
+    def for_subscription(cls, kind: str, target: str) -> "UnfollowCallback":
+        """Кнопка отписки от цели; цель, которая не помещается в callback_data, заменяется хэшем."""
+        if len(target.encode()) > UNFOLLOW_TARGET_BYTES or ":" in target or target.startswith("#"):
+            return cls(kind=kind, target=cls._digest(target))
+        return cls(kind=kind, target=target)
+
+    @property
+    def hashed(self) -> bool:
+        return self.target.startswith("#")
+
+    def matches(self, target: str) -> bool:
+        """Проверяет, что кнопка указывает на эту цель подписки."""
+        return self.target == (self._digest(target) if self.hashed else target)
+
+async def _reject_callback(callback: types.CallbackQuery) -> None:
+    """Отвечает на нажатие кнопки с испорченными или устаревшими данными."""
+    logger.warning("Отклонён некорректный callback_data от user_id=%s: %r", callback.from_user.id, callback.data)
+    await callback.answer(INVALID_CALLBACK, show_alert=True)
+
+_REJECT_HANDLER = HandlerObject(callback=_reject_callback)
+
+class ReplyButtons:
+    """Реестр reply-кнопок роутера: текст кнопки -> обработчик."""
+
+    def __init__(self, router: Router):
+        self._handlers: Dict[str, HandlerObject] = {}
+        # Регистрируется первым, поэтому кнопки имеют приоритет над вводом в состояниях FSM роутера
+        router.message.register(self._dispatch, self._resolve)
+
+    def __call__(self, *texts: str) -> Callable:
+        """Декоратор: привязывает обработчик к одной или нескольким кнопкам."""
+        def decorator(callback: Callable) -> Callable:
+            handler = HandlerObject(callback=callback)
+            for text in texts:
+                if text in self._handlers:
+                    raise ValueError(f"Кнопка {text!r} уже зарегистрирована")
+                self._handlers[text] = handler
+            return callback
+        return decorator
+
+    def _resolve(self, message: types.Message) -> Union[bool, Dict[str, Any]]:
+        handler = self._handlers.get(message.text)
+        return False if handler is None else {"handler": handler}
+
+    @staticmethod
+    async def _dispatch(message: types.Message, handler: HandlerObject, **data: Any) -> Any:
+        return await handler.call(message, handler=handler, **data)
+
+class CallbackButtons:
+    """Реестр инлайн-кнопок роутера: префикс callback_data -> (фабрика CallbackData, обработчик)."""
+
+    def __init__(self, router: Router):
+        self._handlers: Dict[str, Tuple[Type[CallbackData], HandlerObject]] = {}
+        router.callback_query.register(self._dispatch, self._resolve)
+
+    def __call__(self, factory: Type[CallbackData]) -> Callable:
+        """Декоратор: привязывает обработчик к фабрике; разобранные данные приходят в аргументе callback_data."""
+        def decorator(callback: Callable) -> Callable:
+            prefix = factory.__prefix__
+            if prefix in self._handlers:
+                raise ValueError(f"Префикс callback_data {prefix!r} уже зарегистрирован")
+            self._handlers[prefix] = (factory, HandlerObject(callback=callback))
+            return callback
+        return decorator
+
+    def _resolve(self, callback: types.CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        if not callback.data:
+            return False
+        entry = self._handlers.get(callback.data.split(SEPARATOR, 1)[0])
+        if entry is None:
+            return False
+        factory, handler = entry
+        try:
+            callback_data = factory.unpack(callback.data)
+        except (TypeError, ValueError):
+            return {"handler": _REJECT_HANDLER}
+        return {"handler": handler, "callback_data": callback_data}
+
+    @staticmethod
+    async def _dispatch(callback: types.CallbackQuery, handler: HandlerObject, **data: Any) -> Any:
+        return await handler.call(callback, handler=handler, **data)
@@ -0,0 +1,134 @@
+# fake_telegram_server.py
+"""Локальная замена Telegram Bot API для нагрузочного тестирования.
+
+Поддерживает getUpdates, sendMessage, editMessageText и answerCallbackQuery
+(а также служебные getMe и deleteWebhook), умеет добавлять задержку и
+отвечать 429 с retry_after. Бот подключается через TELEGRAM_API_URL.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+from aiohttp import web
+
+class FakeTelegramServer:
+    """Сервер Bot API в памяти: очередь входящих обновлений и журнал ответов бота по чатам."""
+
+    def __init__(self, latency: float = 0.0, rate_limit_rate: float = 0.0, retry_after: int = 1):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.updates: List[Dict[str, Any]] = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.rate_limited = 0
+        self.requests = 0
+        self._new_updates = asyncio.Event()
+        self._replies: Dict[int, asyncio.Queue] = {}
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle)
+
+    def replies(self, chat_id: int) -> asyncio.Queue:
+        """Возвращает очередь сообщений, которые бот отправил в чат."""
+        queue = self._replies.get(chat_id)
+        if queue is None:
+            queue = self._replies[chat_id] = asyncio.Queue()
+        return queue
+
+    def _message(self, chat_id: int, text: str, user: Optional[Dict[str, Any]] = None, reply_markup: Any = None) -> Dict[str, Any]:
+        """Собирает объект Message в формате Bot API."""
+        message = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+        self.next_message_id += 1
+        if user:
+            message["from"] = user
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        return message
+
+    def _push(self, update: Dict[str, Any]) -> int:
+        update["update_id"] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    def push_message(self, user_id: int, text: str) -> int:
+        """Имитирует текстовое сообщение пользователя боту."""
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        return self._push({"message": self._message(user_id, text, user)})
+
+    def push_callback(self, user_id: int, data: str, message: Optional[Dict[str, Any]] = None) -> int:
+        """Имитирует нажатие инлайн-кнопки пользователем."""
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        return self._push({"callback_query": {
+            "id": str(self.next_update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": message or self._message(user_id, "", {"id": 0, "is_bot": True, "first_name": "Bot"}),
+        }})
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), 1.0)
+        limit = int(params.get("limit") or 100)
+        # Подтверждённые обновления больше не нужны
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def _bot_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Записывает сообщение бота в журнал чата и возвращает его как Message."""
+        chat_id = int(params["chat_id"])
+        reply_markup = json.loads(params["reply_markup"]) if params.get("reply_markup") else None
+        # В объекте Message Bot API возвращает только инлайн-клавиатуру
+        if reply_markup and "inline_keyboard" not in reply_markup:
+            reply_markup = None
+        message = self._message(chat_id, params.get("text", ""), {"id": 0, "is_bot": True, "first_name": "Bot"}, reply_markup)
+        self.replies(chat_id).put_nowait((time.perf_counter(), message))
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, Any] = dict(request.query)
+        if request.can_read_body:
+            params.update(await request.post())
+        self.requests += 1
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._bot_message(params)
+        else:
+            # answerCallbackQuery, deleteWebhook и прочие служебные методы
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8082) -> web.AppRunner:
+        """Запускает сервер в текущем цикле событий."""
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
@@ -0,0 +1,61 @@
+# fake_yandex_server.py
+"""Локальная замена API Яндекс Погоды, Маршрутизации и Такси для проверки устойчивости.
+
+Запуск: python fake_yandex_server.py --port 8081 --delay 5 --error-rate 0.3
+Затем в .env бота:
+    YANDEX_WEATHER_URL=http://127.0.0.1:8081/v2/forecast
+    YANDEX_ROUTING_URL=http://127.0.0.1:8081/v2/route
+    YANDEX_TAXI_URL=http://127.0.0.1:8081/route_info
+"""
+import argparse
+import asyncio
+import random
+from aiohttp import web
+
+# Ключ изменяемых настроек приложения: задержка, доля и статус ошибок
+SETTINGS = web.AppKey("settings", dict)
+
+def create_app(delay: float = 0.0, error_rate: float = 0.0, error_status: int = 503) -> web.Application:
+    """Создаёт приложение, которое отвечает с задержкой и с заданной долей ошибок."""
+    app = web.Application()
+    # Настройки хранятся в изменяемом словаре, чтобы их можно было менять после запуска
+    settings = {"delay": delay, "error_rate": error_rate, "error_status": error_status}
+    app[SETTINGS] = settings
+
+    async def respond(request: web.Request, payload: dict) -> web.Response:
+        await asyncio.sleep(settings["delay"])
+        if random.random() < settings["error_rate"]:
+            return web.json_response({"error": "injected"}, status=settings["error_status"])
+        return web.json_response(payload)
+
+    async def forecast(request: web.Request) -> web.Response:
+        return await respond(request, {"fact": {"temp": 12, "condition": "cloudy"}})
+
+    async def route(request: web.Request) -> web.Response:
+        return await respond(request, {"routes": [{"duration": 1500}]})
+
+    async def route_info(request: web.Request) -> web.Response:
+        return await respond(request, {"options": [{"price": 450}]})
+
+    async def configure(request: web.Request) -> web.Response:
+        """Меняет задержку и долю ошибок на лету: POST /_config?delay=2&error_rate=1."""
+        for key in ("delay", "error_rate"):
+            if key in request.query:
+                settings[key] = float(request.query[key])
+        return web.json_response(settings)
+
+    app.router.add_get("/v2/forecast", forecast)
+    app.router.add_get("/v2/route", route)
+    app.router.add_get("/route_info", route_info)
+    app.router.add_post("/_config", configure)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поддельный сервер Яндекс API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой, 0..1")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+    web.run_app(create_app(args.delay, args.error_rate, args.error_status), host=args.host, port=args.port)
@@ -1,15 +1,29 @@
 import logging
+from datetime import date
+from typing import Any, Dict, List
 from aiogram import Bot, Router, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from constants import GUIDE_REGISTER_FIO, GUIDE_REGISTER_ABOUT, SUCCESSFUL_REGISTRATION
+from constants import (
+    GUIDE_REGISTER_FIO, GUIDE_REGISTER_ABOUT, SUCCESSFUL_REGISTRATION, GUIDE_NOT_FOUND,
+    GUIDE_DASHBOARD_HEADER, GUIDE_DASHBOARD_EMPTY, GUIDE_DASHBOARD_EXCURSION, GUIDE_DASHBOARD_SESSION,
+    GUIDE_DASHBOARD_SESSION_UNLIMITED, GUIDE_DASHBOARD_NO_SESSIONS, GUIDE_DASHBOARD_REVIEWS,
+    GUIDE_DASHBOARD_REVIEW
+)
 from keyboards import get_guide_keyboard
-from database import register_guide
+from database import register_guide, get_guide_dashboard, get_user_snapshot
+from dispatch import ReplyButtons
 
 router = Router()
+buttons = ReplyButtons(router)
 logger = logging.getLogger(__name__)
 
+# Сколько ближайших дат показывать по каждому маршруту
+DASHBOARD_SESSIONS_LIMIT = 3
+# Запас до лимита Telegram в 4096 символов на сообщение
+MESSAGE_LIMIT = 4000
+
 # Определение состояний для регистрации гида
 class GuideRegistration(StatesGroup):
     first_name = State()
@@ -22,7 +36,7 @@ async def cmd_guide_register(message: types.Message, state: FSMContext):
         await message.answer(GUIDE_REGISTER_FIO, reply_markup=get_guide_keyboard())
         await state.set_state(GuideRegistration.first_name)
     except Exception as e:
-        logger.error(f"Ошибка в cmd_guide_register для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в cmd_guide_register для user_id=%s: %s", message.from_user.id, e)
         await message.answer("Произошла ошибка. Попробуй снова.")
 
 @router.message(GuideRegistration.first_name)
@@ -37,7 +51,7 @@ async def process_guide_name(message: types.Message, state: FSMContext):
         await message.answer(GUIDE_REGISTER_ABOUT)
         await state.set_state(GuideRegistration.experience)
     except Exception as e:
-        logger.error(f"Ошибка в process_guide_name для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в process_guide_name для user_id=%s: %s", message.from_user.id, e)
         await message.answer("Произошла ошибка. Попробуй снова.")
 
 @router.message(GuideRegistration.experience)
@@ -60,18 +74,63 @@ async def process_guide_experience(message: types.Message, state: FSMContext, bo
         )
         await state.clear()
     except ValueError:
-        logger.error(f"Некорректный ввод опыта для user_id={message.from_user.id}: {message.text}")
+        logger.error("Некорректный ввод опыта для user_id=%s: %s", message.from_user.id, message.text)
         await message.answer("Пожалуйста, введи число лет опыта (например, 5):")
     except Exception as e:
-        logger.error(f"Ошибка в process_guide_experience для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в process_guide_experience для user_id=%s: %s", message.from_user.id, e)
         await message.answer("Произошла ошибка. Попробуй снова.")
 
-@router.message(lambda message: message.text == "⬅️ Назад")
+@buttons("⬅️ Назад")
 async def handle_guide_back(message: types.Message, state: FSMContext):
     """Обрабатывает кнопку 'Назад' для гида."""
     try:
         await state.clear()
         await message.answer("Вы вернулись в меню гида.", reply_markup=get_guide_keyboard())
     except Exception as e:
-        logger.error(f"Ошибка в handle_guide_back для user_id={message.from_user.id}: {e}")
+        logger.error("Ошибка в handle_guide_back для user_id=%s: %s", message.from_user.id, e)
+        await message.answer("Произошла ошибка. Попробуй снова.")
+
+def render_dashboard(dashboard: Dict[str, Any], today: str) -> List[str]:
+    """Собирает текст кабинета гида и делит его на сообщения в пределах лимита Telegram."""
+    lines = [GUIDE_DASHBOARD_HEADER.format(count=len(dashboard["excursions"]), **dashboard)]
+    for excursion in dashboard["excursions"]:
+        status = "✅" if excursion["is_approved"] == 1 else "⏳" if excursion["is_approved"] == 0 else "❌"
+        lines.append(GUIDE_DASHBOARD_EXCURSION.format(status=status, **excursion))
+        upcoming = [session for session in excursion["sessions"] if session["date"][:10] >= today]
+        for session in upcoming[:DASHBOARD_SESSIONS_LIMIT]:
+            if excursion["capacity"]:
+                lines.append(GUIDE_DASHBOARD_SESSION.format(
+                    capacity=excursion["capacity"], fill_rate=session["booked"] / excursion["capacity"], **session
+                ))
+            else:
+                lines.append(GUIDE_DASHBOARD_SESSION_UNLIMITED.format(**session))
+        if not upcoming:
+            lines.append(GUIDE_DASHBOARD_NO_SESSIONS)
+    if dashboard["reviews"]:
+        lines.append(GUIDE_DASHBOARD_REVIEWS)
+        lines.extend(GUIDE_DASHBOARD_REVIEW.format(**review) for review in dashboard["reviews"])
+    chunks = [""]
+    for line in lines:
+        if len(chunks[-1]) + len(line) + 1 > MESSAGE_LIMIT:
+            chunks.append("")
+        chunks[-1] += line + "\n"
+    return chunks
+
+@buttons("📋 Мои экскурсии")
+async def handle_guide_dashboard(message: types.Message):
+    """Показывает кабинет гида: маршруты, бронирования по датам, заполненность и отзывы."""
+    try:
+        user_id = message.from_user.id
+        snapshot = await get_user_snapshot(user_id)
+        if not snapshot["is_guide"]:
+            await message.answer(GUIDE_NOT_FOUND)
+            return
+        dashboard = await get_guide_dashboard(user_id)
+        if not dashboard["excursions"]:
+            await message.answer(GUIDE_DASHBOARD_EMPTY, reply_markup=get_guide_keyboard())
+            return
+        for chunk in render_dashboard(dashboard, date.today().isoformat()):
+            await message.answer(chunk, reply_markup=get_guide_keyboard())
+    except Exception as e:
+        logger.error("Ошибка в handle_guide_dashboard для user_id=%s: %s", message.from_user.id, e)
         await message.answer("Произошла ошибка. Попробуй снова.")
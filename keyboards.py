@@ -1,93 +1,101 @@
-# keyboards.p
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from aiogram import types
-from database import get_guide
-from constants import ADMIN_IDS, REQUEST_NEW_CITY, CANCEL_REQUEST
+# keyboards.py
+from typing import List
+from pydantic import ConfigDict
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from database import get_user_snapshot
+from constants import ADMIN_IDS, CANCEL_REQUEST, MODERATION_BUTTON, SUBSCRIPTIONS_BUTTON
 
-def get_role_keyboard(user_id):
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    """Неизменяемая клавиатура, которую можно строить один раз и переиспользовать."""
+    model_config = ConfigDict(frozen=True)
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """Неизменяемая инлайн-клавиатура, которую можно строить один раз и переиспользовать."""
+    model_config = ConfigDict(frozen=True)
+
+def _reply_markup(rows: List[List[str]]) -> ReplyKeyboardMarkup:
+    """Собирает клавиатуру из рядов с текстами кнопок."""
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True
+    )
+
+def _frozen_markup(rows: List[List[str]]) -> FrozenReplyKeyboardMarkup:
+    """Собирает неизменяемую клавиатуру из рядов с текстами кнопок."""
+    return FrozenReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True
+    )
+
+# Статические клавиатуры строятся один раз при импорте модуля
+_MAIN_ROWS = [
+    ["🌍 Я путешественник"],
+    ["🗺️ Я гид"],
+    ["📚 Помощь"],
+    ["📞 Связаться с администратором"],
+]
+MAIN_KEYBOARD = _frozen_markup(_MAIN_ROWS)
+MAIN_ADMIN_KEYBOARD = _frozen_markup(_MAIN_ROWS + [["🔧 Админ-панель"]])
+GUIDE_KEYBOARD = _frozen_markup([
+    ["➕ Добавить маршрут", "📋 Мои экскурсии"],
+    ["↩️ Вернуться в меню"],
+])
+ADMIN_KEYBOARD = _frozen_markup([
+    ["📋 Список гидов", "🗺️ Список экскурсий"],
+    ["📊 Статистика", MODERATION_BUTTON],
+    ["↩️ Вернуться в меню"],
+])
+INFO_KEYBOARD = _frozen_markup([
+    ["📝 Оставить отзыв о боте"],
+    ["↩️ Вернуться в меню"],
+])
+CANCEL_KEYBOARD = FrozenInlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="❌ Отмена", callback_data=CANCEL_REQUEST)]
+])
+
+async def get_role_keyboard(user_id: int) -> ReplyKeyboardMarkup:
     """Создает клавиатуру для выбора роли."""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn_traveler = types.KeyboardButton("🌴 Я путешественник")
-    guide = get_guide(user_id)
-    if guide:
-        if guide[5]:  # approved
-            btn_guide = types.KeyboardButton("🧳 Личный кабинет")
-            markup.add(btn_traveler, btn_guide)
+    snapshot = await get_user_snapshot(user_id)
+    rows = []
+    if snapshot["is_guide"]:
+        if snapshot["is_approved_guide"]:
+            rows.append(["🌴 Я путешественник", "🧳 Личный кабинет"])
     else:
-        btn_guide = types.KeyboardButton("🧳 Я гид")
-        markup.add(btn_traveler, btn_guide)
-    btn_info = types.KeyboardButton("ℹ️ О боте")
-    markup.add(btn_info)
+        rows.append(["🌴 Я путешественник", "🧳 Я гид"])
+    rows.append(["ℹ️ О боте"])
     if user_id in ADMIN_IDS:
-        btn_admin = types.KeyboardButton("🔧 Админ-панель")
-        markup.add(btn_admin)
-    return markup
+        rows.append(["🔧 Админ-панель"])
+    return _reply_markup(rows)
 
 def get_main_keyboard(user_id: int) -> ReplyKeyboardMarkup:
     """Возвращает главную клавиатуру в зависимости от роли пользователя."""
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-
-    # Общие кнопки для всех пользователей
-    keyboard.add(KeyboardButton("🌍 Я путешественник"))
-    keyboard.add(KeyboardButton("🗺️ Я гид"))
-    keyboard.add(KeyboardButton("📚 Помощь"))
-    keyboard.add(KeyboardButton("📞 Связаться с администратором"))
-
     # Если пользователь — администратор, добавляем кнопку админ-панели
-    if user_id in get_admin_ids():
-        keyboard.add(KeyboardButton("🔧 Админ-панель"))
-
-    return keyboard
+    if user_id in ADMIN_IDS:
+        return MAIN_ADMIN_KEYBOARD
+    return MAIN_KEYBOARD
 
-def get_traveler_keyboard(user_id):
+async def get_traveler_keyboard(user_id: int) -> ReplyKeyboardMarkup:
     """Создает клавиатуру для путешественника с динамической информацией."""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn_view_tours = types.KeyboardButton("🗺️ Посмотреть экскурсии")
-    btn_search = types.KeyboardButton("🔍 Поиск по ключевым словам")  # Новая кнопка
-    btn_filter_price = types.KeyboardButton("💰 Фильтр по цене")
-    btn_filter_date = types.KeyboardButton("📅 Фильтр по дате")
-    bookings = get_bookings_by_user(user_id)
-    btn_cancel_booking = types.KeyboardButton(f"❌ Отменить запись ({len(bookings)})")
-    btn_cabinet = types.KeyboardButton("🌴 Личный кабинет")
-    btn_back = types.KeyboardButton("↩️ Вернуться в меню")
-    markup.add(btn_view_tours, btn_search)
-    markup.add(btn_filter_price, btn_filter_date)
-    markup.add(btn_cancel_booking, btn_cabinet)
-    markup.add(btn_back)
-    return markup
+    snapshot = await get_user_snapshot(user_id)
+    return _reply_markup([
+        ["🗺️ Посмотреть экскурсии", "🔍 Поиск по ключевым словам"],
+        ["💰 Фильтр по цене", "📅 Фильтр по дате"],
+        [f"❌ Отменить запись ({snapshot['bookings_count']})", "🌴 Личный кабинет"],
+        [SUBSCRIPTIONS_BUTTON, "↩️ Вернуться в меню"],
+    ])
 
-def get_guide_keyboard():
-    """Создает клавиатуру для гида."""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn_add_tour = types.KeyboardButton("➕ Добавить маршрут")
-    btn_my_tours = types.KeyboardButton("📋 Мои экскурсии")
-    btn_back = types.KeyboardButton("↩️ Вернуться в меню")
-    markup.add(btn_add_tour, btn_my_tours)
-    markup.add(btn_back)
-    return markup
+def get_guide_keyboard() -> ReplyKeyboardMarkup:
+    """Возвращает клавиатуру для гида."""
+    return GUIDE_KEYBOARD
 
-def get_admin_keyboard():
-    """Создает клавиатуру для админа."""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    btn_guides = types.KeyboardButton("📋 Список гидов")
-    btn_tours = types.KeyboardButton("🗺️ Список экскурсий")
-    btn_stats = types.KeyboardButton("📊 Статистика")
-    btn_back = types.KeyboardButton("↩️ Вернуться в меню")
-    markup.add(btn_guides, btn_tours)
-    markup.add(btn_stats, btn_back)
-    return markup
+def get_admin_keyboard() -> ReplyKeyboardMarkup:
+    """Возвращает клавиатуру для админа."""
+    return ADMIN_KEYBOARD
 
-def get_cancel_keyboard():
-    """Создает инлайн-клавиатуру с кнопкой 'Отмена'."""
-    markup = types.InlineKeyboardMarkup()
-    btn_cancel = types.InlineKeyboardButton("❌ Отмена", callback_data=CANCEL_REQUEST)
-    markup.add(btn_cancel)
-    return markup
+def get_cancel_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает инлайн-клавиатуру с кнопкой 'Отмена'."""
+    return CANCEL_KEYBOARD
 
-def get_info_keyboard():
-    """Создает клавиатуру для раздела 'О боте'."""
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
-    btn_feedback = types.KeyboardButton("📝 Оставить отзыв о боте")
-    btn_back = types.KeyboardButton("↩️ Вернуться в меню")
-    markup.add(btn_feedback, btn_back)
-    return markup
+def get_info_keyboard() -> ReplyKeyboardMarkup:
+    """Возвращает клавиатуру для раздела 'О боте'."""
+    return INFO_KEYBOARD
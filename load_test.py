@@ -0,0 +1,169 @@
+# load_test.py
+"""Нагрузочный тест бота на поддельном сервере Bot API.
+
+Запуск вместе с ботом в одном процессе:
+    python load_test.py --users 1000 --with-bot --seed 50
+Или против отдельно запущенного бота (TELEGRAM_API_URL=http://127.0.0.1:8082):
+    python load_test.py --users 1000 --port 8082
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from fake_telegram_server import FakeTelegramServer
+
+# Шаги сценариев: ("message", текст) или ("callback", префикс callback_data из последнего ответа)
+SCENARIOS = {
+    "traveler": [
+        ("message", "🌍 Я путешественник"),
+        ("message", "🔍 Найти маршрут"),
+        ("callback", "book:"),
+    ],
+    "guide": [
+        ("message", "/guide_register"),
+        ("message", "Иван Иванов"),
+        ("message", "5"),
+    ],
+}
+
+def find_callback(message: Dict[str, Any], prefix: str) -> Optional[str]:
+    """Ищет в инлайн-клавиатуре ответа callback_data с нужным префиксом."""
+    markup = message.get("reply_markup") or {}
+    for row in markup.get("inline_keyboard", []):
+        for button in row:
+            data = button.get("callback_data") or ""
+            if data.startswith(prefix):
+                return data
+    return None
+
+class VirtualUser:
+    """Пользователь, проходящий сценарий и измеряющий задержку ответа на каждый шаг."""
+
+    def __init__(self, server: FakeTelegramServer, user_id: int, scenario: str, think_time: float, timeout: float):
+        self.server = server
+        self.user_id = user_id
+        self.scenario = scenario
+        self.think_time = think_time
+        self.timeout = timeout
+        self.results: List[Tuple[str, Optional[float]]] = []
+
+    async def run(self) -> None:
+        replies = self.server.replies(self.user_id)
+        # Все сообщения ответа на предыдущий шаг: кнопка может быть в карточке, а не в последнем сообщении
+        step_replies: List[Dict[str, Any]] = []
+        for kind, value in SCENARIOS[self.scenario]:
+            # Забираем запоздавшие ответы предыдущего шага
+            while not replies.empty():
+                step_replies.append(replies.get_nowait()[1])
+            step = f"{self.scenario}:{value}"
+            if kind == "message":
+                self.server.push_message(self.user_id, value)
+            else:
+                found = next((
+                    (reply, data) for reply in step_replies
+                    if (data := find_callback(reply, value)) is not None
+                ), None)
+                if found is None:
+                    self.results.append((step, None))
+                    return
+                self.server.push_callback(self.user_id, found[1], found[0])
+            started = time.perf_counter()
+            try:
+                received_at, first_reply = await asyncio.wait_for(replies.get(), self.timeout)
+                step_replies = [first_reply]
+                self.results.append((step, received_at - started))
+            except asyncio.TimeoutError:
+                self.results.append((step, None))
+                return
+            # Собираем остальные сообщения ответа (например, страницу карточек)
+            await asyncio.sleep(self.think_time * random.uniform(0.5, 1.5))
+
+def percentile(values: List[float], share: float) -> float:
+    """Возвращает перцентиль отсортированного списка."""
+    index = min(len(values) - 1, int(len(values) * share))
+    return values[index]
+
+def report(users: List[VirtualUser], elapsed: float, server: FakeTelegramServer) -> None:
+    """Печатает задержки по шагам и общую пропускную способность."""
+    steps: Dict[str, List[Optional[float]]] = {}
+    for user in users:
+        for step, latency in user.results:
+            steps.setdefault(step, []).append(latency)
+    total = sum(len(values) for values in steps.values())
+    print(f"Пользователей: {len(users)}, шагов: {total}, время: {elapsed:.1f} с, "
+          f"пропускная способность: {total / elapsed:.1f} шагов/с")
+    print(f"Запросов к Bot API: {server.requests}, ответов 429: {server.rate_limited}")
+    print(f"{'шаг':40} {'n':>6} {'ошибки':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for step, values in steps.items():
+        ok = sorted(value * 1000 for value in values if value is not None)
+        failed = len(values) - len(ok)
+        if not ok:
+            print(f"{step:40} {len(values):>6} {failed:>7}")
+            continue
+        print(f"{step:40} {len(values):>6} {failed:>7} {statistics.median(ok):>9.1f} "
+              f"{percentile(ok, 0.95):>9.1f} {percentile(ok, 0.99):>9.1f} {ok[-1]:>9.1f}")
+
+async def seed_excursions(count: int) -> None:
+    """Добавляет одобренные маршруты, чтобы сценарию бронирования было что выбрать."""
+    from database import add_excursion, approve_excursions
+    ids = [
+        await add_excursion(1, f"Маршрут {index}", "Москва", "история", "Тестовый маршрут", 1000, ["2030-01-01"])
+        for index in range(count)
+    ]
+    await approve_excursions(ids)
+
+async def run(args: argparse.Namespace) -> None:
+    server = FakeTelegramServer(args.latency, args.rate_limit, args.retry_after)
+    runner = await server.start(port=args.port)
+    polling: Optional[asyncio.Task] = None
+    if args.with_bot:
+        import os
+        os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{args.port}"
+        from aiogram.fsm.storage.memory import MemoryStorage
+        from main import create_bot, create_dispatcher
+        from database import init_db
+        await init_db()
+        if args.seed:
+            await seed_excursions(args.seed)
+        bot = create_bot("123456:load-test")
+        dp = create_dispatcher(MemoryStorage())
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+    scenarios = list(SCENARIOS)
+    users = [
+        VirtualUser(server, 100000 + index, scenarios[index % len(scenarios)], args.think_time, args.timeout)
+        for index in range(args.users)
+    ]
+    started = time.perf_counter()
+    # Пользователи приходят равномерно в течение ramp-up
+    async def start_user(user: VirtualUser, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await user.run()
+    await asyncio.gather(*(
+        start_user(user, args.ramp_up * index / max(len(users), 1)) for index, user in enumerate(users)
+    ))
+    elapsed = time.perf_counter() - started
+    report(users, elapsed, server)
+
+    if polling is not None:
+        # Останавливаем опрос до сервера, иначе бот успеет записать в лог обрыв соединения
+        await dp.stop_polling()
+        await asyncio.gather(polling, return_exceptions=True)
+        await bot.session.close()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота")
+    parser.add_argument("--users", type=int, default=100, help="число виртуальных пользователей")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, секунды")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429, 0..1")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--think-time", type=float, default=0.5, help="пауза пользователя между шагами, секунды")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="время подключения всех пользователей, секунды")
+    parser.add_argument("--timeout", type=float, default=10.0, help="время ожидания ответа на шаг, секунды")
+    parser.add_argument("--with-bot", action="store_true", help="запустить бота в этом же процессе")
+    parser.add_argument("--seed", type=int, default=0, help="сколько одобренных маршрутов добавить перед тестом")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,175 @@
+# logging_setup.py
+"""Логирование без записи на диск в цикле событий.
+
+Корневой логгер получает единственный QueueHandler: в цикле событий запись
+только кладётся в очередь, а форматирование сообщения (аргументы в стиле %s)
+и запись в файл выполняет QueueListener в отдельном потоке. В файл пишется
+JSON с ID обновления, пользователем, обработчиком и длительностью; эти поля
+берутся из contextvars, которые выставляют middleware диспетчера. INFO-записи
+шумных логгеров (LOG_SAMPLED_LOGGERS) прореживаются до LOG_SAMPLE_RATE.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from config import get_config
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Журнал обработанных обновлений: по записи на каждое обновление
+ACCESS_LOGGER = "bot.access"
+CONTEXT_FIELDS = ("update_id", "user_id", "handler", "latency_ms")
+
+update_id_var: ContextVar[Optional[int]] = ContextVar("update_id", default=None)
+user_id_var: ContextVar[Optional[int]] = ContextVar("user_id", default=None)
+handler_var: ContextVar[Optional[str]] = ContextVar("handler", default=None)
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+_listener: Optional[QueueListener] = None
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи контекст обновления, которое сейчас обрабатывается."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.__dict__.setdefault("update_id", update_id_var.get())
+        record.__dict__.setdefault("user_id", user_id_var.get())
+        record.__dict__.setdefault("handler", handler_var.get())
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает лишь долю rate INFO- и DEBUG-записей указанных логгеров; предупреждения и ошибки не трогает."""
+
+    def __init__(self, rate: float, loggers: Sequence[str]):
+        super().__init__()
+        self.rate = rate
+        self.prefixes = tuple(f"{name}." for name in loggers)
+        self.names = frozenset(loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        if record.name not in self.names and not record.name.startswith(self.prefixes):
+            return True
+        return random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись одной строкой JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                payload[name] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует сообщение в вызывающем потоке.
+
+    Стандартный prepare() подставляет аргументы в сообщение ещё в цикле
+    событий; здесь запись уходит в очередь как есть, и getMessage() вызывают
+    обработчики слушателя. Поэтому в логи передаются значения, которые не
+    меняются после вызова (числа, строки, исключения).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def setup_logging() -> None:
+    """Настраивает корневой логгер: очередь в цикле событий, файл JSON и консоль в потоке слушателя."""
+    global _listener
+    if _listener is not None:
+        return
+    config = get_config()
+    os.makedirs(os.path.dirname(config.log_file) or ".", exist_ok=True)
+    file_handler = logging.FileHandler(config.log_file, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    # Прореживание раньше контекста: отброшенной записи контекст не нужен
+    queue_handler.addFilter(SamplingFilter(config.log_sample_rate, config.log_sampled_loggers))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.log_level)
+
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток слушателя."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _handler_name(data: Dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    return getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: выставляет контекст логов и пишет журнал доступа с длительностью.
+
+    Регистрируется через dp.update.outer_middleware(...); обработка дольше
+    LOG_SLOW_UPDATE_MS пишется предупреждением и не прореживается.
+    """
+
+    def __init__(self, slow_update_ms: float):
+        self.slow_update_ms = slow_update_ms
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        tokens = (
+            (update_id_var, update_id_var.set(event.update_id if isinstance(event, Update) else None)),
+            (user_id_var, user_id_var.set(user.id if user else None)),
+            (handler_var, handler_var.set(None)),
+        )
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            level = logging.WARNING if latency_ms >= self.slow_update_ms else logging.INFO
+            access_logger.log(level, "Обновление обработано за %s мс", latency_ms, extra={"latency_ms": latency_ms})
+            for var, token in tokens:
+                var.reset(token)
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Внутренний middleware сообщений и нажатий: добавляет в контекст логов имя выбранного обработчика."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Переменная сбрасывается во внешнем middleware, поэтому имя обработчика попадает и в журнал доступа
+        handler_var.set(_handler_name(data))
+        return await handler(event, data)
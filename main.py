@@ -1,36 +1,91 @@
+import time
+
+# Отсчёт времени импорта начинается до загрузки тяжёлых модулей
+_IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+import sys
 from aiogram import Bot, Dispatcher, Router, types
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
-from dotenv import load_dotenv
-import os
-from handlers.common_handlers import router as common_router
-from handlers.guide_handlers import router as guide_router  # Добавлен guide_router
+from config import get_config
+from database import init_db, close_write_queue
+from throttling import ThrottlingMiddleware
+from logging_setup import HandlerContextMiddleware, UpdateContextMiddleware, setup_logging
+from common_handlers import router as common_router
+from guide_hundlers import router as guide_router  # Добавлен guide_router
+from traveler_handlers import router as traveler_router
+from admin_handlers import router as admin_router
+
+IMPORT_TIME_MS = (time.perf_counter() - _IMPORT_STARTED) * 1000
 
 # Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-# Загрузка переменных окружения
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_TOKEN = get_config().bot_token
+
+def check_import_budget() -> bool:
+    """Проверяет, что импорт модулей бота уложился в бюджет IMPORT_BUDGET_MS."""
+    budget_ms = get_config().import_budget_ms
+    if IMPORT_TIME_MS > budget_ms:
+        logger.warning("Импорт модулей занял %.0f мс при бюджете %.0f мс", IMPORT_TIME_MS, budget_ms)
+        return False
+    logger.info("Импорт модулей занял %.0f мс (бюджет %.0f мс)", IMPORT_TIME_MS, budget_ms)
+    return True
+
+def create_bot(token: str = BOT_TOKEN) -> Bot:
+    """Создаёт бота; TELEGRAM_API_URL позволяет направить его на локальный сервер Bot API."""
+    api_url = get_config().telegram_api_url
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    return Bot(token=token, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+
+def create_dispatcher(storage: BaseStorage) -> Dispatcher:
+    """Создаёт диспетчер со всеми роутерами и middleware бота."""
+    dp = Dispatcher(storage=storage)
+    dp.include_router(common_router)
+    dp.include_router(guide_router)  # Подключаем guide_router
+    dp.include_router(traveler_router)
+    dp.include_router(admin_router)
+
+    config = get_config()
+    dp.update.outer_middleware(UpdateContextMiddleware(config.log_slow_update_ms))
+    # Контекст обработчика ставится до троттлинга, чтобы отброшенные нажатия тоже были подписаны
+    handler_context = HandlerContextMiddleware()
+    dp.message.middleware(handler_context)
+    dp.callback_query.middleware(handler_context)
+
+    # Поиск маршрутов дороже остальных обработчиков, поэтому лимит для него строже
+    search_limit = (config.throttle_search_rate, config.throttle_search_burst)
+    throttling = ThrottlingMiddleware(
+        rate=config.throttle_rate,
+        burst=config.throttle_burst,
+        handler_limits={
+            "handle_search_excursions": search_limit,
+            "process_excursions_page": search_limit,
+        },
+    )
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    return dp
 
 async def main():
     """Основная функция для запуска бота."""
     if not BOT_TOKEN or not BOT_TOKEN.strip():
         raise ValueError("BOT_TOKEN отсутствует или пуст в переменных окружения!")
 
+    await init_db()
+
     storage = MemoryStorage()
-    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
+    bot = create_bot()
 
     router = Router()
-    dp = Dispatcher(storage=storage)
-    dp.include_router(common_router)
-    dp.include_router(guide_router)  # Подключаем guide_router
+    dp = create_dispatcher(storage)
 
     # Временный обработчик в main.py (можно убрать позже)
     @router.message(Command("start"))
@@ -39,20 +94,55 @@ async def main():
 
     logger.info("Роутер зарегистрирован")
 
+    # Модули фоновых задач импортируются здесь, а не при загрузке: --check-imports
+    # измеряет только то, что нужно для приёма обновлений
+    from retention import retention_loop
+    from digest import digest_loop
+    from reminders import reminder_loop
+    from snapshot import snapshot_loop
+    from backup import backup_loop
+    from ranking import ranking_loop
+    from api_usage import usage_loop, flush_usage
+
+    tasks = [
+        asyncio.create_task(retention_loop()),
+        asyncio.create_task(digest_loop(bot)),
+        asyncio.create_task(reminder_loop()),
+        asyncio.create_task(snapshot_loop()),
+        asyncio.create_task(backup_loop()),
+        asyncio.create_task(ranking_loop()),
+        asyncio.create_task(usage_loop()),
+    ]
+
     try:
         logger.info("Бот запущен")
         await dp.start_polling(bot)
     except Exception as e:
-        logger.error(f"Ошибка при запуске бота: {e}")
+        logger.error("Ошибка при запуске бота: %s", e)
         raise
     finally:
+        for task in tasks:
+            task.cancel()
+        # Задачи должны завершиться до закрытия очереди записи, иначе их последняя запись потеряется
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await flush_usage()
+        except Exception as e:
+            logger.error("Ошибка сохранения расхода API при остановке: %s", e)
+        await close_write_queue()
+        if "yandex_API" in sys.modules:
+            await sys.modules["yandex_API"].close_session()
         await bot.session.close()
         await storage.close()
         logger.info("Бот остановлен")
 
 if __name__ == "__main__":
+    # Режим проверки для деплоя: python main.py --check-imports
+    if "--check-imports" in sys.argv:
+        sys.exit(0 if check_import_budget() else 1)
+    check_import_budget()
     try:
         asyncio.run(main())
     except (ValueError, Exception) as e:
-        logger.critical(f"Критическая ошибка при запуске: {e}")
-        exit(1)
+        logger.critical("Критическая ошибка при запуске: %s", e)
+        sys.exit(1)
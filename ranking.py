@@ -0,0 +1,165 @@
+# ranking.py
+import asyncio
+import logging
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from config import get_config
+from database import (
+    get_score_inputs, get_changed_excursion_ids, save_excursion_scores,
+    get_top_excursions, get_user_affinity_sources
+)
+
+logger = logging.getLogger(__name__)
+
+# Окно, за которое считается скорость бронирований
+BOOKING_WINDOW_DAYS = 14
+# Через сколько дней бонус за новизну маршрута уменьшается вдвое
+RECENCY_HALF_LIFE_DAYS = 30
+# Априорный рейтинг: маршрут с парой отзывов не обгоняет проверенные только за счёт одной пятёрки
+PRIOR_RATING = 3.5
+PRIOR_REVIEWS = 5
+# Веса составляющих общей оценки
+WEIGHT_BOOKINGS = 1.0
+WEIGHT_RATING = 2.0
+WEIGHT_RECENCY = 1.0
+
+# Сколько лучших маршрутов переупорядочивается под интересы пользователя
+RERANK_POOL = 100
+# Веса совпадений с интересами пользователя
+AFFINITY_CITY = 1.5
+AFFINITY_THEME = 1.0
+AFFINITY_GUIDE = 0.5
+AFFINITY_KEYWORD = 0.5
+# Профили интересов кэшируются ненадолго: новые бронирования учитываются с небольшой задержкой
+PROFILE_TTL_SECONDS = 600
+PROFILE_CACHE_SIZE = 10000
+
+# Последние учтённые ID бронирований и отзывов для инкрементального обновления
+_watermarks = {"booking": 0, "review": 0}
+_profiles: Dict[int, Tuple[float, "UserProfile"]] = {}
+
+def _bayesian_rating(rating: Optional[float], count: Optional[int]) -> float:
+    """Сглаживает средний рейтинг к априорному значению при малом числе отзывов."""
+    count = count or 0
+    return ((rating or 0) * count + PRIOR_RATING * PRIOR_REVIEWS) / (count + PRIOR_REVIEWS)
+
+def compute_score(row: Dict[str, Any], now: datetime) -> float:
+    """Общая оценка маршрута: скорость бронирований, рейтинг маршрута и гида, новизна."""
+    bookings = math.log1p(row["recent_bookings"] or 0)
+    rating = (
+        _bayesian_rating(row["rating"], row["review_count"])
+        + _bayesian_rating(row["guide_rating"], row["guide_review_count"])
+    ) / 10
+    recency = 0.0
+    if row["created_at"]:
+        age_days = max((now - datetime.fromisoformat(row["created_at"])).total_seconds() / 86400, 0)
+        recency = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return WEIGHT_BOOKINGS * bookings + WEIGHT_RATING * rating + WEIGHT_RECENCY * recency
+
+async def score_excursions(excursion_ids: Optional[Sequence[int]] = None) -> int:
+    """Пересчитывает оценки указанных маршрутов (всех одобренных при None) и возвращает их число."""
+    now = datetime.now()
+    since = (now - timedelta(days=BOOKING_WINDOW_DAYS)).isoformat()
+    rows = await get_score_inputs(since, excursion_ids)
+    await save_excursion_scores([(row["id"], compute_score(row, now)) for row in rows])
+    return len(rows)
+
+async def refresh_scores(full: bool = False) -> int:
+    """Пересчитывает оценки изменившихся маршрутов (или всех при full) и возвращает их число."""
+    changed, max_booking_id, max_review_id = await get_changed_excursion_ids(
+        _watermarks["booking"], _watermarks["review"]
+    )
+    updated = await score_excursions(None if full else changed)
+    _watermarks["booking"] = max_booking_id
+    _watermarks["review"] = max_review_id
+    return updated
+
+async def ranking_loop() -> None:
+    """Обновляет оценки маршрутов в фоне; задача создаётся при старте бота.
+
+    Между полными пересчётами обновляются только маршруты с новыми бронированиями
+    и отзывами, полный пересчёт учитывает старение окна бронирований и новизны.
+    """
+    config = get_config()
+    full_interval = config.ranking_full_refresh_minutes * 60
+    # Отсчёт monotonic() произволен (например, с загрузки хоста), поэтому первый проход всегда полный
+    last_full = float("-inf")
+    while True:
+        try:
+            full = time.monotonic() - last_full >= full_interval
+            updated = await refresh_scores(full)
+            if full:
+                last_full = time.monotonic()
+                logger.info("Полный пересчёт оценок маршрутов: %s", updated)
+        except Exception as e:
+            logger.error("Ошибка обновления оценок маршрутов: %s", e)
+        await asyncio.sleep(config.ranking_interval_seconds)
+
+@dataclass
+class UserProfile:
+    """Интересы путешественника по прошлым бронированиям и заявкам."""
+    cities: Counter = field(default_factory=Counter)
+    themes: Counter = field(default_factory=Counter)
+    guides: Counter = field(default_factory=Counter)
+    keywords: Set[str] = field(default_factory=set)
+
+    def is_empty(self) -> bool:
+        return not (self.cities or self.themes or self.guides or self.keywords)
+
+async def get_user_profile(user_id: int) -> UserProfile:
+    """Возвращает профиль интересов пользователя из кэша или строит его одним обращением к базе."""
+    cached = _profiles.get(user_id)
+    if cached is not None and time.monotonic() - cached[0] < PROFILE_TTL_SECONDS:
+        return cached[1]
+    sources = await get_user_affinity_sources(user_id)
+    profile = UserProfile()
+    for booking in sources["bookings"]:
+        if booking["city_id"]:
+            profile.cities[booking["city_id"]] += 1
+        if booking["theme"]:
+            profile.themes[booking["theme"].lower()] += 1
+        profile.guides[booking["guide_id"]] += 1
+    for request in sources["requests"]:
+        if request["city_id"]:
+            profile.cities[request["city_id"]] += 1
+        profile.keywords.update(word.lower() for word in (request["keywords"] or "").replace(",", " ").split())
+    if len(_profiles) >= PROFILE_CACHE_SIZE:
+        _profiles.pop(next(iter(_profiles)))
+    _profiles[user_id] = (time.monotonic(), profile)
+    return profile
+
+def affinity(profile: UserProfile, excursion: Dict[str, Any]) -> float:
+    """Бонус к оценке маршрута за совпадение с интересами пользователя."""
+    score = 0.0
+    if excursion["city_id"] and profile.cities[excursion["city_id"]]:
+        score += AFFINITY_CITY
+    if profile.themes[(excursion["theme"] or "").lower()]:
+        score += AFFINITY_THEME
+    if profile.guides[excursion["guide_id"]]:
+        score += AFFINITY_GUIDE
+    if profile.keywords:
+        words = set(f"{excursion['title']} {excursion['keywords'] or ''}".lower().replace(",", " ").split())
+        score += AFFINITY_KEYWORD * len(profile.keywords & words)
+    return score
+
+async def get_ranked_page(user_id: int, page: int = 0, page_size: int = 5) -> Tuple[List[Dict[str, Any]], bool]:
+    """Возвращает страницу лучших маршрутов с учётом интересов пользователя.
+
+    Верхние RERANK_POOL маршрутов читаются по индексу оценок и переупорядочиваются
+    под профиль; дальние страницы отдаются в общем порядке оценок.
+    """
+    start = page * page_size
+    if start + page_size <= RERANK_POOL:
+        pool = await get_top_excursions(RERANK_POOL + 1)
+        has_more = len(pool) > start + page_size
+        pool = pool[:RERANK_POOL]
+        profile = await get_user_profile(user_id)
+        if not profile.is_empty():
+            pool.sort(key=lambda excursion: excursion["score"] + affinity(profile, excursion), reverse=True)
+        return pool[start:start + page_size], has_more
+    rows = await get_top_excursions(page_size + 1, start)
+    return rows[:page_size], len(rows) > page_size
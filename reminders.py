@@ -0,0 +1,103 @@
+# reminders.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Dict, List, Tuple, TypeVar
+from config import get_config
+from database import get_reminder_targets, add_reminders
+from constants import NOTIFICATION_REMINDER, NOTIFICATION_KIND_REMINDER
+from utils import get_weather_recommendation
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Предполагаем, что у пользователя есть текущая геолокация (добавим позже)
+DEFAULT_USER_LOCATION = {"lat": 55.7558, "lon": 37.6173}  # Пример: Москва
+
+async def _bounded(semaphore: asyncio.Semaphore, coroutine: Awaitable[T]) -> T:
+    """Выполняет корутину, не превышая лимит одновременных внешних запросов."""
+    async with semaphore:
+        return await coroutine
+
+async def build_reminders(targets: List[Dict[str, Any]], now: datetime) -> List[Tuple[int, str, str]]:
+    """Собирает тексты напоминаний для группы бронирований.
+
+    Погода и маршрут запрашиваются один раз на экскурсию и параллельно,
+    с ограничением числа одновременных запросов к Яндекс API.
+    """
+    import yandex_API
+
+    excursions: Dict[int, Dict[str, Any]] = {}
+    for target in targets:
+        excursions.setdefault(target["excursion_id"], target)
+    semaphore = asyncio.Semaphore(get_config().reminder_concurrency)
+    weather_results, travel_results = await asyncio.gather(
+        asyncio.gather(*(
+            _bounded(semaphore, yandex_API.get_weather(
+                target["lat"], target["lon"], datetime.fromisoformat(target["start_time"])
+            ))
+            for target in excursions.values()
+        )),
+        asyncio.gather(*(
+            _bounded(semaphore, yandex_API.get_travel_info(
+                DEFAULT_USER_LOCATION, {"lat": target["lat"], "lon": target["lon"]}
+            ))
+            for target in excursions.values()
+        )),
+    )
+    weather_by_excursion = dict(zip(excursions, weather_results))
+    travel_by_excursion = dict(zip(excursions, travel_results))
+
+    reminders = []
+    for target in targets:
+        start_time = datetime.fromisoformat(target["start_time"])
+        if start_time < now:
+            continue  # Экскурсия уже прошла
+        weather = weather_by_excursion[target["excursion_id"]]
+        travel_time, map_link = travel_by_excursion[target["excursion_id"]]
+        time_until = (start_time - now).total_seconds() / 3600  # В часах
+        message = NOTIFICATION_REMINDER.format(
+            title=target["title"],
+            time=f"{time_until:.1f} ч",
+            start_location=f"({target['lat']}, {target['lon']})",
+            travel_time=f"{travel_time} мин",
+            weather=weather,
+            recommendation=get_weather_recommendation(weather),
+            map_link=map_link,
+            booking_id=target["booking_id"]
+        )
+        reminders.append((target["user_id"], message, NOTIFICATION_KIND_REMINDER))
+    return reminders
+
+async def send_reminders_for_window(window_start: datetime, window_end: datetime) -> int:
+    """Ставит в очередь напоминания обо всех экскурсиях, начинающихся в окне."""
+    targets = await get_reminder_targets(window_start, window_end)
+    if not targets:
+        return 0
+    reminders = await build_reminders(targets, datetime.now())
+    # Напоминания и отметка о них пишутся вместе: после перезапуска эти бронирования не попадут в выборку
+    await add_reminders(reminders, [(target["booking_id"], target["start_time"]) for target in targets])
+    logger.info(
+        "Запланировано напоминаний: %s (%s – %s)",
+        len(reminders), window_start.strftime("%d.%m %H:%M"), window_end.strftime("%H:%M")
+    )
+    return len(reminders)
+
+async def reminder_loop() -> None:
+    """Периодически напоминает о бронированиях, до которых осталось не больше lead; задача создаётся при старте бота.
+
+    Окно всегда начинается с текущего момента: уже отправленные напоминания
+    отсекает отметка в bookings, поэтому после простоя бот досылает
+    пропущенные напоминания, а после перезапуска не повторяет отправленные.
+    """
+    config = get_config()
+    lead = timedelta(hours=config.reminder_lead_hours)
+    interval = timedelta(minutes=config.reminder_interval_minutes)
+    while True:
+        now = datetime.now()
+        try:
+            await send_reminders_for_window(now, now + lead + interval)
+        except Exception as e:
+            logger.error("Ошибка при рассылке напоминаний: %s", e)
+        await asyncio.sleep(interval.total_seconds())
@@ -0,0 +1,69 @@
+# retention.py
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List
+from config import get_config
+from database import archive_rows, compact_database
+
+logger = logging.getLogger(__name__)
+
+# Пауза между пачками, чтобы архивация не занимала блокировку записи подряд
+BATCH_PAUSE_SECONDS = 0.05
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Правило хранения: строки таблицы старше days дней и подходящие под условие уходят в архив."""
+    table: str
+    days: int
+    condition: str = "1 = 1"
+
+def get_policies() -> List[RetentionPolicy]:
+    """Возвращает правила хранения из настроек; 0 дней отключает правило."""
+    config = get_config()
+    policies = [
+        RetentionPolicy("notifications", config.retention_notifications_days, "is_sent != 0"),
+        RetentionPolicy("requests", config.retention_requests_days),
+        # На бронирование ссылается отзыв, а бронирование на будущий сеанс ещё действует
+        RetentionPolicy(
+            "bookings", config.retention_bookings_days,
+            "NOT EXISTS (SELECT 1 FROM reviews r WHERE r.booking_id = bookings.id) "
+            "AND (session_date IS NULL OR session_date < strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))"
+        ),
+    ]
+    return [policy for policy in policies if policy.days > 0]
+
+async def apply_policy(policy: RetentionPolicy, batch_size: int) -> int:
+    """Переносит в архив все устаревшие строки таблицы небольшими пачками."""
+    cutoff = (datetime.now() - timedelta(days=policy.days)).isoformat()
+    condition = f"({policy.condition}) AND created_at < ?"
+    total = 0
+    while True:
+        moved = await archive_rows(policy.table, condition, (cutoff,), batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+async def run_retention() -> None:
+    """Применяет все правила хранения и уплотняет файл базы."""
+    config = get_config()
+    for policy in get_policies():
+        try:
+            moved = await apply_policy(policy, config.retention_batch_size)
+            if moved:
+                logger.info("Перенесено в архив %s строк из %s", moved, policy.table)
+        except Exception as e:
+            logger.error("Ошибка архивации таблицы %s: %s", policy.table, e)
+    try:
+        await compact_database(config.retention_vacuum_pages)
+    except Exception as e:
+        logger.error("Ошибка уплотнения базы: %s", e)
+
+async def retention_loop() -> None:
+    """Периодически запускает архивацию; задача создаётся при старте бота."""
+    interval = get_config().retention_interval_minutes * 60
+    while True:
+        await run_retention()
+        await asyncio.sleep(interval)
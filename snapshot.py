@@ -0,0 +1,17 @@
+# snapshot.py
+import asyncio
+import logging
+from config import get_config
+from database import refresh_snapshot
+
+logger = logging.getLogger(__name__)
+
+async def snapshot_loop() -> None:
+    """Периодически обновляет снимок базы для отчётов админки; задача создаётся при старте бота."""
+    interval = get_config().snapshot_refresh_minutes * 60
+    while True:
+        try:
+            await refresh_snapshot()
+        except Exception as e:
+            logger.error("Ошибка обновления снимка базы: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,39 @@
+# tests/conftest.py
+import asyncio
+import dataclasses
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Модули бота читают настройки при импорте, поэтому база тестов задаётся до импорта
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "bot_database.db")
+os.environ.setdefault("BOT_TOKEN", "42:TEST")
+
+import config as config_module
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Подменяет отдельные настройки на время теста: configure(breaker_failure_threshold=2)."""
+    def apply(**overrides):
+        monkeypatch.setattr(config_module, "_config", dataclasses.replace(config_module.get_config(), **overrides))
+    return apply
+
+@pytest.fixture
+def run_db():
+    """Выполняет асинхронный сценарий на тестовой базе: run_db(scenario, "bookings", ...) очищает таблицы перед ним."""
+    import database
+
+    def run(scenario, *tables):
+        async def main():
+            await database.init_db()
+            try:
+                await database._write_queue.submit([(f"DELETE FROM {table}", ()) for table in tables])
+                return await scenario()
+            finally:
+                await database._write_queue.close()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,51 @@
+# tests/test_api_usage.py
+import asyncio
+import pytest
+import api_usage
+import yandex_API
+
+@pytest.fixture(autouse=True)
+def clean_state(configure):
+    configure(api_daily_budgets={"weather": 10}, api_budget_reserve=0.2)
+    api_usage._daily_calls.clear()
+    api_usage._pending.clear()
+    yandex_API._breakers.clear()
+    yandex_API._last_weather.clear()
+    yield
+    api_usage._daily_calls.clear()
+    api_usage._pending.clear()
+    yandex_API._breakers.clear()
+    yandex_API._last_weather.clear()
+
+def test_allow_call_reserves_budget_before_request():
+    # Вызовы подряд без record_call — как одновременные запросы, ещё не дождавшиеся ответа
+    allowed = [api_usage.allow_call("weather", has_substitute=False) for _ in range(15)]
+    assert allowed.count(True) == 10
+    assert api_usage._daily_calls["weather"] == 10
+    assert api_usage._counters("weather").throttled == 5
+
+def test_reserve_is_kept_for_callers_without_substitute():
+    assert sum(api_usage.allow_call("weather", has_substitute=True) for _ in range(10)) == 8
+    assert api_usage.allow_call("weather", has_substitute=False)
+    assert api_usage.allow_call("weather", has_substitute=False)
+    assert not api_usage.allow_call("weather", has_substitute=False)
+
+def test_release_call_returns_reservation():
+    for _ in range(10):
+        assert api_usage.allow_call("weather", has_substitute=False)
+    api_usage.release_call("weather")
+    assert api_usage.allow_call("weather", has_substitute=False)
+    assert not api_usage.allow_call("weather", has_substitute=False)
+
+def test_unlimited_endpoint_still_counts_calls():
+    assert all(api_usage.allow_call("taxi", has_substitute=False) for _ in range(100))
+    assert api_usage._daily_calls["taxi"] == 100
+
+def test_open_circuit_releases_reservation():
+    breaker = yandex_API.get_breaker("weather")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == "open"
+    assert asyncio.run(yandex_API.get_weather(55.75, 37.62, None)) == "Неизвестно"
+    assert api_usage._daily_calls.get("weather", 0) == 0
+    assert api_usage._counters("weather").calls == 0
@@ -0,0 +1,73 @@
+# tests/test_backup.py
+import os
+import sqlite3
+from datetime import datetime
+import pytest
+import backup
+
+@pytest.fixture
+def database(tmp_path, configure):
+    configure(backup_keep=2, backup_pre_restore_keep=1, backup_step_pause_ms=0)
+    db_name = str(tmp_path / "bot_database.db")
+    db = sqlite3.connect(db_name)
+    db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    db.executemany("INSERT INTO items (name) VALUES (?)", [(f"item {i}",) for i in range(100)])
+    db.commit()
+    db.close()
+    return db_name
+
+def _count_items(db_name):
+    db = sqlite3.connect(db_name)
+    try:
+        return db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    finally:
+        db.close()
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 1, 1, 12, 0, 0)
+
+def test_backup_verifies_and_restores(database, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    info = backup.create_backup_sync(database, backup_dir)
+    backup.verify_backup(info.path)
+
+    db = sqlite3.connect(database)
+    db.execute("DELETE FROM items")
+    db.commit()
+    db.close()
+    safety_copy = backup.restore_backup(info.path, database)
+    assert _count_items(database) == 100
+    assert safety_copy.path.endswith(backup.PRE_RESTORE_LABEL + backup.BACKUP_SUFFIX)
+
+def test_corrupted_backup_is_rejected(database, tmp_path):
+    info = backup.create_backup_sync(database, str(tmp_path / "backups"))
+    with open(info.path, "ab") as file:
+        file.write(b"garbage")
+    with pytest.raises(backup.BackupError):
+        backup.verify_backup(info.path)
+    with pytest.raises(backup.BackupError):
+        backup.restore_backup(info.path, database)
+    assert _count_items(database) == 100
+
+def test_backups_taken_at_the_same_time_get_distinct_names(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "datetime", _FrozenDatetime)
+    backup_dir = str(tmp_path / "backups")
+    first = backup.create_backup_sync(database, backup_dir)
+    second = backup.create_backup_sync(database, backup_dir)
+    assert first.path != second.path
+    assert backup.list_backups(backup_dir, database) == [second.path, first.path]
+    backup.verify_backup(first.path)
+    backup.verify_backup(second.path)
+
+def test_rotation_keeps_regular_and_pre_restore_copies_separately(database, tmp_path):
+    backup_dir = str(tmp_path / "backups")
+    regular = [backup.create_backup_sync(database, backup_dir).path for _ in range(3)]
+    for _ in range(3):
+        backup.restore_backup(regular[-1], database)
+    backups = backup.list_backups(backup_dir, database)
+    pre_restore = [path for path in backups if path.endswith(backup.PRE_RESTORE_LABEL + backup.BACKUP_SUFFIX)]
+    assert len(pre_restore) == 1
+    assert sorted(set(backups) - set(pre_restore)) == regular[1:]
+    assert not os.path.exists(regular[0] + backup.CHECKSUM_SUFFIX)
@@ -0,0 +1,37 @@
+# tests/test_cards.py
+import pytest
+import cards
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cards._cards.clear()
+    cards._guide_cards.clear()
+    yield
+    cards._cards.clear()
+    cards._guide_cards.clear()
+
+def _excursion(excursion_id, guide_id=1, title="Прогулка"):
+    return {"id": excursion_id, "guide_id": guide_id, "title": title, "city": "Москва", "theme": "история"}
+
+def test_card_is_rendered_again_only_after_invalidation():
+    assert "Прогулка" in cards.render_card(_excursion(1), "announcement")
+    assert "Прогулка" in cards.render_card(_excursion(1, title="Другое"), "announcement")
+    cards.invalidate_excursion(1)
+    assert "Другое" in cards.render_card(_excursion(1, title="Другое"), "announcement")
+
+def test_guide_invalidation_drops_all_cards_of_the_guide():
+    cards.render_card(_excursion(1, guide_id=5), "announcement")
+    cards.render_card(_excursion(2, guide_id=5), "announcement")
+    cards.render_card(_excursion(3, guide_id=6), "announcement")
+    cards.invalidate_guide(5)
+    assert set(cards._cards) == {("announcement", 3)}
+    assert cards._guide_cards == {6: {("announcement", 3)}}
+
+def test_cache_and_guide_index_stay_bounded(monkeypatch):
+    monkeypatch.setattr(cards, "CARD_CACHE_SIZE", 3)
+    for excursion_id in range(1, 11):
+        cards.render_card(_excursion(excursion_id, guide_id=excursion_id), "announcement")
+        # Инвалидация ещё не закэшированного маршрута ничего не добавляет
+        cards.invalidate_excursion(excursion_id + 100)
+    assert [key[1] for key in cards._cards] == [8, 9, 10]
+    assert set(cards._guide_cards) == {8, 9, 10}
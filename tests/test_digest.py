@@ -0,0 +1,81 @@
+# tests/test_digest.py
+import sqlite3
+from datetime import datetime, timedelta
+from aiogram.exceptions import TelegramForbiddenError
+import pytest
+import database
+import digest
+
+TABLES = ("notifications", "notification_preferences")
+
+class FakeBot:
+    """Записывает отправленные сообщения; получателям из failing отвечает ошибкой."""
+
+    def __init__(self, failing=None):
+        self.failing = failing or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.failing:
+            raise self.failing[chat_id]
+        self.sent.append((chat_id, text))
+
+@pytest.fixture(autouse=True)
+def settings(configure):
+    configure(digest_instant_window_seconds=60, digest_max_attempts=2)
+
+def _notification(user_id, kind, age_seconds, message="событие"):
+    created_at = (datetime.now() - timedelta(seconds=age_seconds)).isoformat()
+    return (
+        "INSERT INTO notifications (user_id, message, created_at, kind) VALUES (?, ?, ?, ?)",
+        (user_id, message, created_at, kind)
+    )
+
+def _states():
+    with sqlite3.connect(database.DB_NAME) as db:
+        return db.execute("SELECT user_id, is_sent, attempts FROM notifications ORDER BY id").fetchall()
+
+def test_only_groups_past_their_window_are_sent(run_db):
+    bot = FakeBot()
+
+    async def scenario():
+        await database.set_notification_mode(2, "daily")
+        await database._write_queue.submit([
+            _notification(1, "booking", 120),
+            _notification(1, "request", 10),
+            _notification(2, "booking", 7200),
+            _notification(2, "reminder", 0),
+        ])
+        return await digest.send_digests(bot)
+
+    assert run_db(scenario, *TABLES) == 2
+    # Свежая заявка ждёт окна, дайджест режима «раз в день» удерживается, напоминание уходит сразу
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 2]
+    assert _states() == [(1, 1, 0), (1, 0, 0), (2, 0, 0), (2, 1, 0)]
+
+def test_groups_are_read_in_pages(run_db, monkeypatch):
+    monkeypatch.setattr(digest, "GROUPS_PAGE_SIZE", 2)
+    bot = FakeBot()
+
+    async def scenario():
+        await database._write_queue.submit([_notification(user_id, "booking", 120) for user_id in range(1, 6)])
+        return await digest.send_digests(bot)
+
+    assert run_db(scenario, *TABLES) == 5
+    assert [chat_id for chat_id, _ in bot.sent] == [1, 2, 3, 4, 5]
+
+def test_failed_delivery_is_retried_up_to_the_limit(run_db):
+    bot = FakeBot({1: RuntimeError("timeout"), 2: TelegramForbiddenError(None, "bot was blocked by the user")})
+
+    async def scenario():
+        await database._write_queue.submit([_notification(1, "booking", 120), _notification(2, "booking", 120)])
+        await digest.send_digests(bot)
+        first = _states()
+        await digest.send_digests(bot)
+        return first, _states(), await digest.send_digests(bot)
+
+    first, second, sent = run_db(scenario, *TABLES)
+    # Заблокировавшему бота больше не пишем, временная ошибка повторяется до DIGEST_MAX_ATTEMPTS
+    assert first == [(1, 0, 1), (2, database.NOTIFICATION_FAILED, 2)]
+    assert second == [(1, database.NOTIFICATION_FAILED, 2), (2, database.NOTIFICATION_FAILED, 2)]
+    assert sent == 0
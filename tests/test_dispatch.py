@@ -0,0 +1,85 @@
+# tests/test_dispatch.py
+import asyncio
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router, types
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+import pytest
+from dispatch import BookCallback, CallbackButtons, ReplyButtons
+
+USER_ID = 100
+BUTTON = "📖 Кнопка"
+
+class Form(StatesGroup):
+    text = State()
+
+@pytest.fixture
+def setup():
+    """Роутер с кнопками и вводом в состоянии FSM; middleware записывает выбранный обработчик."""
+    router = Router()
+    buttons = ReplyButtons(router)
+    callbacks = CallbackButtons(router)
+    calls = []
+    seen_handlers = []
+
+    @buttons(BUTTON)
+    async def on_button(message: types.Message, handler, **data):
+        calls.append(("button", handler.callback))
+
+    @callbacks(BookCallback)
+    async def on_book(callback: types.CallbackQuery, callback_data: BookCallback, handler, **data):
+        calls.append(("book", callback_data.excursion_id, handler.callback))
+
+    @router.message(Form.text)
+    async def on_text(message: types.Message):
+        calls.append(("text", message.text))
+
+    async def remember_handler(handler, event, data):
+        seen_handlers.append(data["handler"].callback)
+        return await handler(event, data)
+
+    router.message.middleware(remember_handler)
+    router.callback_query.middleware(remember_handler)
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp, calls, seen_handlers, on_button, on_book
+
+def _message(text):
+    chat = types.Chat(id=USER_ID, type="private")
+    user = types.User(id=USER_ID, is_bot=False, first_name="Test")
+    return types.Message(message_id=1, date=datetime.now(), chat=chat, from_user=user, text=text)
+
+def _feed(dp, event):
+    async def main():
+        bot = Bot("42:TEST")
+        key = StorageKey(bot_id=bot.id, chat_id=USER_ID, user_id=USER_ID)
+        await dp.storage.set_state(key, Form.text)
+        try:
+            field = "message" if isinstance(event, types.Message) else "callback_query"
+            await dp.feed_update(bot, types.Update(update_id=1, **{field: event}))
+        finally:
+            await bot.session.close()
+    asyncio.run(main())
+
+def test_reply_button_beats_fsm_input_and_overrides_handler(setup):
+    dp, calls, seen_handlers, on_button, _ = setup
+    _feed(dp, _message(BUTTON))
+    # Кнопка выигрывает у ввода в состоянии, а data["handler"] указывает на обработчик кнопки
+    assert calls == [("button", on_button)]
+    assert seen_handlers == [on_button]
+
+def test_other_text_reaches_fsm_handler(setup):
+    dp, calls, _, _, _ = setup
+    _feed(dp, _message("просто текст"))
+    assert calls == [("text", "просто текст")]
+
+def test_callback_button_gets_parsed_data_and_handler(setup):
+    dp, calls, seen_handlers, _, on_book = setup
+    user = types.User(id=USER_ID, is_bot=False, first_name="Test")
+    callback = types.CallbackQuery(
+        id="1", from_user=user, chat_instance="1", message=_message("меню"),
+        data=BookCallback(excursion_id=7).pack()
+    )
+    _feed(dp, callback)
+    assert calls == [("book", 7, on_book)]
+    assert seen_handlers == [on_book]
@@ -0,0 +1,49 @@
+# tests/test_reminders.py
+from datetime import datetime, timedelta
+import database
+
+TABLES = ("excursions", "excursion_dates", "bookings")
+
+def _setup_statements(now):
+    first = (now + timedelta(hours=3)).replace(microsecond=0).isoformat()
+    second = (now + timedelta(hours=6)).replace(microsecond=0).isoformat()
+    created_at = now.isoformat()
+    statements = [
+        ("INSERT INTO excursions (id, guide_id, title, is_approved) VALUES (1, 10, 'Прогулка', 1)", ()),
+        ("INSERT INTO excursion_dates (date, excursion_id) VALUES (?, 1)", (first,)),
+        ("INSERT INTO excursion_dates (date, excursion_id) VALUES (?, 1)", (second,)),
+        ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (1, 101, 1, ?, ?)", (created_at, first)),
+        ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (2, 102, 1, ?, ?)", (created_at, second)),
+        # Бронирование без даты сеанса относится к первой дате после оформления
+        ("INSERT INTO bookings (id, user_id, excursion_id, created_at) VALUES (3, 103, 1, ?)", (created_at,)),
+    ]
+    return statements, first, second
+
+def test_each_booking_is_reminded_only_about_its_session(run_db):
+    now = datetime.now()
+
+    async def scenario():
+        statements, first, second = _setup_statements(now)
+        await database._write_queue.submit(statements)
+        window_end = now + timedelta(days=1)
+        targets = await database.get_reminder_targets(now, window_end)
+        await database.add_reminders([], [(target["booking_id"], target["start_time"]) for target in targets])
+        return targets, await database.get_reminder_targets(now, window_end), first, second
+
+    targets, repeated, first, second = run_db(scenario, *TABLES)
+    assert sorted((target["booking_id"], target["start_time"]) for target in targets) == [
+        (1, first), (2, second), (3, first)
+    ]
+    # Отмеченные бронирования не возвращаются, даже когда в окне две даты маршрута
+    assert repeated == []
+
+def test_session_outside_window_is_not_reminded(run_db):
+    now = datetime.now()
+
+    async def scenario():
+        statements, first, _ = _setup_statements(now)
+        await database._write_queue.submit(statements)
+        return await database.get_reminder_targets(now, now + timedelta(hours=4)), first
+
+    targets, first = run_db(scenario, *TABLES)
+    assert sorted((target["booking_id"], target["start_time"]) for target in targets) == [(1, first), (3, first)]
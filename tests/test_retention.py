@@ -0,0 +1,44 @@
+# tests/test_retention.py
+import sqlite3
+from datetime import datetime, timedelta
+import database
+import retention
+
+def test_bookings_with_reviews_or_future_sessions_are_not_archived(run_db):
+    now = datetime.now()
+    created_at = (now - timedelta(days=400)).isoformat()
+    past = (now - timedelta(days=390)).replace(microsecond=0).isoformat()
+    future = (now + timedelta(days=1)).replace(microsecond=0).isoformat()
+    policy = next(policy for policy in retention.get_policies() if policy.table == "bookings")
+
+    async def scenario():
+        await database._write_queue.submit([
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (1, 7, 1, ?, ?)", (created_at, past)),
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (2, 7, 1, ?, ?)", (created_at, past)),
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (3, 7, 1, ?, ?)", (created_at, future)),
+            ("INSERT INTO reviews (user_id, guide_id, excursion_id, booking_id, rating) VALUES (7, 10, 1, 2, 5)", ()),
+        ])
+        return await retention.apply_policy(policy, batch_size=10)
+
+    assert run_db(scenario, "bookings", "reviews", "archive_batches") == 1
+    with sqlite3.connect(database.DB_NAME) as db:
+        assert [row[0] for row in db.execute("SELECT id FROM bookings ORDER BY id")] == [2, 3]
+
+def test_archived_rows_are_exported_to_csv(run_db, tmp_path):
+    created_at = (datetime.now() - timedelta(days=400)).isoformat()
+    path = str(tmp_path / "archive.csv")
+
+    async def scenario():
+        await database._write_queue.submit([
+            ("INSERT INTO requests (id, user_id, city, created_at) VALUES (?, 7, 'Казань', ?)", (request_id, created_at))
+            for request_id in (1, 2, 3)
+        ])
+        await database.archive_rows("requests", "created_at < ?", (datetime.now().isoformat(),), 2)
+        await database.archive_rows("requests", "created_at < ?", (datetime.now().isoformat(),), 2)
+        return await database.export_archived_rows("requests", path, limit=10)
+
+    assert run_db(scenario, "requests", "archive_batches") == 3
+    with open(path, encoding="utf-8-sig") as file:
+        lines = file.read().splitlines()
+    assert lines[0].startswith("id,user_id,city,")
+    assert sorted(line.split(",")[0] for line in lines[1:]) == ["1", "2", "3"]
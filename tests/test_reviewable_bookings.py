@@ -0,0 +1,29 @@
+# tests/test_reviewable_bookings.py
+from datetime import datetime, timedelta
+import database
+
+TABLES = ("excursions", "excursion_dates", "bookings", "reviews")
+
+def test_booking_becomes_reviewable_after_its_own_session(run_db):
+    now = datetime.now()
+    past = (now - timedelta(days=1)).replace(microsecond=0).isoformat()
+    future = (now + timedelta(days=1)).replace(microsecond=0).isoformat()
+    created_at = (now - timedelta(days=2)).isoformat()
+
+    async def scenario():
+        await database._write_queue.submit([
+            ("INSERT INTO excursions (id, guide_id, title, is_approved) VALUES (1, 10, 'Прогулка', 1)", ()),
+            ("INSERT INTO excursion_dates (date, excursion_id) VALUES (?, 1)", (past,)),
+            ("INSERT INTO excursion_dates (date, excursion_id) VALUES (?, 1)", (future,)),
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (1, 7, 1, ?, ?)", (created_at, past)),
+            # Сеанс ещё впереди, хотя более ранняя дата маршрута уже прошла
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (2, 7, 1, ?, ?)", (created_at, future)),
+            # Без даты сеанса: первая дата маршрута после оформления
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at) VALUES (3, 7, 1, ?)", (created_at,)),
+            ("INSERT INTO bookings (id, user_id, excursion_id, created_at, session_date) VALUES (4, 7, 1, ?, ?)", (created_at, past)),
+            ("INSERT INTO reviews (user_id, guide_id, excursion_id, booking_id, rating) VALUES (7, 10, 1, 4, 5)", ()),
+        ])
+        return await database.get_reviewable_bookings(7, now)
+
+    bookings = run_db(scenario, *TABLES)
+    assert [(booking["booking_id"], booking["session_date"]) for booking in bookings] == [(3, past), (1, past)]
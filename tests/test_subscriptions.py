@@ -0,0 +1,57 @@
+# tests/test_subscriptions.py
+import sqlite3
+import database
+
+async def _collect(targets, chunk_size):
+    return [chunk async for chunk in database.iter_subscribers(targets, chunk_size)]
+
+def test_subscribers_of_several_targets_are_merged_without_duplicates(run_db):
+    async def scenario():
+        for user_id in range(1, 11):
+            await database.subscribe(user_id, "guide", "7")
+        for user_id in range(5, 16, 2):
+            await database.subscribe(user_id, "city", "Москва")
+        await database.subscribe(3, "topic", "история")
+        await database.subscribe(99, "topic", "природа")
+        return await _collect([("guide", "7"), ("city", "Москва"), ("topic", "история")], chunk_size=4)
+
+    chunks = run_db(scenario, "subscriptions")
+    assert all(len(chunk) <= 4 for chunk in chunks)
+    assert [user_id for chunk in chunks for user_id in chunk] == [*range(1, 11), 11, 13, 15]
+
+def test_repeated_and_unnormalized_targets_are_read_once(run_db):
+    async def scenario():
+        for user_id in (2, 1, 3):
+            await database.subscribe(user_id, "city", "Санкт-Петербург")
+        return await _collect([("city", "санкт-петербург"), ("city", "  САНКТ-ПЕТЕРБУРГ ")], chunk_size=2)
+
+    assert run_db(scenario, "subscriptions") == [[1, 2], [3]]
+
+def test_no_subscribers_yields_nothing(run_db):
+    async def scenario():
+        return await _collect([("guide", "1"), ("city", "нигде")], chunk_size=10)
+
+    assert run_db(scenario, "subscriptions") == []
+
+def test_subscribers_are_read_in_pages(run_db, monkeypatch):
+    queries = []
+    real_connect = database.aiosqlite.connect
+
+    def counting_connect(*args, **kwargs):
+        queries.append(args)
+        return real_connect(*args, **kwargs)
+
+    async def scenario():
+        await database._write_queue.submit([
+            ("INSERT INTO subscriptions (kind, target, user_id, created_at) VALUES ('guide', '1', ?, '')", (user_id,))
+            for user_id in range(1, 26)
+        ])
+        monkeypatch.setattr(database.aiosqlite, "connect", counting_connect)
+        return await _collect([("guide", "1")], chunk_size=10)
+
+    chunks = run_db(scenario, "subscriptions")
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    # По запросу на пачку, без выборки всех подписчиков сразу; неполная пачка последняя
+    assert len(queries) == 3
+    with sqlite3.connect(database.DB_NAME) as db:
+        assert db.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0] == 25
@@ -0,0 +1,98 @@
+# tests/test_yandex_breaker.py
+import asyncio
+from aiohttp.test_utils import TestServer
+import pytest
+import yandex_API
+from fake_yandex_server import SETTINGS, create_app
+
+RESET_SECONDS = 0.2
+MOSCOW = (55.75, 37.62)
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yandex_API._breakers.clear()
+    yandex_API._last_weather.clear()
+    yield
+    yandex_API._breakers.clear()
+    yandex_API._last_weather.clear()
+
+@pytest.fixture
+def run_with_server(configure):
+    """Запускает поддельный API Яндекса, направляет на него погоду и выполняет сценарий."""
+    def run(scenario, **settings):
+        async def main():
+            app = create_app(**settings)
+            server = TestServer(app)
+            await server.start_server()
+            configure(
+                yandex_weather_url=str(server.make_url("/v2/forecast")),
+                breaker_failure_threshold=2, breaker_reset_seconds=RESET_SECONDS, api_cache_seconds=0
+            )
+            try:
+                await scenario(app[SETTINGS])
+            finally:
+                await yandex_API.close_session()
+                await server.close()
+        asyncio.run(main())
+    return run
+
+def test_breaker_opens_after_threshold_and_closes_after_successful_probe(run_with_server):
+    async def scenario(settings):
+        breaker = yandex_API.get_breaker("weather")
+        assert await yandex_API.get_weather(*MOSCOW, None) == "Неизвестно"
+        assert breaker.state == "closed"
+        assert await yandex_API.get_weather(*MOSCOW, None) == "Неизвестно"
+        assert breaker.state == "open"
+        # Пока цепь разомкнута, запрос не отправляется даже к исправному сервису
+        settings["error_rate"] = 0.0
+        assert await yandex_API.get_weather(*MOSCOW, None) == "Неизвестно"
+        assert breaker.state == "open"
+
+        await asyncio.sleep(RESET_SECONDS)
+        assert breaker.state == "half_open"
+        assert await yandex_API.get_weather(*MOSCOW, None) == "12°C, cloudy"
+        assert breaker.state == "closed"
+        assert breaker.failures == 0
+
+    run_with_server(scenario, error_rate=1.0)
+
+def test_failed_probe_opens_circuit_again(run_with_server):
+    async def scenario(settings):
+        breaker = yandex_API.get_breaker("weather")
+        for _ in range(2):
+            await yandex_API.get_weather(*MOSCOW, None)
+        await asyncio.sleep(RESET_SECONDS)
+        assert breaker.state == "half_open"
+        await yandex_API.get_weather(*MOSCOW, None)
+        assert breaker.state == "open"
+
+    run_with_server(scenario, error_rate=1.0, error_status=500)
+
+def test_half_open_allows_single_probe():
+    breaker = yandex_API.CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_cancelled_probe_releases_half_open_slot(run_with_server):
+    async def scenario(settings):
+        breaker = yandex_API.get_breaker("weather")
+        for _ in range(2):
+            await yandex_API.get_weather(*MOSCOW, None)
+        await asyncio.sleep(RESET_SECONDS)
+        settings.update(error_rate=0.0, delay=5.0)
+        probe = asyncio.create_task(yandex_API.get_weather(*MOSCOW, None))
+        await asyncio.sleep(0.05)
+        assert not breaker.allow()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        settings["delay"] = 0.0
+        assert await yandex_API.get_weather(*MOSCOW, None) == "12°C, cloudy"
+        assert breaker.state == "closed"
+
+    run_with_server(scenario, error_rate=1.0)
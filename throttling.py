@@ -0,0 +1,119 @@
+# throttling.py
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_MESSAGE = "⏳ Слишком часто! Подожди немного."
+
+class TokenBucketStore:
+    """Компактное хранилище корзин токенов: ключ -> [токены, время обновления]."""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[int, str], List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def consume(self, key: Tuple[int, str], rate: float, capacity: int, now: float) -> bool:
+        """Забирает токен из корзины ключа; возвращает False, если токенов нет."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = [capacity - 1.0, now]
+            return True
+        tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def evict(self, now: float, idle_seconds: float) -> int:
+        """Удаляет корзины, которые не трогали дольше idle_seconds: они уже полные."""
+        stale = [key for key, bucket in self._buckets.items() if now - bucket[1] > idle_seconds]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничивает частоту вызова обработчиков для каждого пользователя.
+
+    Регистрируется как внутренний middleware (dp.message.middleware(...)), чтобы
+    знать выбранный обработчик. Лимит считается отдельно для каждой пары
+    «пользователь — обработчик»; одинаковые запросы из одного чата, пока
+    первый ещё обрабатывается, отбрасываются.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        handler_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        eviction_interval: float = 60.0,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.handler_limits = handler_limits or {}
+        self.eviction_interval = eviction_interval
+        self.buckets = TokenBucketStore()
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._last_eviction = time.monotonic()
+
+    def _limits(self, handler_name: str) -> Tuple[float, int]:
+        """Возвращает скорость пополнения и ёмкость корзины для обработчика."""
+        return self.handler_limits.get(handler_name, (self.rate, self.burst))
+
+    def _maybe_evict(self, now: float) -> None:
+        """Периодически чистит давно не использованные корзины."""
+        if now - self._last_eviction < self.eviction_interval:
+            return
+        self._last_eviction = now
+        # Корзина с минимальной скоростью наполняется за burst / rate секунд
+        slowest = min([self.rate] + [rate for rate, _ in self.handler_limits.values()])
+        largest = max([self.burst] + [burst for _, burst in self.handler_limits.values()])
+        evicted = self.buckets.evict(now, largest / slowest)
+        if evicted:
+            logger.debug("Удалено неактивных корзин: %s, осталось: %s", evicted, len(self.buckets))
+
+    @staticmethod
+    def _request_key(event: TelegramObject) -> Optional[Tuple[int, str]]:
+        """Возвращает ключ для поиска дублей: чат и содержимое запроса."""
+        if isinstance(event, Message):
+            return event.chat.id, f"m:{event.text or ''}"
+        if isinstance(event, CallbackQuery) and event.message:
+            return event.message.chat.id, f"c:{event.data or ''}"
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        handler_object = data.get("handler")
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        now = time.monotonic()
+        self._maybe_evict(now)
+
+        rate, capacity = self._limits(handler_name)
+        request_key = self._request_key(event)
+        # Дубль ещё не обработанного запроса отбрасываем, не расходуя токен
+        if request_key in self._in_flight or not self.buckets.consume((user.id, handler_name), rate, capacity, now):
+            if isinstance(event, CallbackQuery):
+                await event.answer(THROTTLED_MESSAGE)
+            return None
+
+        if request_key is None:
+            return await handler(event, data)
+        self._in_flight.add(request_key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(request_key)
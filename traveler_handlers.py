@@ -1,5 +1,8 @@
 # handlers/traveler_handlers.py
 import logging
+import sqlite3
+from datetime import date, datetime
+from typing import Any, Dict
 from aiogram import Router, types, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -7,15 +10,26 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from keyboards import get_traveler_keyboard
 from constants import (
     TRAVELER_WELCOME, ERROR_MESSAGE, NO_EXCURSIONS, BOOKING_SUCCESS,
-    REVIEW_SUCCESS, REQUEST_SUCCESS, NO_BOOKINGS
+    REVIEW_SUCCESS, REQUEST_SUCCESS, NO_BOOKINGS, NO_REVIEWABLE_BOOKINGS,
+    REVIEW_CHOOSE_BOOKING, REVIEW_ALREADY_EXISTS, SUBSCRIPTIONS_BUTTON, SUBSCRIPTION_LABELS,
+    SUBSCRIPTIONS_HEADER, SUBSCRIPTIONS_EMPTY, FOLLOW_DONE, UNFOLLOW_DONE, INVALID_CALLBACK
 )
 from database import (
-    get_excursions, book_excursion, add_review, get_bookings_by_user,
-    add_request, get_guide
+    book_excursion, add_review, add_request, get_excursion, ExcursionFilter,
+    search_excursions, get_user_bookings_with_excursions, get_reviewable_bookings, get_excursion_card,
+    subscribe, unsubscribe, get_user_subscriptions, SUBSCRIPTION_GUIDE, SUBSCRIPTION_CITY, SUBSCRIPTION_TOPIC
+)
+from cards import render_card
+from ranking import get_ranked_page
+from dispatch import (
+    ReplyButtons, CallbackButtons, BookCallback, PageCallback, FilterResetCallback, ReviewCallback,
+    FollowCallback, UnfollowCallback
 )
 from utils import notify_new_booking, notify_new_request
 
 router = Router()
+buttons = ReplyButtons(router)
+callbacks = CallbackButtons(router)
 logger = logging.getLogger(__name__)
 
 # Определяем состояния для создания заявки
@@ -28,103 +42,271 @@ class ReviewCreation(StatesGroup):
     rating = State()
     comment = State()
 
-@router.message(lambda message: message.text == "🌍 Я путешественник")
+# Определяем состояния для ввода условий фильтра
+class ExcursionFiltering(StatesGroup):
+    price = State()
+    dates = State()
+    text = State()
+
+# Количество маршрутов на одной странице выдачи
+PAGE_SIZE = 5
+
+async def get_active_filter(state: FSMContext) -> ExcursionFilter:
+    """Возвращает активный фильтр пользователя из FSM."""
+    data = await state.get_data()
+    return ExcursionFilter.from_dict(data.get("excursion_filter"))
+
+async def update_active_filter(state: FSMContext, **changes) -> ExcursionFilter:
+    """Изменяет активный фильтр пользователя и сохраняет его в FSM."""
+    excursion_filter = await get_active_filter(state)
+    for key, value in changes.items():
+        setattr(excursion_filter, key, value)
+    await state.update_data(excursion_filter=excursion_filter.to_dict())
+    return excursion_filter
+
+async def send_excursions_page(message: types.Message, user_id: int, state: FSMContext, page: int = 0):
+    """Отправляет страницу маршрутов, подходящих под активный фильтр пользователя."""
+    excursion_filter = await get_active_filter(state)
+    if excursion_filter.is_empty():
+        # Без фильтра показываем верхние маршруты по предрассчитанным оценкам
+        excursions, has_more = await get_ranked_page(user_id, page, PAGE_SIZE)
+    else:
+        excursions, has_more = await search_excursions(excursion_filter, page, PAGE_SIZE)
+    if not excursions:
+        await message.answer(NO_EXCURSIONS, reply_markup=await get_traveler_keyboard(user_id))
+        return
+    for excursion in excursions:
+        book_button = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Забронировать", callback_data=BookCallback(excursion_id=excursion["id"]).pack())],
+            [
+                InlineKeyboardButton(
+                    text=f"🔔 {SUBSCRIPTION_LABELS[kind]}",
+                    callback_data=FollowCallback(kind=kind, excursion_id=excursion["id"]).pack()
+                )
+                for kind in (SUBSCRIPTION_GUIDE, SUBSCRIPTION_CITY, SUBSCRIPTION_TOPIC)
+            ],
+        ])
+        await message.answer(render_card(excursion), reply_markup=book_button)
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=PageCallback(page=page - 1).pack()))
+    if has_more:
+        navigation.append(InlineKeyboardButton(text="Далее ➡️", callback_data=PageCallback(page=page + 1).pack()))
+    rows = [navigation] if navigation else []
+    if not excursion_filter.is_empty():
+        rows.append([InlineKeyboardButton(text="🧹 Сбросить фильтр", callback_data=FilterResetCallback().pack())])
+    await message.answer(
+        f"Страница {page + 1}",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=rows) if rows else await get_traveler_keyboard(user_id)
+    )
+
+@buttons("🌍 Я путешественник")
 async def handle_traveler_menu(message: types.Message, state: FSMContext):
     """Обрабатывает вход в меню путешественника."""
     try:
         await state.clear()
-        await message.answer(TRAVELER_WELCOME, reply_markup=get_traveler_keyboard())
+        await message.answer(TRAVELER_WELCOME, reply_markup=await get_traveler_keyboard(message.from_user.id))
     except Exception as e:
-        logger.error(f"Ошибка в handle_traveler_menu: {e}")
+        logger.error("Ошибка в handle_traveler_menu: %s", e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "🔍 Найти маршрут")
-async def handle_search_excursions(message: types.Message):
-    """Показывает доступные маршруты."""
+@buttons("🔍 Найти маршрут", "🗺️ Посмотреть экскурсии")
+async def handle_search_excursions(message: types.Message, state: FSMContext):
+    """Показывает первую страницу маршрутов с учётом активного фильтра."""
     try:
-        excursions = await get_excursions()
-        if not excursions:
-            await message.answer(NO_EXCURSIONS, reply_markup=get_traveler_keyboard())
-            return
-        for excursion in excursions:
-            guide = await get_guide(excursion["guide_id"])
-            book_button = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Забронировать", callback_data=f"book_{excursion['id']}")]
-            ])
-            message_text = (
-                f"Маршрут: {excursion['title']}\n"
-                f"Гид: {guide['first_name']} {guide['last_name']}\n"
-                f"Город: {excursion['city']}\n"
-                f"Тематика: {excursion['theme']}\n"
-                f"Описание: {excursion['description']}\n"
-                f"Стоимость: {excursion['price']} руб./чел.\n"
-                f"Даты: {', '.join(excursion['dates'])}\n"
-                f"Рейтинг гида: {guide['rating']:.1f} ({guide['review_count']} отзывов)"
-            )
-            await message.answer(message_text, reply_markup=book_button)
-        await message.answer("Вернуться в меню:", reply_markup=get_traveler_keyboard())
+        await send_excursions_page(message, message.from_user.id, state)
+    except Exception as e:
+        logger.error("Ошибка в handle_search_excursions: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@callbacks(PageCallback)
+async def process_excursions_page(callback: types.CallbackQuery, callback_data: PageCallback, state: FSMContext):
+    """Показывает следующую или предыдущую страницу маршрутов."""
+    try:
+        page = callback_data.page
+        await send_excursions_page(callback.message, callback.from_user.id, state, page)
+        await callback.answer()
+    except Exception as e:
+        logger.error("Ошибка в process_excursions_page: %s", e)
+        await callback.message.answer(ERROR_MESSAGE)
+        await callback.answer()
+
+@callbacks(FilterResetCallback)
+async def process_filter_reset(callback: types.CallbackQuery, state: FSMContext):
+    """Сбрасывает активный фильтр и показывает все маршруты."""
+    try:
+        await state.update_data(excursion_filter=None)
+        await send_excursions_page(callback.message, callback.from_user.id, state)
+        await callback.answer("Фильтр сброшен")
+    except Exception as e:
+        logger.error("Ошибка в process_filter_reset: %s", e)
+        await callback.message.answer(ERROR_MESSAGE)
+        await callback.answer()
+
+@buttons("💰 Фильтр по цене")
+async def handle_price_filter(message: types.Message, state: FSMContext):
+    """Запрашивает диапазон цен для фильтра."""
+    try:
+        await message.answer("Укажи диапазон цен в рублях, например 500-2000 (или просто 2000 как максимум):")
+        await state.set_state(ExcursionFiltering.price)
+    except Exception as e:
+        logger.error("Ошибка в handle_price_filter: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@router.message(ExcursionFiltering.price)
+async def process_price_filter(message: types.Message, state: FSMContext):
+    """Сохраняет диапазон цен в фильтре и показывает результаты."""
+    try:
+        parts = [part.strip() for part in message.text.replace("—", "-").split("-")]
+        if len(parts) == 1:
+            price_min, price_max = None, int(parts[0])
+        elif len(parts) == 2:
+            price_min = int(parts[0]) if parts[0] else None
+            price_max = int(parts[1]) if parts[1] else None
+        else:
+            raise ValueError(message.text)
+        if price_min is not None and price_max is not None and price_min > price_max:
+            price_min, price_max = price_max, price_min
+        await update_active_filter(state, price_min=price_min, price_max=price_max)
+        await state.set_state(None)
+        await send_excursions_page(message, message.from_user.id, state)
+    except ValueError:
+        await message.answer("Не получилось разобрать цены. Пример: 500-2000")
+    except Exception as e:
+        logger.error("Ошибка в process_price_filter: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@buttons("📅 Фильтр по дате")
+async def handle_date_filter(message: types.Message, state: FSMContext):
+    """Запрашивает даты для фильтра."""
+    try:
+        await message.answer("Укажи дату или период в формате ГГГГ-ММ-ДД, например 2025-06-01 - 2025-06-15:")
+        await state.set_state(ExcursionFiltering.dates)
+    except Exception as e:
+        logger.error("Ошибка в handle_date_filter: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@router.message(ExcursionFiltering.dates)
+async def process_date_filter(message: types.Message, state: FSMContext):
+    """Сохраняет период в фильтре и показывает результаты."""
+    try:
+        parts = message.text.split()
+        dates = [date.fromisoformat(part) for part in parts if part not in ("-", "—")]
+        if len(dates) not in (1, 2):
+            raise ValueError(message.text)
+        date_from, date_to = min(dates), max(dates)
+        await update_active_filter(state, date_from=date_from.isoformat(), date_to=date_to.isoformat())
+        await state.set_state(None)
+        await send_excursions_page(message, message.from_user.id, state)
+    except ValueError:
+        await message.answer("Не получилось разобрать даты. Пример: 2025-06-01 - 2025-06-15")
+    except Exception as e:
+        logger.error("Ошибка в process_date_filter: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@buttons("🔍 Поиск по ключевым словам")
+async def handle_text_filter(message: types.Message, state: FSMContext):
+    """Запрашивает ключевые слова для поиска."""
+    try:
+        await message.answer("Напиши ключевые слова, например: история набережная")
+        await state.set_state(ExcursionFiltering.text)
+    except Exception as e:
+        logger.error("Ошибка в handle_text_filter: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+@router.message(ExcursionFiltering.text)
+async def process_text_filter(message: types.Message, state: FSMContext):
+    """Сохраняет ключевые слова в фильтре и показывает результаты."""
+    try:
+        await update_active_filter(state, text=message.text.strip() or None)
+        await state.set_state(None)
+        await send_excursions_page(message, message.from_user.id, state)
     except Exception as e:
-        logger.error(f"Ошибка в handle_search_excursions: {e}")
+        logger.error("Ошибка в process_text_filter: %s", e)
         await message.answer(ERROR_MESSAGE)
 
-@router.callback_query(lambda c: c.data.startswith("book_"))
-async def process_book_excursion(callback: types.CallbackQuery, bot: Bot):
+@callbacks(BookCallback)
+async def process_book_excursion(callback: types.CallbackQuery, callback_data: BookCallback, bot: Bot):
     """Обрабатывает бронирование маршрута."""
     try:
-        excursion_id = int(callback.data.split("_")[1])
+        excursion_id = callback_data.excursion_id
         user_id = callback.from_user.id
         await book_excursion(user_id, excursion_id)  # Убираем booking_id
-        await callback.message.answer(BOOKING_SUCCESS, reply_markup=get_traveler_keyboard())
+        await callback.message.answer(BOOKING_SUCCESS, reply_markup=await get_traveler_keyboard(user_id))
         # Уведомляем гида о новом бронировании
-        excursion = next((e for e in await get_excursions() if e["id"] == excursion_id), None)
+        excursion = await get_excursion(excursion_id)
         if excursion:
             await notify_new_booking(bot, excursion["guide_id"], excursion["title"], user_id)
         await callback.answer()
     except Exception as e:
-        logger.error(f"Ошибка в process_book_excursion: {e}")
+        logger.error("Ошибка в process_book_excursion: %s", e)
         await callback.message.answer(ERROR_MESSAGE)
         await callback.answer()
 
-@router.message(lambda message: message.text == "📅 Мои бронирования")
+@buttons("📅 Мои бронирования")
 async def handle_my_bookings(message: types.Message):
     """Показывает бронирования путешественника."""
     try:
-        bookings = await get_bookings_by_user(message.from_user.id)
+        bookings = await get_user_bookings_with_excursions(message.from_user.id)
         if not bookings:
-            await message.answer(NO_BOOKINGS, reply_markup=get_traveler_keyboard())
+            await message.answer(NO_BOOKINGS, reply_markup=await get_traveler_keyboard(message.from_user.id))
             return
         for booking in bookings:
-            excursion = next((e for e in await get_excursions() if e["id"] == booking["excursion_id"]), None)
-            if excursion:
-                guide = await get_guide(excursion["guide_id"])
-                message_text = (
-                    f"Бронирование #{booking['id']}\n"
-                    f"Маршрут: {excursion['title']}\n"
-                    f"Гид: {guide['first_name']} {guide['last_name']}\n"
-                    f"Город: {excursion['city']}\n"
-                    f"Дата бронирования: {booking['created_at']}\n"
-                    f"Статус: {booking['status']}"
-                )
-                await message.answer(message_text)
-        await message.answer("Вернуться в меню:", reply_markup=get_traveler_keyboard())
+            message_text = (
+                f"Бронирование #{booking['booking_id']}\n"
+                f"{render_card(booking, 'booking')}\n"
+                f"Дата бронирования: {booking['booked_at']}\n"
+                f"Статус: {booking['status']}"
+            )
+            await message.answer(message_text)
+        await message.answer("Вернуться в меню:", reply_markup=await get_traveler_keyboard(message.from_user.id))
     except Exception as e:
-        logger.error(f"Ошибка в handle_my_bookings: {e}")
+        logger.error("Ошибка в handle_my_bookings: %s", e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "✍️ Оставить отзыв")
+@buttons("✍️ Оставить отзыв")
 async def handle_leave_review(message: types.Message, state: FSMContext):
-    """Начинает процесс оставления отзыва."""
+    """Начинает процесс оставления отзыва: предлагает выбрать прошедшее бронирование."""
     try:
-        bookings = await get_bookings_by_user(message.from_user.id)
+        bookings = await get_reviewable_bookings(message.from_user.id, datetime.now())
         if not bookings:
-            await message.answer("У тебя нет бронирований, чтобы оставить отзыв.", reply_markup=get_traveler_keyboard())
+            await message.answer(NO_REVIEWABLE_BOOKINGS, reply_markup=await get_traveler_keyboard(message.from_user.id))
             return
-        await message.answer("Укажи рейтинг (от 1 до 5):")
-        await state.set_state(ReviewCreation.rating)
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(
+                text=f"{booking['title']} ({booking['session_date']})",
+                callback_data=ReviewCallback(booking_id=booking["booking_id"]).pack()
+            )]
+            for booking in bookings
+        ])
+        await message.answer(REVIEW_CHOOSE_BOOKING, reply_markup=keyboard)
     except Exception as e:
-        logger.error(f"Ошибка в handle_leave_review: {e}")
+        logger.error("Ошибка в handle_leave_review: %s", e)
         await message.answer(ERROR_MESSAGE)
 
+@callbacks(ReviewCallback)
+async def process_review_booking(callback: types.CallbackQuery, callback_data: ReviewCallback, state: FSMContext):
+    """Запоминает выбранное бронирование и запрашивает рейтинг."""
+    try:
+        booking_id = callback_data.booking_id
+        # Проверяем, что бронирование принадлежит пользователю и отзыв на него ещё можно оставить
+        bookings = await get_reviewable_bookings(callback.from_user.id, datetime.now())
+        booking = next((b for b in bookings if b["booking_id"] == booking_id), None)
+        if booking is None:
+            await callback.answer(REVIEW_ALREADY_EXISTS, show_alert=True)
+            return
+        await state.update_data(
+            review_booking_id=booking_id,
+            review_excursion_id=booking["excursion_id"],
+            review_guide_id=booking["guide_id"]
+        )
+        await callback.message.answer("Укажи рейтинг (от 1 до 5):")
+        await state.set_state(ReviewCreation.rating)
+        await callback.answer()
+    except Exception as e:
+        logger.error("Ошибка в process_review_booking: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
 @router.message(ReviewCreation.rating)
 async def process_review_rating(message: types.Message, state: FSMContext):
     """Обрабатывает рейтинг отзыва."""
@@ -139,7 +321,7 @@ async def process_review_rating(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Пожалуйста, введи число от 1 до 5:")
     except Exception as e:
-        logger.error(f"Ошибка в process_review_rating: {e}")
+        logger.error("Ошибка в process_review_rating: %s", e)
         await message.answer(ERROR_MESSAGE)
 
 @router.message(ReviewCreation.comment)
@@ -147,29 +329,111 @@ async def process_review_comment(message: types.Message, state: FSMContext):
     """Обрабатывает комментарий отзыва и завершает процесс."""
     try:
         data = await state.get_data()
-        rating = data["rating"]
-        comment = message.text
-        bookings = await get_bookings_by_user(message.from_user.id)
-        # Берем первое бронирование для определения гида (можно улучшить выбор)
-        booking = bookings[0]
-        excursion = next((e for e in await get_excursions() if e["id"] == booking["excursion_id"]), None)
-        if excursion:
-            guide_id = excursion["guide_id"]
-            await add_review(message.from_user.id, guide_id, rating, comment)
-            await message.answer(REVIEW_SUCCESS, reply_markup=get_traveler_keyboard())
+        await add_review(
+            message.from_user.id,
+            data["review_booking_id"],
+            data["review_excursion_id"],
+            data["review_guide_id"],
+            data["rating"],
+            message.text
+        )
+        await state.clear()
+        await message.answer(REVIEW_SUCCESS, reply_markup=await get_traveler_keyboard(message.from_user.id))
+    except sqlite3.IntegrityError:
         await state.clear()
+        await message.answer(REVIEW_ALREADY_EXISTS, reply_markup=await get_traveler_keyboard(message.from_user.id))
+    except Exception as e:
+        logger.error("Ошибка в process_review_comment: %s", e)
+        await message.answer(ERROR_MESSAGE)
+
+def get_subscription_name(kind: str, subscription: Dict[str, Any]) -> str:
+    """Подпись цели подписки: имя гида, город или тема."""
+    if kind == SUBSCRIPTION_GUIDE and subscription.get("guide_first_name"):
+        return f"{subscription['guide_first_name']} {subscription['guide_last_name'] or ''}".strip()
+    if kind == SUBSCRIPTION_CITY and subscription.get("city_name"):
+        return subscription["city_name"]
+    return subscription["target"]
+
+async def render_subscriptions(user_id: int):
+    """Собирает список подписок с кнопками отписки; вид и цель подписки передаются в UnfollowCallback."""
+    subscriptions = await get_user_subscriptions(user_id)
+    if not subscriptions:
+        return SUBSCRIPTIONS_EMPTY, None
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"❌ {SUBSCRIPTION_LABELS[s['kind']]}: {get_subscription_name(s['kind'], s)}",
+            callback_data=UnfollowCallback.for_subscription(s["kind"], s["target"]).pack()
+        )]
+        for s in subscriptions
+    ])
+    return SUBSCRIPTIONS_HEADER, keyboard
+
+@callbacks(FollowCallback)
+async def process_follow(callback: types.CallbackQuery, callback_data: FollowCallback):
+    """Подписывает путешественника на гида, город или тему маршрута из карточки."""
+    try:
+        excursion = await get_excursion_card(callback_data.excursion_id)
+        if not excursion:
+            await callback.answer(INVALID_CALLBACK, show_alert=True)
+            return
+        kind = callback_data.kind
+        if kind == SUBSCRIPTION_GUIDE:
+            target = str(excursion["guide_id"])
+            name = f"{excursion['guide_first_name'] or ''} {excursion['guide_last_name'] or ''}".strip()
+        elif kind == SUBSCRIPTION_CITY:
+            if not excursion["city_id"]:
+                await callback.answer(INVALID_CALLBACK, show_alert=True)
+                return
+            target = str(excursion["city_id"])
+            name = excursion["city"]
+        else:
+            target = name = excursion["theme"]
+        await subscribe(callback.from_user.id, kind, target)
+        await callback.answer(FOLLOW_DONE.format(label=SUBSCRIPTION_LABELS[kind], name=name), show_alert=True)
     except Exception as e:
-        logger.error(f"Ошибка в process_review_comment: {e}")
+        logger.error("Ошибка в process_follow: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
+@buttons(SUBSCRIPTIONS_BUTTON)
+async def handle_subscriptions(message: types.Message):
+    """Показывает подписки путешественника."""
+    try:
+        text, keyboard = await render_subscriptions(message.from_user.id)
+        await message.answer(text, reply_markup=keyboard or await get_traveler_keyboard(message.from_user.id))
+    except Exception as e:
+        logger.error("Ошибка в handle_subscriptions: %s", e)
         await message.answer(ERROR_MESSAGE)
 
-@router.message(lambda message: message.text == "📩 Оставить заявку")
+@callbacks(UnfollowCallback)
+async def process_unfollow(callback: types.CallbackQuery, callback_data: UnfollowCallback):
+    """Отменяет подписку, выбранную в списке, и обновляет список."""
+    try:
+        kind, target = callback_data.kind, callback_data.target
+        if callback_data.hashed:
+            # Длинная цель передана хэшем: находим её среди подписок пользователя
+            target = next((
+                s["target"] for s in await get_user_subscriptions(callback.from_user.id)
+                if s["kind"] == kind and callback_data.matches(s["target"])
+            ), None)
+            if target is None:
+                await callback.answer(INVALID_CALLBACK, show_alert=True)
+                return
+        await unsubscribe(callback.from_user.id, kind, target)
+        text, keyboard = await render_subscriptions(callback.from_user.id)
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer(UNFOLLOW_DONE)
+    except Exception as e:
+        logger.error("Ошибка в process_unfollow: %s", e)
+        await callback.answer(ERROR_MESSAGE)
+
+@buttons("📩 Оставить заявку")
 async def handle_create_request(message: types.Message, state: FSMContext):
     """Начинает процесс создания заявки."""
     try:
         await message.answer("В каком городе ты хочешь найти маршрут?")
         await state.set_state(RequestCreation.city)
     except Exception as e:
-        logger.error(f"Ошибка в handle_create_request: {e}")
+        logger.error("Ошибка в handle_create_request: %s", e)
         await message.answer(ERROR_MESSAGE)
 
 @router.message(RequestCreation.city)
@@ -180,7 +444,7 @@ async def process_request_city(message: types.Message, state: FSMContext):
         await message.answer("Какие у тебя интересы? (например, история, природа, гастрономия):")
         await state.set_state(RequestCreation.keywords)
     except Exception as e:
-        logger.error(f"Ошибка в process_request_city: {e}")
+        logger.error("Ошибка в process_request_city: %s", e)
         await message.answer(ERROR_MESSAGE)
 
 @router.message(RequestCreation.keywords)
@@ -191,7 +455,7 @@ async def process_request_keywords(message: types.Message, state: FSMContext, bo
         city = data["city"]
         keywords = message.text
         await add_request(message.from_user.id, city, keywords)
-        await message.answer(REQUEST_SUCCESS, reply_markup=get_traveler_keyboard())
+        await message.answer(REQUEST_SUCCESS, reply_markup=await get_traveler_keyboard(message.from_user.id))
         # Уведомляем администратора о новой заявке
         request_text = (
             f"Новая заявка от путешественника:\n"
@@ -202,7 +466,7 @@ async def process_request_keywords(message: types.Message, state: FSMContext, bo
         await notify_new_request(bot, message.from_user.id, request_text)
         await state.clear()
     except Exception as e:
-        logger.error(f"Ошибка в process_request_keywords: {e}")
+        logger.error("Ошибка в process_request_keywords: %s", e)
         await message.answer(ERROR_MESSAGE)
 
 def register_traveler_handlers() -> Router:
@@ -1 +1,232 @@
+# yandex_API.py
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+import aiohttp
+import api_usage
+from config import get_config
 
+logger = logging.getLogger(__name__)
+
+# Средняя скорость пешехода для оценки времени в пути без API, км/ч
+WALKING_SPEED_KMH = 5.0
+
+class ServiceUnavailable(Exception):
+    """Внешний сервис недоступен: цепь разомкнута, истёк таймаут или пришла ошибка."""
+
+class CircuitBreaker:
+    """Размыкатель цепи для одного внешнего эндпоинта.
+
+    После failure_threshold ошибок подряд запросы не отправляются reset_timeout
+    секунд; затем пропускается один пробный запрос, и его успех замыкает цепь.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """Возвращает состояние цепи: closed, open или half_open."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Решает, можно ли отправить запрос прямо сейчас."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Замыкает цепь после успешного ответа."""
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """Освобождает пробный запрос, прерванный без ответа (например, отменой задачи)."""
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Учитывает ошибку и размыкает цепь при превышении порога."""
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Цепь %s разомкнута после %s ошибок", self.name, self.failures)
+            self.opened_at = time.monotonic()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_session: Optional[aiohttp.ClientSession] = None
+
+# Последние успешные ответы с моментом получения: свежие (моложе API_CACHE_SECONDS)
+# отдаются без запроса, устаревшие — при недоступности API или нехватке бюджета
+_last_weather: Dict[Tuple[float, float], Tuple[float, str]] = {}
+_last_travel: Dict[Tuple[float, float, float, float], Tuple[float, Tuple[int, str]]] = {}
+
+def _fresh(cached: Optional[Tuple[float, Any]]) -> bool:
+    """Проверяет, что закэшированный ответ ещё не устарел."""
+    return cached is not None and time.monotonic() - cached[0] < get_config().api_cache_seconds
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Возвращает размыкатель цепи для эндпоинта, создавая его при первом обращении."""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        config = get_config()
+        breaker = CircuitBreaker(endpoint, config.breaker_failure_threshold, config.breaker_reset_seconds)
+        _breakers[endpoint] = breaker
+    return breaker
+
+def _get_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию с ограничением времени на запрос."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=get_config().yandex_timeout_seconds)
+        )
+    return _session
+
+async def close_session() -> None:
+    """Закрывает общую HTTP-сессию; вызывается при остановке бота."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def _request_json(endpoint: str, url: str, params: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Выполняет GET-запрос через размыкатель цепи и возвращает JSON ответа.
+
+    Запрос должен быть заранее зарезервирован через api_usage.allow_call;
+    каждый отправленный запрос учитывается в расходе API, а неотправленный
+    (цепь разомкнута) возвращает резерв в бюджет.
+    """
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        api_usage.release_call(endpoint)
+        raise ServiceUnavailable(f"{endpoint}: цепь разомкнута")
+    started = time.perf_counter()
+    try:
+        async with _get_session().get(url, params=params, headers=headers) as response:
+            if response.status != 200:
+                raise ServiceUnavailable(f"{endpoint}: HTTP {response.status}")
+            data = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ServiceUnavailable, ValueError) as e:
+        api_usage.record_call(endpoint, (time.perf_counter() - started) * 1000, ok=False)
+        breaker.record_failure()
+        if isinstance(e, ServiceUnavailable):
+            raise
+        raise ServiceUnavailable(f"{endpoint}: {e!r}") from e
+    else:
+        api_usage.record_call(endpoint, (time.perf_counter() - started) * 1000, ok=True)
+        breaker.record_success()
+        return data
+    finally:
+        # Иначе пробный запрос, прерванный CancelledError, навсегда оставил бы цепь разомкнутой
+        breaker.release_probe()
+
+def haversine_km(start: Dict[str, float], end: Dict[str, float]) -> float:
+    """Возвращает расстояние между двумя точками по поверхности Земли в километрах."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (start["lat"], start["lon"], end["lat"], end["lon"]))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+def build_map_link(start: Dict[str, float], end: Dict[str, float], mode: str = "auto") -> str:
+    """Возвращает ссылку на маршрут в Яндекс Картах."""
+    return f"https://yandex.ru/maps/?rtext={start['lat']},{start['lon']}~{end['lat']},{end['lon']}&rtt={mode}"
+
+def estimate_travel_info(start: Dict[str, float], end: Dict[str, float]) -> Tuple[int, str]:
+    """Оценивает пешее время в пути по расстоянию без обращения к API."""
+    minutes = round(haversine_km(start, end) / WALKING_SPEED_KMH * 60)
+    return minutes, build_map_link(start, end, "pd")
+
+async def get_weather(lat: float, lon: float, date: datetime) -> str:
+    """Получает прогноз погоды через Яндекс Погода API."""
+    key = (round(lat, 2), round(lon, 2))
+    cached = _last_weather.get(key)
+    if _fresh(cached):
+        api_usage.record_cache_hit("weather")
+        return cached[1]
+    if not api_usage.allow_call("weather", has_substitute=cached is not None):
+        api_usage.record_fallback("weather")
+        return cached[1] if cached else "Неизвестно"
+    try:
+        params = {
+            "lat": lat,
+            "lon": lon,
+            "lang": "ru_RU",
+            "limit": 1,
+            "hours": "true",
+            "extra": "true"
+        }
+        headers = {"X-Yandex-API-Key": get_config().yandex_weather_api_key}
+        data = await _request_json("weather", get_config().yandex_weather_url, params, headers)
+        weather = f"{data['fact']['temp']}°C, {data['fact']['condition']}"
+        _last_weather[key] = (time.monotonic(), weather)
+        return weather
+    except (ServiceUnavailable, KeyError, TypeError) as e:
+        logger.error("Ошибка при получении погоды: %s", e)
+        api_usage.record_fallback("weather")
+        return cached[1] if cached else "Неизвестно"
+
+async def get_travel_info(start: Dict[str, float], end: Dict[str, float]) -> tuple[int, str]:
+    """Получает время в пути и ссылку на маршрут через Яндекс Карты API."""
+    key = (start["lat"], start["lon"], end["lat"], end["lon"])
+    cached = _last_travel.get(key)
+    if _fresh(cached):
+        api_usage.record_cache_hit("routing")
+        return cached[1]
+    # Пешая оценка по расстоянию доступна всегда, поэтому маршрутизация первой уступает резерв бюджета
+    if not api_usage.allow_call("routing", has_substitute=True):
+        api_usage.record_fallback("routing")
+        return cached[1] if cached else estimate_travel_info(start, end)
+    try:
+        params = {
+            "waypoints": f"{start['lat']},{start['lon']}|{end['lat']},{end['lon']}",
+            "mode": "walking",  # Можно добавить выбор: walking, driving
+            "apikey": get_config().yandex_maps_api_key
+        }
+        data = await _request_json("routing", get_config().yandex_routing_url, params)
+        duration = data["routes"][0]["duration"] // 60  # В минутах
+        travel_info = (duration, build_map_link(start, end))
+        _last_travel[key] = (time.monotonic(), travel_info)
+        return travel_info
+    except (ServiceUnavailable, KeyError, IndexError, TypeError) as e:
+        logger.error("Ошибка при получении маршрута: %s", e)
+        api_usage.record_fallback("routing")
+        return cached[1] if cached else estimate_travel_info(start, end)
+
+async def call_taxi(user_location: Dict[str, float], destination: Dict[str, float]) -> str:
+    """Вызывает такси через Яндекс Такси API."""
+    order_url = f"https://taxi.yandex.ru/order?cl=econom&from={user_location['lat']},{user_location['lon']}&to={destination['lat']},{destination['lon']}"
+    fallback = f"Не удалось узнать стоимость такси. Заказать можно по ссылке: {order_url}"
+    # Цена такси меняется от минуты к минуте, поэтому ответы не кэшируются
+    if not api_usage.allow_call("taxi", has_substitute=False):
+        api_usage.record_fallback("taxi")
+        return fallback
+    try:
+        params = {
+            "cl": "econom",
+            "rll": f"{user_location['lon']},{user_location['lat']}~{destination['lon']},{destination['lat']}",
+            "apikey": get_config().yandex_taxi_api_key
+        }
+        data = await _request_json("taxi", get_config().yandex_taxi_url, params)
+        price = data["options"][0]["price"]
+        return f"Такси заказано! Стоимость: {price} руб. Перейди для подтверждения: {order_url}"
+    except (ServiceUnavailable, KeyError, IndexError, TypeError) as e:
+        logger.error("Ошибка при вызове такси: %s", e)
+        api_usage.record_fallback("taxi")
+        return fallback